@@ -1,13 +1,21 @@
 # api/datafeed_routes.py
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse
 from typing import Dict, List, Any, Optional
 import logging
-from datetime import datetime, timezone
-import json
+import asyncio
+import math
+import orjson
+from contextlib import closing
+from datetime import date, datetime, timezone, timedelta
+import numpy as np
+import pandas as pd
 
 # Importar serviços necessários
 from services.historical_data_service import HistoricalDataService
+from services.database_service import DatabaseService
+from services.bar_stream_service import BarStreamHub, BarStreamClient
 
 logger = logging.getLogger(__name__)
 
@@ -17,11 +25,28 @@ router = APIRouter()
 # Initialize services
 historical_data_service = HistoricalDataService()
 
+# Resoluções do TradingView servidas a partir do cache de dados históricos (a menor resolução armazenada é 1h)
+RESOLUTION_TIMEFRAMES = {
+    "60": "1h",
+    "240": "4h",
+    "1D": "1d",
+    "1W": "1w"
+}
+RESOLUTION_SECONDS = {
+    "60": 3600,
+    "240": 14400,
+    "1D": 86400,
+    "1W": 604800
+}
+
+# Barras em tempo real: uma busca de preços compartilhada por todos os clientes do /stream
+bar_stream_hub = BarStreamHub(historical_data_service.symbol_to_coingecko_id)
+
 @router.get("/config")
 async def get_datafeed_config():
     """Configuração do datafeed para TradingView UDF."""
     config = {
-        "supported_resolutions": ["1", "5", "15", "30", "60", "240", "1D", "1W"],
+        "supported_resolutions": list(RESOLUTION_TIMEFRAMES),
         "supports_group_request": False,
         "supports_marks": False,
         "supports_search": True,
@@ -68,7 +93,7 @@ async def get_symbol_info(symbol: str = Query(..., description="Symbol to resolv
             "has_intraday": True,
             "has_no_volume": False,
             "has_weekly_and_monthly": True,
-            "supported_resolutions": ["1", "5", "15", "30", "60", "240", "1D", "1W"],
+            "supported_resolutions": list(RESOLUTION_TIMEFRAMES),
             "volume_precision": 8,
             "data_status": "streaming"
         }
@@ -80,160 +105,163 @@ async def get_symbol_info(symbol: str = Query(..., description="Symbol to resolv
         logger.error(f"Error resolving symbol {symbol}: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Cannot resolve symbol: {symbol}")
 
-@router.get("/history")
+@router.get("/history", response_class=ORJSONResponse)
 async def get_history(
     symbol: str = Query(..., description="Trading symbol"),
     resolution: str = Query(..., description="Resolution/timeframe"),
     from_timestamp: int = Query(..., alias="from", description="From timestamp"),
-    to_timestamp: int = Query(..., alias="to", description="To timestamp")
+    to_timestamp: int = Query(..., alias="to", description="To timestamp"),
+    countback: Optional[int] = Query(None, ge=1, description="Number of bars ending at 'to' (takes precedence over 'from')")
 ):
     """Get historical data for TradingView UDF format."""
     try:
-        # Converter timestamps para datetime
-        from_date = datetime.fromtimestamp(from_timestamp, tz=timezone.utc)
-        to_date = datetime.fromtimestamp(to_timestamp, tz=timezone.utc)
-        
         # Normalizar símbolo
         clean_symbol = symbol.replace("BINANCE:", "").replace("COINBASE:", "")
         
-        # Mapear resolução para timeframe
-        timeframe_map = {
-            "1": "1m",
-            "5": "5m", 
-            "15": "15m",
-            "30": "30m",
-            "60": "1h",
-            "240": "4h",
-            "1D": "1d",
-            "1W": "1w"
-        }
+        timeframe = RESOLUTION_TIMEFRAMES.get(resolution)
+        if timeframe is None:
+            return ORJSONResponse({"s": "error", "errmsg": f"Unsupported resolution: {resolution}"})
         
-        timeframe = timeframe_map.get(resolution, "1d")
+        # Com countback, o período carregado recua o suficiente para cobrir countback barras (com folga para lacunas)
+        load_from = from_timestamp
+        if countback:
+            load_from = min(from_timestamp, to_timestamp - int(countback * RESOLUTION_SECONDS[resolution] * 1.5))
         
+        from_date = datetime.fromtimestamp(load_from, tz=timezone.utc)
+        to_date = datetime.fromtimestamp(to_timestamp, tz=timezone.utc)
         logger.info(f"Fetching history for {clean_symbol} from {from_date} to {to_date} with resolution {resolution} ({timeframe})")
         
-        # Buscar dados históricos através do serviço
-        # Primeiro, tentar buscar asset_id pelo símbolo
-        try:
-            # Simular busca de dados - você pode integrar com seu HistoricalDataService aqui
-            historical_data = historical_data_service.get_asset_historical_data(
-                asset_symbol=clean_symbol,
-                timeframe=timeframe,
-                start_date=from_date.date(),
-                end_date=to_date.date()
-            )
-            
-            if not historical_data or len(historical_data) == 0:
-                # Retornar "no_data" se não houver dados
-                return {
-                    "s": "no_data",
-                    "nextTime": to_timestamp
-                }
-            
-            # Converter para formato UDF
-            timestamps = []
-            opens = []
-            highs = []
-            lows = []
-            closes = []
-            volumes = []
-            
-            for bar in historical_data:
-                # Assumindo que os dados vêm como dict com keys: timestamp, open, high, low, close, volume
-                timestamps.append(int(bar.get('timestamp', bar.get('time', from_timestamp))))
-                opens.append(float(bar.get('open', 0)))
-                highs.append(float(bar.get('high', 0)))
-                lows.append(float(bar.get('low', 0)))
-                closes.append(float(bar.get('close', 0)))
-                volumes.append(float(bar.get('volume', 0)))
-            
-            return {
-                "s": "ok",
-                "t": timestamps,
-                "o": opens,
-                "h": highs,
-                "l": lows,
-                "c": closes,
-                "v": volumes
-            }
-            
-        except Exception as data_error:
-            logger.warning(f"No historical data found for {clean_symbol}: {str(data_error)}")
-            # Gerar dados sintéticos para demonstração
-            return _generate_synthetic_data(from_timestamp, to_timestamp, resolution)
+        # Banco e possível busca no CoinGecko (com espera de rate limit) fora do event loop,
+        # para não travar os streams do /stream enquanto um gráfico carrega
+        historical_data = await asyncio.to_thread(
+            _load_historical_data, clean_symbol, timeframe, from_date.date(), to_date.date()
+        )
+        
+        if historical_data is None or historical_data.empty:
+            return ORJSONResponse({"s": "no_data"})
+        
+        return ORJSONResponse(_build_udf_bars(historical_data, load_from, to_timestamp, countback))
             
     except Exception as e:
         logger.error(f"Error fetching history for {symbol}: {str(e)}")
-        return {
+        return ORJSONResponse({
             "s": "error", 
             "errmsg": f"Error fetching data: {str(e)}"
-        }
+        })
 
-def _generate_synthetic_data(from_timestamp: int, to_timestamp: int, resolution: str) -> dict:
-    """Gera dados sintéticos para demonstração."""
-    import random
-    import math
+def _build_udf_bars(df: pd.DataFrame, from_timestamp: int, to_timestamp: int, countback: Optional[int]) -> dict:
+    """
+    Monta a resposta UDF (arrays t/o/h/l/c/v) direto das colunas, sem iterar as barras.
+    Barras no intervalo [from, to); com countback, apenas as últimas countback barras antes de to.
+    """
+    # Índice em horário UTC (sem fuso, como gravado no cache; ou com fuso, já convertido pelo asi8):
+    # segundos desde a época, nas mesmas fronteiras de barra usadas pelo streaming
+    times = df.index.asi8 // 1_000_000_000
+    mask = times < to_timestamp
+    if not countback:
+        mask &= times >= from_timestamp
     
-    # Calcular intervalo baseado na resolução
-    interval_seconds = {
-        "1": 60,
-        "5": 300,
-        "15": 900, 
-        "30": 1800,
-        "60": 3600,
-        "240": 14400,
-        "1D": 86400,
-        "1W": 604800
-    }.get(resolution, 86400)
+    selected = np.flatnonzero(mask)
+    if countback:
+        selected = selected[-countback:]
+    if len(selected) == 0:
+        return {"s": "no_data"}
     
-    timestamps = []
-    opens = []
-    highs = []
-    lows = []
-    closes = []
-    volumes = []
+    return {
+        "s": "ok",
+        "t": times[selected].tolist(),
+        "o": df['open'].to_numpy(dtype=float)[selected].tolist(),
+        "h": df['high'].to_numpy(dtype=float)[selected].tolist(),
+        "l": df['low'].to_numpy(dtype=float)[selected].tolist(),
+        "c": df['close'].to_numpy(dtype=float)[selected].tolist(),
+        "v": df['volume'].to_numpy(dtype=float)[selected].tolist()
+    }
+
+@router.websocket("/stream")
+async def stream_bars(websocket: WebSocket):
+    """
+    Barras em tempo real para o subscribeBars do TradingView.
+    Mensagens do cliente: {"action": "subscribe" | "unsubscribe", "symbol": ..., "resolution": ...}.
+    O servidor envia {"symbol", "resolution", "bar": {time, open, high, low, close, volume}} a cada atualização.
+    """
+    await websocket.accept()
+    client = bar_stream_hub.connect()
+    sender = asyncio.create_task(_forward_bars(websocket, client))
     
-    current_time = from_timestamp
-    base_price = 50000.0  # Preço base para BTC
+    try:
+        while True:
+            message = await websocket.receive_json()
+            action = message.get("action")
+            symbol = str(message.get("symbol", "")).replace("BINANCE:", "").replace("COINBASE:", "")
+            resolution = message.get("resolution")
+            
+            if resolution not in RESOLUTION_TIMEFRAMES:
+                client.push(orjson.dumps({"error": f"Unsupported resolution: {resolution}"}).decode())
+                continue
+            
+            if action == "subscribe":
+                try:
+                    await bar_stream_hub.subscribe(
+                        client, symbol, resolution, RESOLUTION_SECONDS[resolution],
+                        last_bar_loader=lambda: _load_last_bar(symbol, resolution)
+                    )
+                except ValueError as ve:
+                    client.push(orjson.dumps({"error": str(ve)}).decode())
+                except Exception as e:
+                    # Falha ao carregar o histórico (banco, limite do CoinGecko): a conexão continua aberta
+                    logger.error(f"Error subscribing {symbol} {resolution}: {str(e)}")
+                    client.push(orjson.dumps({"error": f"Subscription failed for {symbol}: {str(e)}"}).decode())
+            elif action == "unsubscribe":
+                bar_stream_hub.unsubscribe(client, symbol, resolution)
+                
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error in bar stream: {str(e)}")
+    finally:
+        sender.cancel()
+        bar_stream_hub.disconnect(client)
+
+async def _forward_bars(websocket: WebSocket, client: BarStreamClient) -> None:
+    """Envia ao cliente as mensagens da sua fila (única tarefa que escreve no WebSocket)."""
+    while True:
+        message = await client.queue.get()
+        await websocket.send_text(message)
+
+def _load_historical_data(symbol: str, timeframe: str, start_date: date, end_date: date) -> Optional[pd.DataFrame]:
+    """
+    Histórico lido fora do event loop (asyncio.to_thread): a thread usa uma conexão própria,
+    pois a conexão compartilhada do DatabaseService não é thread-safe.
+    """
+    with closing(DatabaseService.dedicated()) as thread_db:
+        return HistoricalDataService(thread_db).get_historical_data(
+            asset_symbol=symbol,
+            timeframe=timeframe,
+            start_date=start_date,
+            end_date=end_date
+        )
+
+def _load_last_bar(symbol: str, resolution: str) -> Optional[dict]:
+    """Última barra do histórico, para o streaming continuar a barra em andamento."""
+    bar_seconds = RESOLUTION_SECONDS[resolution]
+    # Período com pelo menos 12 barras (o serviço exige um mínimo de pontos)
+    lookback_days = max(2, math.ceil(12 * bar_seconds / 86400))
+    today = datetime.now(timezone.utc).date()
     
-    while current_time <= to_timestamp:
-        # Gerar dados de vela sintéticos
-        price_change = random.uniform(-0.02, 0.02)  # Variação de -2% a +2%
-        open_price = base_price * (1 + price_change)
-        
-        high_change = random.uniform(0, 0.01)  # High até 1% acima
-        low_change = random.uniform(-0.01, 0)  # Low até 1% abaixo
-        close_change = random.uniform(-0.01, 0.01)  # Close variação
-        
-        high_price = open_price * (1 + high_change)
-        low_price = open_price * (1 + low_change)
-        close_price = open_price * (1 + close_change)
-        
-        # Garantir OHLC lógico
-        high_price = max(high_price, open_price, close_price)
-        low_price = min(low_price, open_price, close_price)
-        
-        volume = random.uniform(10.0, 1000.0)
-        
-        timestamps.append(current_time)
-        opens.append(round(open_price, 2))
-        highs.append(round(high_price, 2))
-        lows.append(round(low_price, 2))
-        closes.append(round(close_price, 2))
-        volumes.append(round(volume, 8))
-        
-        # Atualizar para próxima vela
-        base_price = close_price
-        current_time += interval_seconds
+    df = _load_historical_data(symbol, RESOLUTION_TIMEFRAMES[resolution], today - timedelta(days=lookback_days), today)
+    if df is None or df.empty:
+        return None
     
+    bars = _build_udf_bars(df, 0, int(datetime.now(timezone.utc).timestamp()) + bar_seconds, countback=1)
+    if bars["s"] != "ok":
+        return None
     return {
-        "s": "ok",
-        "t": timestamps,
-        "o": opens,
-        "h": highs,
-        "l": lows,
-        "c": closes,
-        "v": volumes
+        "time": bars["t"][0],
+        "open": bars["o"][0],
+        "high": bars["h"][0],
+        "low": bars["l"][0],
+        "close": bars["c"][0],
+        "volume": bars["v"][0]
     }
 
 @router.get("/search")
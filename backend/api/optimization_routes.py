@@ -3,11 +3,13 @@
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from pydantic import BaseModel, Field
 from typing import Dict, List, Any, Optional
+import asyncio
 import logging
-import threading
+from contextlib import closing
 
 from services.optimization_service import OptimizationService
 from services.historical_data_service import HistoricalDataService
+from services.backtesting_service import BacktestingService
 from services.auth_service import get_current_user
 from services.database_service import DatabaseService
 
@@ -25,6 +27,10 @@ class OptimizationJobRequest(BaseModel):
     parameter_ranges: Dict[str, Any] = Field(..., example={
         "rsi_period": {"type": "int", "min": 10, "max": 20}
     })
+    search_config: Optional[Dict[str, Any]] = Field(None, example={
+        "method": "genetic", "population_size": 30, "generations": 20, "patience": 5,
+        "walk_forward_folds": 4, "walk_forward_test_fraction": 0.25
+    })
 
 class OptimizationJobResponse(BaseModel):
     id: int
@@ -37,6 +43,7 @@ class OptimizationJobResponse(BaseModel):
     start_date: date
     end_date: date
     parameter_ranges: Dict[str, Any]
+    search_config: Optional[Dict[str, Any]] = None
     status: str
     progress: Optional[float] = 0.0
     created_at: datetime
@@ -56,6 +63,15 @@ class OptimizationResult(BaseModel):
     max_drawdown_percent: float
     sharpe_ratio: float
     fitness_score: float
+    fidelity: float = 1.0
+    # Walk-forward: fold do resumo e métricas no período de teste (fora da amostra)
+    fold: Optional[int] = None
+    oos_total_trades: Optional[int] = None
+    oos_win_rate_percent: Optional[float] = None
+    oos_net_profit_percent: Optional[float] = None
+    oos_max_drawdown_percent: Optional[float] = None
+    oos_sharpe_ratio: Optional[float] = None
+    oos_fitness_score: Optional[float] = None
 
 class OptimizationResultsResponse(BaseModel):
     results: List[OptimizationResult]
@@ -64,6 +80,26 @@ class OptimizationResultsResponse(BaseModel):
 class BestParametersResponse(BaseModel):
     parameters: Dict[str, Any]
     performance_metrics: Dict[str, Any]
+    fold: Optional[int] = None
+    out_of_sample_metrics: Optional[Dict[str, Any]] = None
+
+class PortfolioBacktestRequest(BaseModel):
+    base_strategy_name: str = Field(..., example="MOVING_AVERAGE_CROSSOVER")
+    asset_symbols: Optional[List[str]] = Field(None, example=["BTCUSDT", "ETHUSDT", "SOLUSDT"])
+    timeframe: str = Field(..., example="1d")
+    start_date: date = Field(..., example="2024-01-01")
+    end_date: date = Field(..., example="2024-12-31")
+    parameters: Dict[str, Any] = Field(..., example={"ma_short": 10, "ma_long": 50, "ma_type": "EMA"})
+    weights: Optional[Dict[str, float]] = None
+    include_equity_curves: bool = False
+
+class PortfolioBacktestResponse(BaseModel):
+    assets: Dict[str, Dict[str, Any]]
+    portfolio: Dict[str, Any]
+    start: Optional[str] = None
+    end: Optional[str] = None
+    periods: Optional[int] = None
+    equity_curves: Optional[Dict[str, Any]] = None
 
 class HistoricalDataStatsResponse(BaseModel):
     general: Dict[str, Any]
@@ -80,7 +116,7 @@ historical_data_service = HistoricalDataService()
     "/jobs",
     response_model=OptimizationJobResponse,
     summary="Criar Job de Otimização",
-    description="Cria um novo job de otimização de estratégia usando algoritmo genético."
+    description="Cria um novo job de otimização de estratégia (algoritmo genético, grid ou random search conforme search_config)."
 )
 async def create_optimization_job(
     request: OptimizationJobRequest,
@@ -98,24 +134,13 @@ async def create_optimization_job(
             'timeframe': request.timeframe,
             'start_date': request.start_date,
             'end_date': request.end_date,
-            'parameter_ranges': request.parameter_ranges
+            'parameter_ranges': request.parameter_ranges,
+            'search_config': request.search_config
         }
         
+        # O job é criado como PENDING e fica na fila até ser reivindicado pelo optimizer_worker.py
         job = optimization_service.create_optimization_job(user_id, job_data)
         
-        # Iniciar otimização em background usando thread (mais confiável que BackgroundTasks)
-        def run_optimization():
-            try:
-                optimization_service.run_genetic_optimization(job['id'])
-            except Exception as e:
-                logger.error(f"Error in background optimization: {str(e)}")
-                # Marcar job como FAILED
-                optimization_service.update_job_status(job['id'], 'FAILED')
-        
-        optimization_thread = threading.Thread(target=run_optimization)
-        optimization_thread.daemon = True
-        optimization_thread.start()
-        
         return OptimizationJobResponse(**job)
         
     except ValueError as ve:
@@ -203,10 +228,10 @@ async def get_job_status(job_id: int, current_user: dict = Depends(get_current_u
 @router.post(
     "/jobs/{job_id}/run",
     summary="Executar Otimização",
-    description="Inicia a execução de um job de otimização."
+    description="Coloca um job de otimização na fila de execução (reenfileira jobs FAILED)."
 )
 async def run_optimization_job(job_id: int, current_user: dict = Depends(get_current_user)):
-    """Executa um job de otimização."""
+    """Enfileira um job de otimização para o optimizer_worker."""
     try:
         database_service = DatabaseService()
         user_id = database_service.get_user_id_by_username(current_user['username'])
@@ -215,25 +240,17 @@ async def run_optimization_job(job_id: int, current_user: dict = Depends(get_cur
         if not job:
             raise HTTPException(status_code=404, detail=f"Job {job_id} não encontrado")
         
-        if job['status'] != 'PENDING':
+        if job['status'] not in ('PENDING', 'FAILED'):
             raise HTTPException(
                 status_code=400, 
                 detail=f"Job está em status {job['status']} e não pode ser executado"
             )
         
-        # Executar em background thread
-        def run_optimization():
-            try:
-                optimization_service.run_genetic_optimization(job_id)
-            except Exception as e:
-                logger.error(f"Error in background optimization: {str(e)}")
-                optimization_service.update_job_status(job_id, 'FAILED')
+        # Jobs FAILED voltam para a fila e são retomados a partir do último checkpoint
+        if job['status'] == 'FAILED':
+            optimization_service.enqueue_job(job_id)
         
-        optimization_thread = threading.Thread(target=run_optimization)
-        optimization_thread.daemon = True
-        optimization_thread.start()
-        
-        return {"message": f"Otimização do job {job_id} iniciada", "status": "RUNNING"}
+        return {"message": f"Otimização do job {job_id} enfileirada", "status": "PENDING"}
         
     except HTTPException:
         raise
@@ -303,6 +320,88 @@ async def get_best_parameters(job_id: int, current_user: dict = Depends(get_curr
         logger.error(f"Error fetching best parameters {job_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar melhores parâmetros: {str(e)}")
 
+@router.get(
+    "/results/{result_id}/robustness",
+    summary="Análise de Robustez (Monte Carlo)",
+    description="Reamostra os retornos de um resultado de otimização (block bootstrap, embaralhamento e bootstrap de trades) e retorna intervalos de confiança de lucro, drawdown e Sharpe."
+)
+async def get_result_robustness(
+    result_id: int,
+    n_simulations: int = 2000,
+    block_size: Optional[int] = None,
+    confidence: float = 0.95,
+    seed: Optional[int] = None,
+    window: str = 'train',
+    current_user: dict = Depends(get_current_user)
+):
+    """Executa a análise Monte Carlo de um resultado de otimização (window: janela do fold walk-forward)."""
+    try:
+        if not 1 <= n_simulations <= 20000:
+            raise HTTPException(status_code=400, detail="n_simulations deve estar entre 1 e 20000")
+        
+        database_service = DatabaseService()
+        user_id = database_service.get_user_id_by_username(current_user['username'])
+        
+        def analyze():
+            # A thread usa uma conexão própria: a compartilhada continua atendendo as demais requisições
+            with closing(DatabaseService.dedicated()) as thread_db:
+                return optimization_service.run_robustness_analysis(
+                    result_id, user_id, n_simulations=n_simulations, block_size=block_size,
+                    confidence=confidence, seed=seed, window=window, db_service=thread_db
+                )
+        
+        # Backtest e simulações são CPU-bound: rodam fora do event loop
+        return await asyncio.to_thread(analyze)
+        
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=404 if "not found" in str(ve) else 400, detail=str(ve))
+    except Exception as e:
+        logger.error(f"Error running robustness analysis for result {result_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro na análise de robustez: {str(e)}")
+
+@router.post(
+    "/portfolio-backtest",
+    response_model=PortfolioBacktestResponse,
+    summary="Backtest de Portfólio",
+    description="Executa uma estratégia em vários ativos de uma vez (padrão: todos os pares rastreados) e retorna métricas por ativo e combinadas."
+)
+async def run_portfolio_backtest(
+    request: PortfolioBacktestRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Executa um backtest multi-ativo."""
+    try:
+        asset_symbols = request.asset_symbols or list(historical_data_service.symbol_to_coingecko_id.keys())
+        
+        def run():
+            # Simulação CPU-bound e possível busca no CoinGecko: fora do event loop, com conexão própria
+            with closing(DatabaseService.dedicated()) as thread_db:
+                return BacktestingService(HistoricalDataService(thread_db)).run_portfolio_backtest(
+                    asset_symbols=asset_symbols,
+                    timeframe=request.timeframe,
+                    start_date=request.start_date,
+                    end_date=request.end_date,
+                    base_strategy_name=request.base_strategy_name,
+                    parameters=request.parameters,
+                    weights=request.weights,
+                    include_equity_curves=request.include_equity_curves
+                )
+        
+        result = await asyncio.to_thread(run)
+        
+        if result.get('error'):
+            raise HTTPException(status_code=400, detail=result['error'])
+        
+        return PortfolioBacktestResponse(**result)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error running portfolio backtest: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro no backtest de portfólio: {str(e)}")
+
 # Endpoint adicional para stats dos dados históricos
 @router.get(
     "/historical-data/stats",
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Backfill de Dados Históricos
+Carrega o cache de preços (historical_price_data) para vários ativos de uma vez, com buscas
+concorrentes dentro do limite de chamadas do CoinGecko. Janelas já carregadas são puladas,
+então a mesma linha de comando pode ser agendada toda noite ou reexecutada após uma falha.
+
+Uso:
+    python backfill_historical.py --start 2023-01-01
+    python backfill_historical.py --symbols BTCUSDT ETHUSDT --timeframes 1h 1d --start 2024-01-01 --end 2024-06-30
+"""
+
+import sys
+import os
+import json
+import logging
+import argparse
+from datetime import date, datetime
+
+# Adicionar o diretório backend ao Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.historical_data_service import HistoricalDataService
+from services.historical_backfill_service import (
+    HistoricalBackfillService, BACKFILL_CONCURRENCY, COINGECKO_CALLS_PER_MINUTE
+)
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('/tmp/backfill_historical.log'),
+        logging.StreamHandler()
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main():
+    """
+    Função principal do backfill
+    """
+    parser = argparse.ArgumentParser(description="Backfill concorrente do cache de dados históricos")
+    parser.add_argument('--symbols', nargs='+', help="Ativos (padrão: todos os mapeados no CoinGecko)")
+    parser.add_argument('--timeframes', nargs='+', default=['1h', '1d'])
+    parser.add_argument('--start', type=parse_date, required=True, help="Data inicial (YYYY-MM-DD)")
+    parser.add_argument('--end', type=parse_date, default=date.today(), help="Data final (padrão: hoje)")
+    parser.add_argument('--concurrency', type=int, default=BACKFILL_CONCURRENCY)
+    parser.add_argument('--calls-per-minute', type=float, default=COINGECKO_CALLS_PER_MINUTE)
+    parser.add_argument('--batch-size', type=int, help="Linhas por transação do bulk_load")
+    parser.add_argument('--method', choices=['insert', 'load_data'], help="Método do bulk_load")
+    parser.add_argument('--force', action='store_true', help="Recarrega janelas já cobertas")
+    args = parser.parse_args()
+
+    try:
+        data_service = HistoricalDataService()
+        service = HistoricalBackfillService(data_service, args.concurrency, args.calls_per_minute)
+        symbols = args.symbols or list(data_service.symbol_to_coingecko_id)
+
+        summary = service.run(symbols, args.timeframes, args.start, args.end,
+                              force=args.force, batch_size=args.batch_size, method=args.method)
+
+        print(json.dumps(summary, indent=2, default=str))
+        return 1 if summary['failed'] else 0
+    except Exception as e:
+        logger.error(f"Erro crítico no backfill: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    exit_code = main()
+    sys.exit(exit_code)
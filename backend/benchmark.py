@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Benchmark de Backtests e Otimização
+Mede o tempo de cálculo de indicadores, backtests individuais, avaliação de lotes e jobs completos
+do algoritmo genético sobre séries sintéticas reprodutíveis (sem CoinGecko e sem MySQL).
+Gera um relatório JSON e, opcionalmente, compara com um relatório anterior para detectar regressões.
+
+Uso:
+    python benchmark.py --lengths 500 2000 8760 --output benchmark_report.json
+    python benchmark.py --baseline benchmark_report.json --threshold 1.2
+"""
+
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import functools
+import multiprocessing
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+# Adicionar o diretório backend ao Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from services.synthetic_data_service import InMemoryHistoricalDataService
+from services.backtesting_service import BacktestingService
+from services.optimization_service import OptimizationService, _init_worker_services
+
+SERIES_START = datetime(2020, 1, 1)
+TIMEFRAME = '1h'
+ASSET_SYMBOL = 'BTCUSDT'
+
+# Parâmetros padrão e ranges de cada estratégia usados nas medições
+STRATEGIES = {
+    'RSI_MACD': ({'rsi_period': 14, 'macd_fast': 12, 'macd_slow': 26, 'macd_signal': 9},
+                 {'rsi_period': {'type': 'int', 'min': 7, 'max': 21},
+                  'macd_fast': {'type': 'int', 'min': 8, 'max': 16},
+                  'macd_slow': {'type': 'int', 'min': 20, 'max': 34}}),
+    'BOLLINGER_RSI': ({'bb_period': 20, 'bb_std': 2.0, 'rsi_period': 14},
+                      {'bb_period': {'type': 'int', 'min': 10, 'max': 30},
+                       'bb_std': {'type': 'float', 'min': 1.5, 'max': 3.0}}),
+    'MOVING_AVERAGE_CROSSOVER': ({'ma_short': 10, 'ma_long': 50, 'ma_type': 'EMA'},
+                                 {'ma_short': {'type': 'int', 'min': 5, 'max': 20},
+                                  'ma_long': {'type': 'int', 'min': 30, 'max': 100},
+                                  'ma_type': {'type': 'choice', 'values': ['SMA', 'EMA']}}),
+    'MOMENTUM_BREAKOUT': ({'lookback_period': 20, 'breakout_threshold': 0.02, 'volume_multiplier': 1.5},
+                          {'lookback_period': {'type': 'int', 'min': 10, 'max': 40},
+                           'breakout_threshold': {'type': 'float', 'min': 0.005, 'max': 0.05}}),
+    'MEAN_REVERSION': ({'lookback_period': 20, 'z_score_entry': 2.0, 'z_score_exit': 0.5},
+                       {'lookback_period': {'type': 'int', 'min': 10, 'max': 40},
+                        'z_score_entry': {'type': 'float', 'min': 1.0, 'max': 3.0}}),
+}
+BATCH_STRATEGY = 'MOVING_AVERAGE_CROSSOVER'
+
+
+class BenchmarkOptimizationService(OptimizationService):
+    """
+    OptimizationService sem banco de dados: resultados são apenas contados.
+    """
+
+    def __init__(self, max_workers: int, data_service_factory):
+        self.db_service = None
+        self.max_workers = max_workers
+        self.data_service_factory = data_service_factory
+        self._executor = None
+        self.saved_results = 0
+
+    def _flush_results(self, job_id, results, progress=None, checkpoint=None) -> None:
+        self.saved_results += len(results)
+
+
+def measure(function: Callable, repeats: int) -> Dict[str, float]:
+    """
+    Executa a função repeats vezes e retorna os tempos (em segundos)
+    """
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return {
+        'min_seconds': round(min(timings), 6),
+        'median_seconds': round(statistics.median(timings), 6),
+        'repeats': repeats
+    }
+
+
+def build_job(service: OptimizationService, length: int, strategy: str, parameter_ranges: dict, config: dict) -> dict:
+    """
+    Monta um job em memória cobrindo os primeiros length candles da série
+    """
+    end = SERIES_START + timedelta(hours=length - 1)
+    return {
+        'id': 0,
+        'asset_symbol': ASSET_SYMBOL,
+        'timeframe': TIMEFRAME,
+        'start_date': SERIES_START.date(),
+        'end_date': end.date(),
+        'base_strategy_name': strategy,
+        'parameter_ranges': parameter_ranges,
+        'search_config': service.normalize_search_config(config)
+    }
+
+
+def run_benchmarks(lengths: List[int], repeats: int, batch_size: int, workers: int,
+                   ga_population: int, ga_generations: int, seed: int, model: str) -> List[dict]:
+    """
+    Executa todas as medições e retorna a lista de resultados
+    """
+    results = []
+    factory = functools.partial(InMemoryHistoricalDataService, seed=seed, periods=max(lengths), model=model)
+    data_service = factory()
+    backtesting_service = BacktestingService(data_service)
+    # Avaliações no processo atual (fallback sequencial) também usam a fonte sintética
+    _init_worker_services(factory)
+
+    for length in lengths:
+        job_end = (SERIES_START + timedelta(hours=length - 1)).date()
+        df = data_service.get_historical_data(ASSET_SYMBOL, TIMEFRAME, SERIES_START.date(), job_end)
+        print(f"Série com {len(df)} candles")
+
+        for strategy, (parameters, _) in STRATEGIES.items():
+            timing = measure(lambda: backtesting_service._apply_indicators(df.copy(), strategy, parameters), repeats)
+            results.append({'benchmark': 'indicators', 'strategy': strategy, 'length': len(df), **timing})
+
+            timing = measure(lambda: backtesting_service.run_backtest(
+                ASSET_SYMBOL, TIMEFRAME, SERIES_START.date(), job_end, strategy, parameters
+            ), repeats)
+            results.append({'benchmark': 'single_backtest', 'strategy': strategy, 'length': len(df), **timing})
+
+        # Avaliação de um lote de candidatos: sequencial e no pool de processos
+        _, parameter_ranges = STRATEGIES[BATCH_STRATEGY]
+        service = BenchmarkOptimizationService(workers, factory)
+        job = build_job(service, length, BATCH_STRATEGY, parameter_ranges, {'seed': seed})
+        rng = random.Random(seed)
+
+        def sample_batch():
+            # Lote novo a cada repetição, para não medir o cache de séries preparadas
+            population = [service._sample_individual(parameter_ranges, rng) for _ in range(batch_size)]
+            return [service._build_evaluation_task(individual, job) for individual in population], population
+
+        timing = measure(lambda: service._evaluate_population_sequential(*sample_batch()), repeats)
+        results.append({'benchmark': 'batch_sequential', 'strategy': BATCH_STRATEGY, 'length': len(df),
+                        'batch_size': batch_size, **timing})
+
+        try:
+            service._evaluate_population_parallel(*sample_batch())  # aquecimento do pool
+            timing = measure(lambda: service._evaluate_population_parallel(*sample_batch()), repeats)
+            results.append({'benchmark': 'batch_parallel', 'strategy': BATCH_STRATEGY, 'length': len(df),
+                            'batch_size': batch_size, 'workers': workers, **timing})
+        finally:
+            service._shutdown_executor()
+
+        # Job completo do algoritmo genético (pool criado e encerrado dentro da medição)
+        config = {'population_size': ga_population, 'generations': ga_generations, 'seed': seed}
+        ga_job = build_job(service, length, BATCH_STRATEGY, parameter_ranges, config)
+
+        def run_ga_job():
+            ga_service = BenchmarkOptimizationService(workers, factory)
+            random.seed(seed)
+            try:
+                ga_service._run_genetic_search(ga_job, [ga_job], parameter_ranges, ga_job['search_config'], None)
+            finally:
+                ga_service._shutdown_executor()
+
+        timing = measure(run_ga_job, repeats)
+        results.append({'benchmark': 'genetic_job', 'strategy': BATCH_STRATEGY, 'length': len(df),
+                        'population_size': ga_population, 'generations': ga_generations, 'workers': workers, **timing})
+
+    return results
+
+
+def compare_with_baseline(results: List[dict], baseline_path: str, threshold: float) -> List[dict]:
+    """
+    Compara as medianas com um relatório anterior e retorna as medições mais lentas que threshold x
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    def key(result):
+        return (result['benchmark'], result['strategy'], result['length'])
+
+    previous = {key(result): result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        reference = previous.get(key(result))
+        if reference and reference['median_seconds'] > 0:
+            ratio = result['median_seconds'] / reference['median_seconds']
+            if ratio > threshold:
+                regressions.append({
+                    'benchmark': result['benchmark'], 'strategy': result['strategy'], 'length': result['length'],
+                    'baseline_seconds': reference['median_seconds'], 'current_seconds': result['median_seconds'],
+                    'ratio': round(ratio, 3)
+                })
+    return regressions
+
+
+def main():
+    """
+    Função principal do benchmark
+    """
+    parser = argparse.ArgumentParser(description="Benchmark de backtests e otimização com dados sintéticos")
+    parser.add_argument('--lengths', type=int, nargs='+', default=[500, 2000, 8760], help="Tamanhos das séries (candles de 1h)")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=max(1, multiprocessing.cpu_count() // 2))
+    parser.add_argument('--ga-population', type=int, default=16)
+    parser.add_argument('--ga-generations', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--model', choices=['gbm', 'regime'], default='regime')
+    parser.add_argument('--output', default='benchmark_report.json')
+    parser.add_argument('--baseline', help="Relatório anterior para comparação")
+    parser.add_argument('--threshold', type=float, default=1.2, help="Razão de tempo considerada regressão")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.lengths, args.repeats, args.batch_size, args.workers,
+                             args.ga_population, args.ga_generations, args.seed, args.model)
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': multiprocessing.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__
+        },
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'threshold')},
+        'results': results
+    }
+
+    exit_code = 0
+    if args.baseline:
+        report['regressions'] = compare_with_baseline(results, args.baseline, args.threshold)
+        for regression in report['regressions']:
+            print(f"REGRESSÃO {regression['benchmark']} {regression['strategy']} {regression['length']}: "
+                  f"{regression['baseline_seconds']}s -> {regression['current_seconds']}s (x{regression['ratio']})")
+        exit_code = 1 if report['regressions'] else 0
+
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    for result in results:
+        print(f"{result['benchmark']:<18} {result['strategy']:<26} {result['length']:>7} {result['median_seconds']:.4f}s")
+    print(f"Relatório salvo em {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,27 @@
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
+from eth_abi import decode as abi_decode
 from web3 import Web3
 import os
 from dotenv import load_dotenv
 from services.database_service import DatabaseService
 from services.blockchain_service import BlockchainService
+from services.multicall_service import MulticallService
+from services.nonce_manager import NonceManager
+from services.block_scheduler import BlockWatcher, RegistryCache
 
 load_dotenv()
 
+# Execuções de estratégia enviadas em paralelo por ciclo
+KEEPER_SUBMIT_CONCURRENCY = int(os.getenv("KEEPER_SUBMIT_CONCURRENCY", 4))
+# Blocos entre verificações do saldo de MATIC do Keeper
+KEEPER_BALANCE_CHECK_BLOCKS = int(os.getenv("KEEPER_BALANCE_CHECK_BLOCKS", 150))
+
+GET_VAULT_INFO_SELECTOR = Web3.keccak(text="getVaultInfo()")[:4]
+# Saída de getVaultInfo() quando o ABI compilado não está disponível
+VAULT_INFO_TYPES = ['address', 'address', 'int256', 'uint256', 'bool', 'uint256', 'int256']
+
 class StrategyKeeper:
     def __init__(self):
         print("Inicializando Strategy Keeper...")
@@ -35,6 +49,27 @@ class StrategyKeeper:
         
         # Carregar ABI do contrato (será atualizado quando o contrato for compilado)
         self.strategy_vault_abi = self._load_strategy_vault_abi()
+        self.vault_info_types = self._vault_info_output_types()
+        
+        # Leitura dos vaults agrupada (Multicall3) e envio das execuções em paralelo
+        self.w3 = self.blockchain_service.w3
+        self.multicall = MulticallService(self.w3)
+        self.executor = ThreadPoolExecutor(max_workers=KEEPER_SUBMIT_CONCURRENCY, thread_name_prefix='keeper')
+        self._contracts = {}
+        # Nonces locais: várias execuções enviadas em sequência sem aguardar confirmação
+        self.nonce_manager = NonceManager(self.w3, self.keeper_account.address, self.keeper_private_key)
+        # nonce -> vault da execução; os recibos são verificados a cada ciclo, sem bloquear
+        self.pending_transactions = {}
+        
+        # Ciclos disparados por bloco novo; vaults em cache, recarregados só quando strategy_vaults muda
+        self.block_watcher = BlockWatcher(self.w3)
+        self.vault_registry = RegistryCache(
+            self.db_service.get_all_vault_addresses,
+            lambda: self.db_service.get_table_fingerprint('strategy_vaults', ('contract_address',)),
+            on_change=self._on_vaults_changed
+        )
+        # endereço -> último getVaultInfo avaliado sem execução (estado igual não é reavaliado)
+        self._last_states = {}
         
     def _load_strategy_vault_abi(self):
         """Carrega o ABI do contrato StrategyVault"""
@@ -82,63 +117,136 @@ class StrategyKeeper:
             print(f"ERRO: Erro ao carregar ABI: {e}")
             return []
 
-    def check_vault(self, vault_address: str) -> dict:
-        """Verifica e executa a estratégia de um vault específico"""
-        try:
-            print(f"Verificando vault: {vault_address}")
-            
-            # Criar instância do contrato
-            contract = self.blockchain_service.w3.eth.contract(
-                address=Web3.to_checksum_address(vault_address),
-                abi=self.strategy_vault_abi
-            )
-            
-            # Obter informações do vault
-            vault_info = contract.functions.getVaultInfo().call()
-            
-            token_to_spend = vault_info[0]
-            token_to_buy = vault_info[1]
-            target_price = vault_info[2]
-            amount_to_spend = vault_info[3]
-            strategy_active = vault_info[4]
-            last_execution = vault_info[5]
-            current_price = vault_info[6]
-            
-            print(f"  📊 Token to spend: {token_to_spend}")
-            print(f"  📊 Token to buy: {token_to_buy}")
-            print(f"  Target price: {target_price}")
-            print(f"  Amount to spend: {amount_to_spend}")
-            print(f"  Strategy active: {strategy_active}")
-            print(f"  Current price: {current_price}")
-            
-            result = {
-                "vault_address": vault_address,
-                "strategy_active": strategy_active,
-                "current_price": current_price,
-                "target_price": target_price,
-                "executed": False,
-                "transaction_hash": None,
-                "error": None
-            }
-            
-            if not strategy_active:
-                print(f"  ⏸️  Estratégia inativa")
-                return result
-            
-            if current_price > target_price:
-                print(f"  ⏳ Preço atual ({current_price}) > preço alvo ({target_price})")
-                return result
-            
-            # Executar estratégia
-            print(f"  Executando estratégia...")
-            tx_hash = self._execute_strategy_check(contract)
+    def _vault_info_output_types(self) -> list:
+        """Tipos de saída de getVaultInfo() no ABI carregado"""
+        for item in self.strategy_vault_abi:
+            if item.get('type') == 'function' and item.get('name') == 'getVaultInfo':
+                return [output['type'] for output in item['outputs']]
+        return VAULT_INFO_TYPES
+
+    def _get_contract(self, vault_address: str):
+        address = Web3.to_checksum_address(vault_address)
+        if address not in self._contracts:
+            self._contracts[address] = self.w3.eth.contract(address=address, abi=self.strategy_vault_abi)
+        return self._contracts[address]
+
+    def _on_vaults_changed(self, previous: list, current: list):
+        """Registro de vaults mudou: descarta o estado em cache dos vaults removidos"""
+        current_addresses = {vault['contract_address'] for vault in current}
+        for vault in previous:
+            if vault['contract_address'] not in current_addresses:
+                self._last_states.pop(vault['contract_address'], None)
+                self._contracts.pop(Web3.to_checksum_address(vault['contract_address']), None)
+        print(f"📊 Registro de vaults atualizado: {len(current)} vaults")
+
+    def read_vault_states(self, vault_addresses: list, block_identifier='latest') -> dict:
+        """
+        Lê getVaultInfo() de todos os vaults em chamadas agrupadas (Multicall3).
+        Retorna endereço -> tupla do getVaultInfo, ou None se a leitura falhou.
+        """
+        results = self.multicall.aggregate([(address, GET_VAULT_INFO_SELECTOR) for address in vault_addresses],
+                                           block_identifier)
+        states = {}
+        for address, (success, data) in zip(vault_addresses, results):
+            try:
+                states[address] = abi_decode(self.vault_info_types, data) if success and data else None
+            except Exception:
+                states[address] = None
+        return states
+
+    def _evaluate_vault(self, vault_address: str, vault_info) -> tuple:
+        """Avalia em memória se a estratégia deve ser executada. Retorna (resultado, executar)"""
+        target_price = vault_info[2]
+        strategy_active = vault_info[4]
+        current_price = vault_info[6]
+        
+        result = {
+            "vault_address": vault_address,
+            "strategy_active": strategy_active,
+            "current_price": current_price,
+            "target_price": target_price,
+            "executed": False,
+            "transaction_hash": None,
+            "error": None
+        }
+        
+        if not strategy_active:
+            print(f"  ⏸️  {vault_address}: estratégia inativa")
+            return result, False
+        
+        if current_price > target_price:
+            print(f"  ⏳ {vault_address}: preço atual ({current_price}) > preço alvo ({target_price})")
+            return result, False
+        
+        return result, True
+
+    def check_vaults(self, vaults: list, only_changed: bool = False, block_identifier='latest') -> list:
+        """
+        Verifica todos os vaults de uma vez: uma leitura agrupada dos estados, avaliação em memória
+        e envio concorrente das execuções. Os recibos são acompanhados nos ciclos seguintes.
+        Com only_changed, vaults cujo getVaultInfo não mudou desde a última avaliação são pulados.
+        """
+        self._poll_receipts()
+        
+        addresses = [vault['contract_address'] for vault in vaults]
+        states = self.read_vault_states(addresses, block_identifier)
+        vaults_in_flight = {pending['vault_address'].lower() for pending in self.pending_transactions.values()}
+        
+        results = []
+        submissions = []
+        for vault in vaults:
+            address = vault['contract_address']
+            vault_info = states.get(address)
+            if vault_info is None:
+                results.append({"vault_id": vault['id'], "vault_address": address, "executed": False,
+                                "error": "Falha ao ler getVaultInfo"})
+                continue
             
-            result["executed"] = True
-            result["transaction_hash"] = tx_hash
-            print(f"  Estratégia executada! TX: {tx_hash}")
+            # Execução já enviada e ainda não confirmada, ou estado igual ao da última avaliação
+            if address.lower() in vaults_in_flight:
+                continue
+            if only_changed and self._last_states.get(address) == vault_info:
+                continue
             
-            return result
+            result, should_execute = self._evaluate_vault(address, vault_info)
+            result["vault_id"] = vault['id']
+            results.append(result)
             
+            if not should_execute:
+                self._last_states[address] = vault_info
+            else:
+                # Sem registrar o estado: até a execução mudar o vault, ele volta a ser avaliado
+                self._last_states.pop(address, None)
+                print(f"  Executando estratégia do vault {address}...")
+                submissions.append((result, self.executor.submit(self._execute_strategy_check, self._get_contract(address))))
+        
+        for result, future in submissions:
+            try:
+                sent = future.result()
+                result["executed"] = True
+                result["transaction_hash"] = sent['tx_hash']
+                self.pending_transactions[sent['nonce']] = {
+                    "vault_id": result["vault_id"],
+                    "vault_address": result["vault_address"]
+                }
+                print(f"  Estratégia enviada! TX: {sent['tx_hash']} (nonce {sent['nonce']})")
+            except Exception as e:
+                result["error"] = str(e)
+        
+        return results
+
+    def check_vault(self, vault_address: str) -> dict:
+        """Verifica e executa a estratégia de um vault específico"""
+        try:
+            results = self.check_vaults([{"id": None, "contract_address": vault_address}])
+            if not results:
+                # Execução anterior do vault ainda aguardando confirmação
+                return {
+                    "vault_address": vault_address,
+                    "executed": False,
+                    "error": "execução pendente"
+                }
+            return results[0]
         except Exception as e:
             print(f"  ERRO: Erro ao verificar vault {vault_address}: {e}")
             return {
@@ -147,88 +255,77 @@ class StrategyKeeper:
                 "error": str(e)
             }
 
-    def _execute_strategy_check(self, contract) -> str:
-        """Executa a função performStrategyCheck no contrato"""
+    def _execute_strategy_check(self, contract) -> dict:
+        """Envia performStrategyCheck ao contrato sem aguardar o recibo. Retorna {'nonce', 'tx_hash'}"""
         try:
-            # Estimar gas
+            # Estimar gas (em paralelo entre os vaults)
             gas_estimate = contract.functions.performStrategyCheck().estimate_gas({
                 'from': self.keeper_account.address
             })
             
-            # Adicionar margem de segurança
-            gas_limit = int(gas_estimate * 1.2)
-            
-            # Obter gas price atual
-            gas_price = self.blockchain_service.w3.eth.gas_price
-            
-            # Construir transação
-            transaction = contract.functions.performStrategyCheck().build_transaction({
-                'from': self.keeper_account.address,
-                'gas': gas_limit,
-                'gasPrice': gas_price,
-                'nonce': self.blockchain_service.w3.eth.get_transaction_count(self.keeper_account.address),
+            # Adicionar margem de segurança; nonce e gas price vêm do NonceManager (sem consultar o nó a cada envio)
+            return self.nonce_manager.send({
+                'to': contract.address,
+                'data': contract.encode_abi("performStrategyCheck"),
+                'value': 0,
+                'gas': int(gas_estimate * 1.2)
             })
-            
-            # Assinar transação
-            signed_txn = self.blockchain_service.w3.eth.account.sign_transaction(
-                transaction, 
-                private_key=self.keeper_private_key
-            )
-            
-            # Enviar transação
-            tx_hash = self.blockchain_service.w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-            
-            # Aguardar confirmação
-            receipt = self.blockchain_service.w3.eth.wait_for_transaction_receipt(tx_hash)
-            
-            if receipt.status == 1:
-                return receipt.transactionHash.hex()
-            else:
-                raise Exception("Transaction failed")
                 
         except Exception as e:
             raise Exception(f"Failed to execute strategy check: {e}")
 
+    def _poll_receipts(self):
+        """Processa as transações finalizadas (o NonceManager também substitui as presas), sem bloquear"""
+        for finished in self.nonce_manager.poll():
+            pending = self.pending_transactions.pop(finished['nonce'], {})
+            vault_id = pending.get('vault_id')
+            receipt = finished['receipt']
+            if finished['error']:
+                print(f"WARNING: Nonce {finished['nonce']} do vault {vault_id}: {finished['error']} ({finished['tx_hash']})")
+            elif receipt.status == 1:
+                print(f"Vault {vault_id} executado com sucesso! TX: {finished['tx_hash']} (bloco {receipt.blockNumber})")
+            else:
+                print(f"ERRO: Transação do vault {vault_id} falhou: {finished['tx_hash']}")
+
     def run_keeper_loop(self):
-        """Loop principal do Keeper"""
+        """Loop principal do Keeper: um ciclo por bloco novo"""
         print("🔄 Iniciando loop do Keeper...")
+        blocks_since_balance_check = 0
         
         while True:
             try:
-                print(f"\n--- 🤖 Novo ciclo do Keeper ---")
+                block_number = self.block_watcher.wait_for_new_block()
+                self.nonce_manager.on_new_block(block_number)
                 
-                # Buscar todos os vaults registrados
-                vaults = self.db_service.get_all_vault_addresses()
+                # Vaults em cache: o banco só é relido quando strategy_vaults muda
+                vaults = self.vault_registry.get()
                 
                 if not vaults:
-                    print("📭 Nenhum vault registrado encontrado")
+                    self._poll_receipts()
                 else:
-                    print(f"📊 Encontrados {len(vaults)} vaults para verificar")
+                    results = self.check_vaults(vaults, only_changed=True, block_identifier=block_number)
+                    if results:
+                        print(f"\n--- 🤖 Bloco {block_number}: {len(results)} de {len(vaults)} vaults com estado novo ---")
                     
-                    for vault in vaults:
-                        contract_address = vault['contract_address']
-                        vault_id = vault['id']
-                        
-                        result = self.check_vault(contract_address)
-                        
+                    for result in results:
                         if result.get('executed'):
-                            print(f"Vault {vault_id} executado com sucesso!")
+                            print(f"Vault {result['vault_id']}: execução enviada")
                         elif result.get('error'):
-                            print(f"ERRO: Erro no vault {vault_id}: {result['error']}")
+                            print(f"ERRO: Erro no vault {result['vault_id']}: {result['error']}")
                 
-                # Verificar saldo do Keeper
-                balance = self.blockchain_service.w3.eth.get_balance(self.keeper_account.address)
-                balance_matic = Web3.from_wei(balance, 'ether')
-                
-                if balance_matic < 0.05:
-                    print(f"WARNING: Keeper com pouco MATIC ({balance_matic:.4f})")
-                
-                print(f"💤 Aguardando 5 segundos para próximo ciclo...")
-                time.sleep(5)
+                # Verificar saldo do Keeper periodicamente
+                blocks_since_balance_check += 1
+                if blocks_since_balance_check >= KEEPER_BALANCE_CHECK_BLOCKS:
+                    blocks_since_balance_check = 0
+                    balance = self.w3.eth.get_balance(self.keeper_account.address)
+                    balance_matic = Web3.from_wei(balance, 'ether')
+                    
+                    if balance_matic < 0.05:
+                        print(f"WARNING: Keeper com pouco MATIC ({balance_matic:.4f})")
                 
             except Exception as e:
                 print(f"💥 Erro crítico no Keeper: {e}")
-                print("⏱️  Tentando novamente em 30 segundos...")
+                print("⏱️  Tentando novamente em 10 segundos...")
                 time.sleep(10)
 
 def main():
@@ -28,7 +28,9 @@ from decimal import Decimal
 from typing import Optional, List
 from datetime import date, datetime
 import json
+import asyncio
 import logging
+from contextlib import closing
 import traceback
 import time
 
@@ -563,6 +565,7 @@ class OptimizationJobCreate(BaseModel):
     start_date: date
     end_date: date
     parameter_ranges: dict  # JSON with parameter ranges for optimization
+    search_config: Optional[dict] = None  # method (genetic/grid/random), population_size, generations, patience...
 
 class OptimizationJobResponse(BaseModel):
     id: int
@@ -575,6 +578,7 @@ class OptimizationJobResponse(BaseModel):
     start_date: date
     end_date: date
     parameter_ranges: dict
+    search_config: Optional[dict] = None
     status: str
     created_at: datetime
     completed_at: Optional[datetime] = None
@@ -592,6 +596,15 @@ class OptimizationResult(BaseModel):
     max_drawdown_percent: float
     sharpe_ratio: float
     fitness_score: float
+    fidelity: float = 1.0
+    # Walk-forward: fold do resumo e métricas no período de teste (fora da amostra)
+    fold: Optional[int] = None
+    oos_total_trades: Optional[int] = None
+    oos_win_rate_percent: Optional[float] = None
+    oos_net_profit_percent: Optional[float] = None
+    oos_max_drawdown_percent: Optional[float] = None
+    oos_sharpe_ratio: Optional[float] = None
+    oos_fitness_score: Optional[float] = None
     created_at: datetime
 
 class OptimizationResultsResponse(BaseModel):
@@ -1056,6 +1069,25 @@ async def create_account_from_wallet(wallet_data: WalletAccountCreate, current_u
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating wallet account: {str(e)}")
 
+@app.post("/accounts/sync-all")
+async def sync_all_wallet_accounts(current_user: dict = Depends(get_current_user)):
+    """
+    Sincroniza de uma vez todas as contas CARTEIRA_CRIPTO do usuário com a blockchain
+    """
+    user_id = database_service.get_user_id_by_username(current_user['username'])
+    if not user_id:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    try:
+        sync_result = await wallet_sync_service.sync_all_wallets(user_id=user_id)
+        return {
+            "sync_result": sync_result,
+            "message": f"{sync_result['wallets_synced']} carteiras sincronizadas"
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error syncing wallets: {str(e)}")
+
 @app.post("/accounts/{account_id}/sync")
 async def sync_wallet_account(account_id: int, current_user: dict = Depends(get_current_user)):
     """
@@ -2017,10 +2049,14 @@ async def create_swap_movement(swap: SwapMovementCreate, current_user: dict = De
 #         raise HTTPException(status_code=500, detail=f"Error getting net worth history: {str(e)}")
 
 @app.post("/portfolio/accounts/{account_id}/reconcile")
-async def reconcile_wallet_history(account_id: int, current_user: dict = Depends(get_current_user)):
+async def reconcile_wallet_history(account_id: int, full: bool = False, source: str = "polygonscan",
+                                   start_block: Optional[int] = None,
+                                   current_user: dict = Depends(get_current_user)):
     """
-    NOVA FUNCIONALIDADE: Reconciliação profunda com histórico on-chain
-    Reconstrói completamente o histórico da carteira usando dados da blockchain
+    NOVA FUNCIONALIDADE: Reconciliação com histórico on-chain
+    Incremental a partir do último bloco processado; full=true reconstrói o histórico completo.
+    source=logs indexa os eventos Transfer direto do nó RPC (eth_getLogs) em vez do PolygonScan;
+    a primeira indexação (ou full=true) exige start_block, ex: o bloco de criação da carteira.
     """
     user_id = database_service.get_user_id_by_username(current_user['username'])
     if not user_id:
@@ -2038,12 +2074,31 @@ async def reconcile_wallet_history(account_id: int, current_user: dict = Depends
         if not account['public_address']:
             raise HTTPException(status_code=400, detail="Wallet must have a public address to be reconciled")
         
-        # Executar reconciliação profunda
-        result = wallet_sync_service.reconcile_wallet_history(
-            user_id=user_id,
-            account_id=account_id,
-            public_address=account['public_address']
-        )
+        if source not in ("polygonscan", "logs"):
+            raise HTTPException(status_code=400, detail="source must be 'polygonscan' or 'logs'")
+        
+        def reconcile():
+            # Tarefa longa com commits a cada onda: usa uma conexão própria, para não intercalar
+            # commits e rollbacks com as demais requisições na conexão compartilhada
+            with closing(DatabaseService.dedicated()) as thread_db:
+                thread_sync_service = WalletSyncService(thread_db)
+                if source == "logs":
+                    return thread_sync_service.index_wallet_transfers(
+                        user_id=user_id,
+                        account_id=account_id,
+                        public_address=account['public_address'],
+                        start_block=start_block,
+                        full=full
+                    )
+                return thread_sync_service.reconcile_wallet_history(
+                    user_id=user_id,
+                    account_id=account_id,
+                    public_address=account['public_address'],
+                    full=full
+                )
+        
+        # Executar reconciliação profunda (bloqueante: fora do event loop)
+        result = await asyncio.to_thread(reconcile)
         
         return {
             "success": True,
@@ -2051,6 +2106,10 @@ async def reconcile_wallet_history(account_id: int, current_user: dict = Depends
             "reconciliation_result": result
         }
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during wallet reconciliation: {str(e)}")
 
@@ -2924,11 +2983,7 @@ async def create_optimization_job(
             job_data=job_data.dict()
         )
         
-        # Iniciar otimização em background
-        background_tasks.add_task(
-            optimization_service.run_genetic_optimization,
-            job_id=job['id']
-        )
+        # O job fica PENDING na fila e é executado pelo optimizer_worker.py
         
         return OptimizationJobResponse(**job)
         
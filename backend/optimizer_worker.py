@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Worker de Otimização de Estratégias
+Processo dedicado que consome a fila de jobs em strategy_optimization_jobs.
+Os jobs são reivindicados com SELECT ... FOR UPDATE SKIP LOCKED, executados em processos
+isolados dentro de um orçamento global de CPU e retomados do último checkpoint em caso de falha.
+"""
+
+import sys
+import os
+import time
+import socket
+import signal
+import logging
+import multiprocessing
+from typing import Dict
+
+# Adicionar o diretório backend ao Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.optimization_service import OptimizationService
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('/tmp/optimizer_worker.log'),
+        logging.StreamHandler()
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+# Orçamento total de processos de backtest nesta máquina (compartilhado entre todos os jobs do worker)
+CPU_BUDGET = int(os.getenv("OPTIMIZER_CPU_BUDGET", max(1, multiprocessing.cpu_count() - 1)))
+# Quantidade de jobs executados simultaneamente por este worker
+MAX_CONCURRENT_JOBS = int(os.getenv("OPTIMIZER_MAX_CONCURRENT_JOBS", 1))
+POLL_INTERVAL_SECONDS = int(os.getenv("OPTIMIZER_POLL_INTERVAL", 5))
+HEARTBEAT_INTERVAL_SECONDS = int(os.getenv("OPTIMIZER_HEARTBEAT_INTERVAL", 15))
+STALE_JOB_TIMEOUT_SECONDS = int(os.getenv("OPTIMIZER_STALE_TIMEOUT", 120))
+MAX_JOB_ATTEMPTS = int(os.getenv("OPTIMIZER_MAX_ATTEMPTS", 3))
+
+
+def _run_job_process(job_id: int, max_workers: int) -> None:
+    """
+    Executa um job em um processo isolado (com conexão própria ao banco).
+    """
+    service = OptimizationService(max_workers=max_workers)
+    service.run_optimization(job_id)
+
+
+class OptimizerWorker:
+    def __init__(self):
+        """
+        Inicializa o worker com os serviços necessários
+        """
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.optimization_service = OptimizationService()
+        # Cada job recebe uma fatia fixa do orçamento de CPU para evitar oversubscription
+        self.processes_per_job = max(1, CPU_BUDGET // max(1, MAX_CONCURRENT_JOBS))
+        # 'spawn' garante que cada job abra sua própria conexão MySQL (o DatabaseService é singleton por processo)
+        self.mp_context = multiprocessing.get_context('spawn')
+        self.running_jobs: Dict[int, multiprocessing.Process] = {}
+        self.last_heartbeat = 0.0
+        self.stopping = False
+
+    def request_stop(self, signum=None, frame=None):
+        """
+        Para de reivindicar novos jobs e aguarda a conclusão dos jobs em andamento
+        """
+        logger.info("Sinal de parada recebido, encerrando worker...")
+        self.stopping = True
+
+    def reap_finished_jobs(self) -> None:
+        """
+        Remove processos concluídos e devolve à fila os jobs cujo processo morreu inesperadamente
+        """
+        for job_id, process in list(self.running_jobs.items()):
+            if process.is_alive():
+                continue
+
+            process.join()
+            del self.running_jobs[job_id]
+
+            if process.exitcode == 0:
+                logger.info(f"Job {job_id} finalizado")
+            else:
+                # Exceções comuns já marcam o job como FAILED; aqui tratamos mortes abruptas (OOM, kill)
+                logger.error(f"Processo do job {job_id} terminou com código {process.exitcode}")
+                self.optimization_service.requeue_job(job_id, MAX_JOB_ATTEMPTS)
+
+    def claim_jobs(self) -> None:
+        """
+        Reivindica jobs da fila enquanto houver vagas livres
+        """
+        while not self.stopping and len(self.running_jobs) < MAX_CONCURRENT_JOBS:
+            job = self.optimization_service.claim_next_job(self.worker_id)
+            if not job:
+                return
+
+            process = self.mp_context.Process(
+                target=_run_job_process,
+                args=(job['id'], self.processes_per_job),
+                name=f"optimization-job-{job['id']}"
+            )
+            process.start()
+            self.running_jobs[job['id']] = process
+            logger.info(f"Job {job['id']} iniciado com {self.processes_per_job} processos de avaliação")
+
+    def send_heartbeats(self) -> None:
+        """
+        Sinaliza que os jobs em execução continuam vivos
+        """
+        now = time.monotonic()
+        if now - self.last_heartbeat < HEARTBEAT_INTERVAL_SECONDS:
+            return
+
+        self.optimization_service.heartbeat_jobs(list(self.running_jobs.keys()), self.worker_id)
+        self.optimization_service.requeue_stale_jobs(STALE_JOB_TIMEOUT_SECONDS, MAX_JOB_ATTEMPTS)
+        self.last_heartbeat = now
+
+    def run(self) -> None:
+        """
+        Loop principal do worker
+        """
+        logger.info(f"Worker {self.worker_id} iniciado | orçamento de CPU: {CPU_BUDGET} | jobs simultâneos: {MAX_CONCURRENT_JOBS}")
+
+        # Recuperar jobs órfãos de execuções anteriores antes de consumir a fila
+        self.optimization_service.requeue_stale_jobs(STALE_JOB_TIMEOUT_SECONDS, MAX_JOB_ATTEMPTS)
+
+        while not self.stopping or self.running_jobs:
+            try:
+                self.reap_finished_jobs()
+                self.claim_jobs()
+                self.send_heartbeats()
+            except Exception as e:
+                logger.error(f"Erro no ciclo do worker: {e}")
+
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+
+def main():
+    """
+    Função principal do worker
+    """
+    try:
+        worker = OptimizerWorker()
+        signal.signal(signal.SIGTERM, worker.request_stop)
+        signal.signal(signal.SIGINT, worker.request_stop)
+        worker.run()
+        return 0
+    except Exception as e:
+        logger.error(f"Erro crítico no worker: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    exit_code = main()
+    sys.exit(exit_code)
@@ -4,12 +4,26 @@ import pandas as pd
 import numpy as np
 import pandas_ta as ta
 import logging
+from collections import OrderedDict
 from datetime import date
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 from services.historical_data_service import HistoricalDataService
 
 logger = logging.getLogger(__name__)
 
+# Quantidade de séries com indicadores/sinais já calculados mantidas em memória por processo
+PREPARED_CACHE_SIZE = 64
+
+# Parâmetros de execução da simulação (podem ser sobrescritos pelos parâmetros da estratégia).
+# Valores em fração: fee_rate 0.001 = 0,1% por execução; stop_loss 0.05 = 5% contra a posição.
+SIMULATION_DEFAULTS = {
+    'fee_rate': 0.001,       # taxa cobrada sobre o nocional em cada execução (entrada e saída)
+    'slippage': 0.0005,      # deslocamento adverso do preço de execução
+    'stop_loss': None,       # distância do stop a partir do preço de entrada (None = sem stop)
+    'take_profit': None,     # distância do alvo a partir do preço de entrada (None = sem alvo)
+    'position_size': 1.0     # fração do capital alocada em cada trade
+}
+
 # ---------------------------------------------------------------------------
 # Classe de Backtest (Pronta para Produção)
 # ---------------------------------------------------------------------------
@@ -18,40 +32,177 @@ class BacktestingService:
         self.historical_data_service = historical_data_service or HistoricalDataService()
         # Fator de anualização para diferentes timeframes (aproximado)
         self.annualization_factor = {'1d': 252, '4h': 252*6, '1h': 252*24}
+        # Séries com indicadores e sinais já aplicados, reaproveitadas entre janelas (walk-forward)
+        self._prepared_cache = OrderedDict()
 
     def run_backtest(self, asset_symbol: str, timeframe: str, start_date: date, 
-                     end_date: date, base_strategy_name: str, parameters: dict) -> Dict:
+                     end_date: date, base_strategy_name: str, parameters: dict,
+                     decimation: int = 1, data: Optional[pd.DataFrame] = None,
+                     include_trades: bool = False, include_returns: bool = False) -> Dict:
         """
         Orquestra a execução de um backtest vetorizado.
+        decimation > 1 usa apenas 1 a cada N candles (avaliação de triagem, mais barata e menos precisa).
+        Se data for informado (série já carregada de um período maior), indicadores e sinais são
+        calculados uma vez sobre a série inteira e o backtest usa apenas o recorte start_date..end_date.
+        include_trades adiciona ao resultado o livro de trades (entrada/saída, PnL, tempo de exposição).
+        include_returns adiciona os arrays strategy_returns (por candle) e trade_returns (por trade,
+        sobre o capital), usados na análise de robustez.
         """
         try:
-            # 1. Obter dados históricos
-            df = self.historical_data_service.get_historical_data(asset_symbol, timeframe, start_date, end_date)
-            
-            if df is None or len(df) < 50: # Mínimo de períodos para calcular indicadores
-                raise ValueError("Dados históricos insuficientes para o período.")
+            if data is not None:
+                # 1-3. Série preparada em cache, recortada para o período pedido
+                df = self._get_prepared_data(data, base_strategy_name, parameters, decimation)
+                start = pd.Timestamp(start_date)
+                end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+                df = df[(df.index >= start) & (df.index < end)]
+                
+                if len(df) < 50:
+                    raise ValueError("Dados históricos insuficientes para o período.")
+            else:
+                # 1. Obter dados históricos
+                df = self.historical_data_service.get_historical_data(asset_symbol, timeframe, start_date, end_date)
+                
+                if df is not None and decimation > 1:
+                    df = df.iloc[::decimation]
+                
+                if df is None or len(df) < 50: # Mínimo de períodos para calcular indicadores
+                    raise ValueError("Dados históricos insuficientes para o período.")
 
-            # 2. Aplicar indicadores técnicos
-            df = self._apply_indicators(df.copy(), base_strategy_name, parameters)
+                # 2. Aplicar indicadores técnicos
+                df = self._apply_indicators(df.copy(), base_strategy_name, parameters)
 
-            # 3. Gerar sinais de negociação
-            df = self._generate_signals(df.copy(), base_strategy_name, parameters)
+                # 3. Gerar sinais de negociação
+                df = self._generate_signals(df.copy(), base_strategy_name, parameters)
 
             # 4. Executar a simulação (backtest vetorizado)
-            df = self._execute_simulation(df.copy(), parameters)
+            df, trades = self._execute_simulation(df.copy(), parameters)
 
             # 5. Calcular métricas de performance
-            metrics = self._calculate_metrics(df.copy(), self.annualization_factor.get(timeframe, 252))
+            annualization = self.annualization_factor.get(timeframe, 252) / decimation
+            metrics = self._calculate_metrics(df, annualization, trades)
 
             # 6. Calcular o Fitness Score final (usando a mesma fórmula do seu otimizador)
             metrics['fitness_score'] = self._calculate_fitness_score(metrics)
             
+            if include_trades:
+                metrics['trades'] = self._trades_to_records(df, trades)
+            
+            if include_returns:
+                position_size = float(parameters.get('position_size', SIMULATION_DEFAULTS['position_size']))
+                metrics['strategy_returns'] = df['strategy_returns'].to_numpy()
+                metrics['trade_returns'] = trades['return_percent'] / 100 * position_size
+            
             return metrics
 
         except Exception as e:
             # Em caso de qualquer erro, retorna um resultado com penalidade máxima
             return self._get_error_result(str(e))
 
+    def run_portfolio_backtest(self, asset_symbols: List[str], timeframe: str, start_date: date,
+                               end_date: date, base_strategy_name: str, parameters: dict,
+                               weights: Optional[Dict[str, float]] = None,
+                               include_equity_curves: bool = False) -> Dict:
+        """
+        Backtest de uma estratégia em vários ativos ao mesmo tempo.
+        Os candles são carregados uma única vez em matrizes (tempo × ativo) alinhadas; indicadores e
+        sinais são calculados sobre todas as colunas de uma vez. Cada ativo opera uma fatia do capital
+        (weights, padrão pesos iguais, sem rebalanceamento) e a equity combinada é a soma das fatias.
+        """
+        try:
+            prices = self.historical_data_service.get_price_matrix(asset_symbols, timeframe, start_date, end_date)
+            if prices is None or len(prices['close']) < 50:
+                raise ValueError("Dados históricos insuficientes para o período.")
+            
+            # 1-2. Indicadores e sinais de todos os ativos em operações matriciais
+            data = self._apply_indicators_matrix(prices, base_strategy_name, parameters)
+            signals = self._generate_signals_matrix(data, base_strategy_name, parameters)
+            index = signals.index
+            symbols = list(signals.columns)
+            if len(index) < 2:
+                raise ValueError("Dados insuficientes após o cálculo dos indicadores.")
+            
+            raw_weights = np.array([float((weights or {}).get(symbol, 1.0)) for symbol in symbols])
+            if raw_weights.sum() <= 0:
+                raise ValueError("A soma dos pesos deve ser positiva.")
+            allocation = raw_weights / raw_weights.sum()
+            
+            # 3. Simulação de cada coluna (o laço interno percorre apenas trades)
+            annualization = self.annualization_factor.get(timeframe, 252)
+            matrix = {field: data[field].to_numpy(dtype=float) for field in ('open', 'high', 'low', 'close')}
+            signal_matrix = signals.to_numpy(dtype=float)
+            
+            equity_curves = {}
+            asset_metrics = {}
+            ledgers = []
+            for column, symbol in enumerate(symbols):
+                equity, _, trades = self._simulate_trades(
+                    matrix['close'][:, column], matrix['open'][:, column], matrix['high'][:, column],
+                    matrix['low'][:, column], signal_matrix[:, column], parameters
+                )
+                frame = self._equity_frame(equity, index)
+                metrics = self._calculate_metrics(frame, annualization, trades)
+                metrics['fitness_score'] = self._calculate_fitness_score(metrics)
+                metrics['weight'] = round(float(allocation[column]), 6)
+                
+                asset_metrics[symbol] = metrics
+                equity_curves[symbol] = frame['equity']
+                ledgers.append(trades)
+            
+            # 4. Equity combinada: cada ativo parte da sua fatia do capital
+            combined_equity = (pd.DataFrame(equity_curves) * allocation).sum(axis=1)
+            combined_frame = self._equity_frame(combined_equity.to_numpy(), index)
+            combined_trades = {
+                key: np.concatenate([ledger[key] for ledger in ledgers])
+                for key in ('return_percent', 'holding_bars')
+            }
+            portfolio_metrics = self._calculate_metrics(combined_frame, annualization, combined_trades)
+            portfolio_metrics['fitness_score'] = self._calculate_fitness_score(portfolio_metrics)
+            
+            result = {
+                'assets': asset_metrics,
+                'portfolio': portfolio_metrics,
+                'start': index[0].isoformat(),
+                'end': index[-1].isoformat(),
+                'periods': len(index)
+            }
+            
+            if include_equity_curves:
+                result['equity_curves'] = {
+                    'timestamps': [timestamp.isoformat() for timestamp in index],
+                    'portfolio': combined_frame['equity'].round(6).tolist(),
+                    'assets': {symbol: curve.round(6).tolist() for symbol, curve in equity_curves.items()}
+                }
+            
+            return result
+        
+        except Exception as e:
+            logger.error(f"Erro no backtest de portfólio: {str(e)}")
+            return {'assets': {}, 'portfolio': self._get_error_result(str(e)), 'error': str(e)}
+
+    def _get_prepared_data(self, data: pd.DataFrame, strategy_name: str, parameters: dict,
+                           decimation: int) -> pd.DataFrame:
+        """
+        Retorna a série com indicadores e sinais aplicados, usando cache LRU por
+        (série, estratégia, parâmetros, decimação).
+        """
+        key = (id(data), strategy_name, tuple(sorted(parameters.items())), decimation)
+        cached = self._prepared_cache.get(key)
+        # id() pode ser reutilizado após a série original ser descartada; confere a identidade
+        if cached is not None and cached[0] is data:
+            self._prepared_cache.move_to_end(key)
+            return cached[1]
+        
+        df = data.iloc[::decimation] if decimation > 1 else data
+        if len(df) < 50:
+            raise ValueError("Dados históricos insuficientes para o período.")
+        df = self._apply_indicators(df.copy(), strategy_name, parameters)
+        df = self._generate_signals(df, strategy_name, parameters)
+        
+        self._prepared_cache[key] = (data, df)
+        if len(self._prepared_cache) > PREPARED_CACHE_SIZE:
+            self._prepared_cache.popitem(last=False)
+        return df
+
     def _apply_indicators(self, df: pd.DataFrame, strategy_name: str, parameters: dict) -> pd.DataFrame:
         """Aplica os indicadores necessários para a estratégia."""
         
@@ -245,28 +396,283 @@ class BacktestingService:
         
         return df
 
-    def _execute_simulation(self, df: pd.DataFrame, parameters: dict) -> pd.DataFrame:
-        """Executa a simulação baseada em sinais."""
-        # A posição é o sinal do dia anterior (agimos na abertura do dia seguinte)
-        df['position'] = df['signal'].replace(to_replace=0, method='ffill').shift(1)
-        df['position'].fillna(0, inplace=True)
+    # --- Indicadores matriciais (tempo × ativo), equivalentes aos do pandas_ta usados em _apply_indicators ---
+
+    def _sma_matrix(self, frame: pd.DataFrame, length: int) -> pd.DataFrame:
+        return frame.rolling(window=length).mean()
+
+    def _ema_matrix(self, frame: pd.DataFrame, length: int) -> pd.DataFrame:
+        """EMA semeada com a SMA dos primeiros candles (como no pandas_ta)."""
+        first_valid = int(frame.notna().all(axis=1).to_numpy().argmax())
+        seed_row = first_valid + length - 1
+        seeded = frame.copy()
+        if seed_row >= len(frame):
+            return seeded * np.nan
+        seeded.iloc[:seed_row] = np.nan
+        seeded.iloc[seed_row] = frame.iloc[first_valid:seed_row + 1].mean()
+        return seeded.ewm(span=length, adjust=False).mean()
+
+    def _wma_matrix(self, frame: pd.DataFrame, length: int) -> pd.DataFrame:
+        """Média ponderada linear via janelas deslizantes (sem rolling.apply)."""
+        weights = np.arange(1, length + 1, dtype=float)
+        values = frame.to_numpy(dtype=float)
+        result = np.full(values.shape, np.nan)
+        if len(values) >= length:
+            windows = np.lib.stride_tricks.sliding_window_view(values, length, axis=0)
+            result[length - 1:] = windows @ weights / weights.sum()
+        return pd.DataFrame(result, index=frame.index, columns=frame.columns)
+
+    def _rma_matrix(self, frame: pd.DataFrame, length: int) -> pd.DataFrame:
+        return frame.ewm(alpha=1.0 / length, min_periods=length).mean()
+
+    def _rsi_matrix(self, close: pd.DataFrame, length: int) -> pd.DataFrame:
+        delta = close.diff()
+        positive = self._rma_matrix(delta.clip(lower=0), length)
+        negative = self._rma_matrix(delta.clip(upper=0), length).abs()
+        return 100 * positive / (positive + negative)
+
+    def _atr_matrix(self, high: pd.DataFrame, low: pd.DataFrame, close: pd.DataFrame, length: int) -> pd.DataFrame:
+        previous_close = close.shift(1)
+        true_range = np.maximum(high - low, np.maximum((high - previous_close).abs(), (low - previous_close).abs()))
+        true_range.iloc[0] = np.nan
+        return self._rma_matrix(true_range, length)
+
+    def _apply_indicators_matrix(self, prices: Dict[str, pd.DataFrame], strategy_name: str,
+                                 parameters: dict) -> Dict[str, pd.DataFrame]:
+        """
+        Versão matricial de _apply_indicators: calcula os indicadores para todos os ativos e
+        descarta os candles de aquecimento (equivalente ao dropna do fluxo de um ativo).
+        """
+        close, high, low, volume = prices['close'], prices['high'], prices['low'], prices['volume']
+        indicators = {}
         
-        # Calcular os retornos do ativo
-        df['asset_returns'] = df['close'].pct_change()
+        if strategy_name == 'RSI_MACD':
+            indicators['rsi'] = self._rsi_matrix(close, int(parameters.get('rsi_period', 14)))
+            indicators['macd'] = self._ema_matrix(close, int(parameters.get('macd_fast', 12))) - \
+                self._ema_matrix(close, int(parameters.get('macd_slow', 26)))
+            indicators['macd_signal'] = self._ema_matrix(indicators['macd'], int(parameters.get('macd_signal', 9)))
+            
+        elif strategy_name == 'BOLLINGER_RSI':
+            bb_period = int(parameters.get('bb_period', 20))
+            bb_std = float(parameters.get('bb_std', 2.0))
+            middle = self._sma_matrix(close, bb_period)
+            deviation = close.rolling(window=bb_period).std(ddof=0)
+            indicators['bb_lower'] = middle - bb_std * deviation
+            indicators['bb_upper'] = middle + bb_std * deviation
+            indicators['rsi'] = self._rsi_matrix(close, int(parameters.get('rsi_period', 14)))
+            
+        elif strategy_name == 'MOVING_AVERAGE_CROSSOVER':
+            ma_type = parameters.get('ma_type', 'EMA')
+            moving_average = {'SMA': self._sma_matrix, 'EMA': self._ema_matrix, 'WMA': self._wma_matrix}[ma_type]
+            indicators['ma_short'] = moving_average(close, int(parameters.get('ma_short', 10)))
+            indicators['ma_long'] = moving_average(close, int(parameters.get('ma_long', 50)))
+            
+        elif strategy_name == 'MOMENTUM_BREAKOUT':
+            lookback_period = int(parameters.get('lookback_period', 20))
+            indicators['atr'] = self._atr_matrix(high, low, close, lookback_period)
+            indicators['high_max'] = high.rolling(window=lookback_period).max()
+            indicators['low_min'] = low.rolling(window=lookback_period).min()
+            indicators['volume_sma'] = self._sma_matrix(volume, lookback_period)
+            
+        elif strategy_name == 'MEAN_REVERSION':
+            lookback_period = int(parameters.get('lookback_period', 20))
+            price_mean = close.rolling(window=lookback_period).mean()
+            price_std = close.rolling(window=lookback_period).std()
+            indicators['z_score'] = (close - price_mean) / price_std
+            
+        elif strategy_name == 'RSI_Strategy':
+            indicators['rsi'] = self._rsi_matrix(close, int(parameters.get('rsi_period', 14)))
+            
+        else:
+            raise ValueError(f"Estratégia não implementada: {strategy_name}")
         
-        # Calcular os retornos da estratégia
-        df['strategy_returns'] = df['asset_returns'] * df['position']
+        valid = np.logical_and.reduce([frame.notna().all(axis=1).to_numpy() for frame in indicators.values()])
+        return {name: frame[valid] for name, frame in {**prices, **indicators}.items()}
+
+    def _generate_signals_matrix(self, data: Dict[str, pd.DataFrame], strategy_name: str,
+                                 parameters: dict) -> pd.DataFrame:
+        """Versão matricial de _generate_signals: devolve a matriz (tempo × ativo) de sinais."""
+        close, volume = data['close'], data['volume']
+        neutral = None
         
-        df.dropna(inplace=True)
-        return df
+        if strategy_name == 'RSI_MACD':
+            rsi, macd, macd_signal = data['rsi'], data['macd'], data['macd_signal']
+            macd_bullish = (macd > macd_signal) & (macd.shift(1) <= macd_signal.shift(1))
+            macd_bearish = (macd < macd_signal) & (macd.shift(1) >= macd_signal.shift(1))
+            buy = (rsi <= parameters.get('rsi_oversold', 30)) & macd_bullish
+            sell = (rsi >= parameters.get('rsi_overbought', 70)) & macd_bearish
+            
+        elif strategy_name == 'BOLLINGER_RSI':
+            rsi_threshold = parameters.get('rsi_threshold', 30)
+            buy = (close <= data['bb_lower']) & (data['rsi'] <= rsi_threshold)
+            sell = (close >= data['bb_upper']) & (data['rsi'] >= (100 - rsi_threshold))
+            
+        elif strategy_name == 'MOVING_AVERAGE_CROSSOVER':
+            short, long = data['ma_short'], data['ma_long']
+            buy = (short > long) & (short.shift(1) <= long.shift(1))
+            sell = (short < long) & (short.shift(1) >= long.shift(1))
+            
+        elif strategy_name == 'MOMENTUM_BREAKOUT':
+            breakout_threshold = float(parameters.get('breakout_threshold', 0.02))
+            volume_multiplier = float(parameters.get('volume_multiplier', 1.5))
+            volume_surge = volume > data['volume_sma'] * volume_multiplier
+            buy = (close > data['high_max'].shift(1) * (1 + breakout_threshold)) & volume_surge
+            sell = (close < data['low_min'].shift(1) * (1 - breakout_threshold)) & volume_surge
+            
+        elif strategy_name == 'MEAN_REVERSION':
+            z_score_entry = float(parameters.get('z_score_entry', 2.0))
+            z_score_exit = float(parameters.get('z_score_exit', 0.5))
+            z_score = data['z_score']
+            buy = z_score <= -z_score_entry
+            sell = z_score >= z_score_entry
+            neutral = ((z_score >= -z_score_exit) & (z_score.shift(1) < -z_score_exit)) | \
+                ((z_score <= z_score_exit) & (z_score.shift(1) > z_score_exit))
+            
+        else:  # RSI_Strategy
+            rsi = data['rsi']
+            oversold_level = parameters.get('rsi_oversold', 30)
+            overbought_level = parameters.get('rsi_overbought', 70)
+            buy = (rsi > oversold_level) & (rsi.shift(1) <= oversold_level)
+            sell = (rsi < overbought_level) & (rsi.shift(1) >= overbought_level)
+        
+        signals = pd.DataFrame(0, index=close.index, columns=close.columns)
+        signals = signals.mask(buy, 1).mask(sell, -1)
+        if neutral is not None:
+            signals = signals.mask(neutral, 0)
+        return signals
+
+    def _execute_simulation(self, df: pd.DataFrame, parameters: dict) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+        """
+        Executa a simulação trade a trade sobre as colunas do DataFrame.
+        Retorna o DataFrame com position/equity/strategy_returns e o livro de trades.
+        """
+        close = df['close'].to_numpy(dtype=float)
+        equity, position, trades = self._simulate_trades(
+            close,
+            df['open'].to_numpy(dtype=float) if 'open' in df.columns else close,
+            df['high'].to_numpy(dtype=float) if 'high' in df.columns else close,
+            df['low'].to_numpy(dtype=float) if 'low' in df.columns else close,
+            df['signal'].to_numpy(dtype=float),
+            parameters
+        )
+        
+        df['position'] = position
+        equity_frame = self._equity_frame(equity, df.index)
+        df['equity'] = equity_frame['equity']
+        df['strategy_returns'] = equity_frame['strategy_returns']
+        
+        return df, trades
+
+    def _simulate_trades(self, close: np.ndarray, open_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                         signal: np.ndarray, parameters: dict) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Simula as execuções trade a trade sobre arrays NumPy.
+        A posição desejada é o último sinal não nulo; a entrada ocorre no fechamento do candle do sinal
+        e a saída na reversão do sinal, no stop-loss/take-profit (intra-candle, com gap executado na
+        abertura) ou no fim dos dados. Taxas e slippage incidem em cada execução.
+        O laço percorre trades (não candles): cada iteração localiza a saída com operações vetorizadas.
+        Retorna a equity (NaN fora de trades), a posição por candle e o livro de trades.
+        """
+        settings = {**SIMULATION_DEFAULTS, **{key: parameters[key] for key in SIMULATION_DEFAULTS if key in parameters}}
+        fee_rate = float(settings['fee_rate'])
+        slippage = float(settings['slippage'])
+        stop_loss = float(settings['stop_loss']) if settings['stop_loss'] else None
+        take_profit = float(settings['take_profit']) if settings['take_profit'] else None
+        position_size = float(settings['position_size'])
+        
+        signal = np.sign(np.nan_to_num(signal)).astype(int)
+        n = len(close)
+        
+        # Posição desejada = último sinal não nulo (sinal 0 não fecha posição)
+        last_signal = np.maximum.accumulate(np.where(signal != 0, np.arange(n), -1))
+        target = np.where(last_signal >= 0, signal[np.maximum(last_signal, 0)], 0)
+        change_points = np.flatnonzero(target[1:] != target[:-1]) + 1
+        signal_bars = np.flatnonzero(signal != 0)
+        
+        equity = np.full(n, np.nan)
+        position = np.zeros(n)
+        ledger = {key: [] for key in ('entry_index', 'exit_index', 'direction', 'entry_price',
+                                      'exit_price', 'return_percent', 'exit_reason')}
+        capital = 1.0
+        entry = signal_bars[0] if len(signal_bars) else n
+        
+        while entry < n - 1:
+            direction = target[entry]
+            entry_price = close[entry] * (1 + direction * slippage)
+            
+            # Saída natural: próximo candle em que a posição desejada muda (ou fim dos dados)
+            k = np.searchsorted(change_points, entry, side='right')
+            exit_index = change_points[k] if k < len(change_points) else n - 1
+            exit_raw = close[exit_index]
+            exit_reason = 'signal' if k < len(change_points) else 'end_of_data'
+            
+            if stop_loss or take_profit:
+                window = slice(entry + 1, exit_index + 1)
+                adverse, favorable = (low[window], high[window]) if direction > 0 else (high[window], low[window])
+                stop_hits = np.zeros(exit_index - entry, dtype=bool)
+                take_hits = np.zeros(exit_index - entry, dtype=bool)
+                if stop_loss:
+                    stop_price = entry_price * (1 - direction * stop_loss)
+                    stop_hits = direction * (adverse - stop_price) <= 0
+                if take_profit:
+                    take_price = entry_price * (1 + direction * take_profit)
+                    take_hits = direction * (favorable - take_price) >= 0
+                
+                hits = stop_hits | take_hits
+                if hits.any():
+                    offset = int(np.argmax(hits))
+                    exit_index = entry + 1 + offset
+                    bar_open = open_[exit_index]
+                    # Stop e alvo no mesmo candle: assume o stop (conservador)
+                    if stop_hits[offset]:
+                        exit_raw = min(bar_open, stop_price) if direction > 0 else max(bar_open, stop_price)
+                        exit_reason = 'stop_loss'
+                    else:
+                        exit_raw = max(bar_open, take_price) if direction > 0 else min(bar_open, take_price)
+                        exit_reason = 'take_profit'
+            
+            exit_price = exit_raw * (1 - direction * slippage)
+            
+            # Equity marcada a mercado durante o trade (taxa de entrada já paga; de saída no último candle)
+            marks = close[entry:exit_index + 1].copy()
+            marks[-1] = exit_price
+            trade_returns = direction * (marks / entry_price - 1) - fee_rate
+            trade_returns[-1] -= fee_rate
+            equity[entry:exit_index + 1] = capital * (1 + position_size * trade_returns)
+            position[entry + 1:exit_index + 1] = direction
+            capital = equity[exit_index]
+            
+            ledger['entry_index'].append(entry)
+            ledger['exit_index'].append(exit_index)
+            ledger['direction'].append(direction)
+            ledger['entry_price'].append(entry_price)
+            ledger['exit_price'].append(exit_price)
+            ledger['return_percent'].append(trade_returns[-1] * 100)
+            ledger['exit_reason'].append(exit_reason)
+            
+            # Próxima entrada: primeiro sinal a partir do candle de saída (reversão no próprio candle)
+            next_signal = np.searchsorted(signal_bars, exit_index, side='left')
+            entry = signal_bars[next_signal] if next_signal < len(signal_bars) else n
+        
+        trades = {key: np.asarray(values) for key, values in ledger.items()}
+        trades['holding_bars'] = trades['exit_index'] - trades['entry_index'] if len(trades['entry_index']) else np.array([], dtype=int)
+        
+        return equity, position, trades
+
+    def _equity_frame(self, equity: np.ndarray, index: pd.Index) -> pd.DataFrame:
+        """Monta equity e retornos por candle; fora de trades a equity fica parada no último valor realizado."""
+        equity = pd.Series(equity, index=index).ffill().fillna(1.0)
+        strategy_returns = equity.pct_change().fillna(equity.iloc[0] - 1 if len(equity) else 0.0)
+        return pd.DataFrame({'equity': equity, 'strategy_returns': strategy_returns})
 
-    def _calculate_metrics(self, df: pd.DataFrame, annualization: int) -> Dict:
-        """Calcula as métricas de performance do backtest."""
+    def _calculate_metrics(self, df: pd.DataFrame, annualization: float,
+                           trades: Dict[str, np.ndarray]) -> Dict:
+        """Calcula as métricas de performance do backtest a partir da equity e do livro de trades."""
         if df.empty or 'strategy_returns' not in df.columns:
             return self._get_error_result("DataFrame vazio após simulação.")
 
         # Equity Curve e Drawdown
-        equity_curve = (1 + df['strategy_returns']).cumprod()
+        equity_curve = df['equity']
         running_max = equity_curve.cummax()
         drawdown = (equity_curve - running_max) / running_max
         
@@ -279,21 +685,41 @@ class BacktestingService:
         std_dev = df['strategy_returns'].std()
         sharpe_ratio = (mean_return / std_dev) * np.sqrt(annualization) if std_dev > 0 else 0
         
-        # Trades e Win Rate
-        trades = df['position'].diff().fillna(0).abs()
-        total_trades = int((trades > 0).sum() / 2) # Cada trade tem entrada e saída
-        
-        winning_trades = (df['strategy_returns'][df['position'] != df['position'].shift(1)] > 0).sum()
-        win_rate_percent = (winning_trades / total_trades) * 100 if total_trades > 0 else 0
+        # Trades e Win Rate (exatos, a partir do livro de trades)
+        total_trades = len(trades['return_percent'])
+        win_rate_percent = (trades['return_percent'] > 0).mean() * 100 if total_trades > 0 else 0
+        avg_holding_bars = trades['holding_bars'].mean() if total_trades > 0 else 0
 
         return {
             'total_trades': total_trades,
             'win_rate_percent': round(win_rate_percent, 2),
             'net_profit_percent': round(net_profit_percent, 2),
             'max_drawdown_percent': round(max_drawdown_percent, 2),
-            'sharpe_ratio': round(sharpe_ratio, 4)
+            'sharpe_ratio': round(sharpe_ratio, 4),
+            'avg_holding_bars': round(float(avg_holding_bars), 2)
         }
 
+    def _trades_to_records(self, df: pd.DataFrame, trades: Dict[str, np.ndarray]) -> list:
+        """Converte o livro de trades em uma lista de dicts serializável."""
+        index = df.index
+        records = []
+        for i in range(len(trades['return_percent'])):
+            entry_time = index[trades['entry_index'][i]]
+            exit_time = index[trades['exit_index'][i]]
+            records.append({
+                'entry_time': entry_time.isoformat() if hasattr(entry_time, 'isoformat') else str(entry_time),
+                'exit_time': exit_time.isoformat() if hasattr(exit_time, 'isoformat') else str(exit_time),
+                'direction': 'LONG' if trades['direction'][i] > 0 else 'SHORT',
+                'entry_price': round(float(trades['entry_price'][i]), 8),
+                'exit_price': round(float(trades['exit_price'][i]), 8),
+                'return_percent': round(float(trades['return_percent'][i]), 4),
+                'holding_bars': int(trades['holding_bars'][i]),
+                'holding_time_hours': round((exit_time - entry_time).total_seconds() / 3600, 2)
+                    if hasattr(exit_time - entry_time, 'total_seconds') else None,
+                'exit_reason': trades['exit_reason'][i]
+            })
+        return records
+
     def _calculate_fitness_score(self, metrics: dict) -> float:
         """Calcula uma pontuação única para o resultado do backtest."""
         # Fórmula idêntica à que estava na sua simulação para consistência
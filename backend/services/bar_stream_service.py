@@ -0,0 +1,194 @@
+"""
+Streaming de barras em tempo real para o datafeed do TradingView.
+Os preços buscados pelo PriceService (atualizações de ativos, sincronização de carteiras e a
+busca periódica deste serviço) são agregados em barras por (símbolo, resolução) e distribuídos
+a todos os clientes conectados. Existe uma única busca upstream para todos os símbolos assinados,
+independente da quantidade de clientes.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import orjson
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from services.price_service import PriceService
+
+logger = logging.getLogger(__name__)
+
+STREAM_POLL_INTERVAL_SECONDS = float(os.getenv("DATAFEED_STREAM_INTERVAL", 15))
+# Mensagens pendentes por cliente antes de descartar as mais antigas
+CLIENT_QUEUE_SIZE = 256
+WEEK_SECONDS = 7 * 86400
+# 01/01/1970 foi uma quinta-feira: as barras semanais começam na segunda-feira seguinte
+WEEK_OFFSET_SECONDS = 4 * 86400
+
+
+def bar_start(timestamp: float, bar_seconds: int) -> int:
+    """
+    Início (unix, segundos) da barra que contém o timestamp, em fronteiras UTC: as mesmas do
+    histórico (agregado com resample sobre o índice em UTC), então a última barra carregada
+    do histórico e as barras do streaming coincidem.
+    """
+    offset = WEEK_OFFSET_SECONDS if bar_seconds == WEEK_SECONDS else 0
+    return int((timestamp - offset) // bar_seconds * bar_seconds + offset)
+
+
+class BarStreamClient:
+    """Conexão de um cliente: fila de mensagens já serializadas e assinaturas ativas."""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.subscriptions: Set[Tuple[str, str]] = set()
+
+    def push(self, message: str) -> None:
+        if self.queue.full():
+            # Cliente lento: descarta a mensagem mais antiga (a atualização seguinte substitui a barra)
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class BarStreamHub:
+    """
+    Mantém a barra atual de cada (símbolo, resolução) assinado e a envia a cada novo preço.
+    Deve ser usado a partir do event loop da API; os preços podem chegar de qualquer thread.
+    """
+
+    def __init__(self, symbol_to_api_id: Dict[str, str], price_service: Optional[PriceService] = None,
+                 poll_interval: float = STREAM_POLL_INTERVAL_SECONDS):
+        self.symbol_to_api_id = symbol_to_api_id
+        self.price_service = price_service or PriceService()
+        self.poll_interval = poll_interval
+        # (símbolo, resolução) -> clientes, duração da barra e barra atual
+        self.subscribers: Dict[Tuple[str, str], Set[BarStreamClient]] = {}
+        self.bar_seconds: Dict[Tuple[str, str], int] = {}
+        self.bars: Dict[Tuple[str, str], dict] = {}
+        # api_id -> horário do último preço recebido (de qualquer origem)
+        self._last_price_at: Dict[str, float] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._upstream_task: Optional[asyncio.Task] = None
+        PriceService.add_price_listener(self.on_prices)
+
+    def connect(self) -> BarStreamClient:
+        self._loop = asyncio.get_running_loop()
+        return BarStreamClient()
+
+    def disconnect(self, client: BarStreamClient) -> None:
+        for symbol, resolution in list(client.subscriptions):
+            self.unsubscribe(client, symbol, resolution)
+
+    async def subscribe(self, client: BarStreamClient, symbol: str, resolution: str, bar_seconds: int,
+                        last_bar_loader: Optional[Callable[[], Optional[dict]]] = None) -> None:
+        """
+        Assina as barras de um símbolo/resolução.
+
+        Args:
+            last_bar_loader: Carrega a última barra do histórico (bloqueante: executado em uma thread);
+                chamado apenas na primeira assinatura do par, para que a barra em andamento continue
+                do ponto certo. Se falhar, a exceção é propagada e o par não fica registrado.
+        """
+        if symbol not in self.symbol_to_api_id:
+            raise ValueError(f"Unknown symbol: {symbol}")
+
+        key = (symbol, resolution)
+        if key not in self.subscribers:
+            last_bar = await asyncio.to_thread(last_bar_loader) if last_bar_loader else None
+            # Outro cliente pode ter registrado o par enquanto a barra era carregada
+            if key not in self.subscribers:
+                self.subscribers[key] = set()
+                self.bar_seconds[key] = bar_seconds
+                if last_bar:
+                    self.bars[key] = dict(last_bar)
+
+        self.subscribers[key].add(client)
+        client.subscriptions.add(key)
+        if key in self.bars:
+            client.push(self._serialize(key, self.bars[key]))
+        self._ensure_upstream()
+
+    def unsubscribe(self, client: BarStreamClient, symbol: str, resolution: str) -> None:
+        key = (symbol, resolution)
+        client.subscriptions.discard(key)
+        clients = self.subscribers.get(key)
+        if clients is None:
+            return
+        clients.discard(client)
+        if not clients:
+            del self.subscribers[key]
+            self.bar_seconds.pop(key, None)
+            self.bars.pop(key, None)
+
+    def on_prices(self, prices: Dict[str, float], timestamp: float) -> None:
+        """Ouvinte do PriceService: pode ser chamado de outra thread, então agenda no loop do hub."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._apply_prices, prices, timestamp)
+
+    def _apply_prices(self, prices: Dict[str, float], timestamp: float) -> None:
+        for api_id in prices:
+            self._last_price_at[api_id] = timestamp
+
+        for key, clients in list(self.subscribers.items()):
+            price = prices.get(self.symbol_to_api_id[key[0]])
+            if price is None:
+                continue
+            bar = self._update_bar(key, float(price), timestamp)
+            if bar is None:
+                continue
+            # Serializada uma vez e enviada a todos os clientes do par
+            message = self._serialize(key, bar)
+            for client in clients:
+                client.push(message)
+
+    def _update_bar(self, key: Tuple[str, str], price: float, timestamp: float) -> Optional[dict]:
+        start = bar_start(timestamp, self.bar_seconds[key])
+        bar = self.bars.get(key)
+
+        if bar is None or start > bar['time']:
+            # Nova barra abre no fechamento da anterior (sem gap artificial)
+            open_price = bar['close'] if bar else price
+            bar = {
+                'time': start,
+                'open': open_price,
+                'high': max(open_price, price),
+                'low': min(open_price, price),
+                'close': price,
+                'volume': 0.0  # A API de preços não fornece volume por barra
+            }
+            self.bars[key] = bar
+        elif start == bar['time']:
+            bar['high'] = max(bar['high'], price)
+            bar['low'] = min(bar['low'], price)
+            bar['close'] = price
+        else:
+            # Preço atrasado de uma barra já encerrada: não reabre a barra anterior nem envia nada
+            logger.debug(f"Preço de {key} anterior à barra atual ignorado ({start} < {bar['time']})")
+            return None
+        return bar
+
+    def _serialize(self, key: Tuple[str, str], bar: dict) -> str:
+        return orjson.dumps({'symbol': key[0], 'resolution': key[1], 'bar': bar}).decode()
+
+    def _ensure_upstream(self) -> None:
+        if self._upstream_task is None or self._upstream_task.done():
+            self._upstream_task = asyncio.get_running_loop().create_task(self._poll_upstream())
+
+    async def _poll_upstream(self) -> None:
+        """
+        Única busca upstream: um pedido de preços para todos os símbolos assinados, apenas para os
+        que não receberam preço de outra origem no último intervalo. Encerra sem assinantes.
+        """
+        while self.subscribers:
+            now = time.time()
+            api_ids = sorted({
+                self.symbol_to_api_id[symbol] for symbol, _ in self.subscribers
+                if now - self._last_price_at.get(self.symbol_to_api_id[symbol], 0.0) >= self.poll_interval
+            })
+            if api_ids:
+                try:
+                    # Os preços chegam aos clientes via on_prices
+                    await self.price_service.get_crypto_prices_in_usd(api_ids)
+                except Exception as e:
+                    logger.error(f"Erro ao buscar preços para o streaming: {e}")
+            await asyncio.sleep(self.poll_interval)
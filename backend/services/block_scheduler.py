@@ -0,0 +1,75 @@
+"""
+Agendamento por bloco para os loops do Keeper e do Worker de trade
+Em vez de dormir um intervalo fixo, os loops acordam a cada bloco novo (consulta leve de
+eth_blockNumber: os provedores HTTP não oferecem assinatura de cabeçalhos). Os registros do
+banco (vaults, carteiras) ficam em cache e só são recarregados quando uma consulta barata de
+contagem/maior ID/checksum do conteúdo indica mudança.
+"""
+
+import os
+import time
+import logging
+from typing import Any, Callable, List, Optional
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre consultas de eth_blockNumber (Polygon produz um bloco a cada ~2s)
+BLOCK_POLL_INTERVAL_SECONDS = float(os.getenv("BLOCK_POLL_INTERVAL_SECONDS", 1))
+# Intervalo mínimo entre verificações de mudança nos registros do banco
+REGISTRY_REFRESH_SECONDS = float(os.getenv("REGISTRY_REFRESH_SECONDS", 30))
+
+
+class BlockWatcher:
+    def __init__(self, w3: Web3, poll_interval: float = BLOCK_POLL_INTERVAL_SECONDS):
+        self.w3 = w3
+        self.poll_interval = poll_interval
+        self.last_block: Optional[int] = None
+
+    def wait_for_new_block(self) -> int:
+        """Bloqueia até surgir um bloco depois do último retornado e devolve o número dele."""
+        while True:
+            block_number = self.w3.eth.block_number
+            if self.last_block is None or block_number > self.last_block:
+                self.last_block = block_number
+                return block_number
+            time.sleep(self.poll_interval)
+
+
+class RegistryCache:
+    """
+    Lista de registros do banco mantida em memória.
+
+    Args:
+        loader: Carrega a lista completa
+        fingerprint: Consulta barata que muda quando a lista muda (ex: contagem, maior ID e checksum)
+        on_change: Chamado com (lista anterior, lista nova) sempre que a lista é recarregada
+    """
+
+    def __init__(self, loader: Callable[[], List[dict]], fingerprint: Callable[[], Any],
+                 on_change: Optional[Callable[[List[dict], List[dict]], None]] = None,
+                 refresh_seconds: float = REGISTRY_REFRESH_SECONDS):
+        self.loader = loader
+        self.fingerprint = fingerprint
+        self.on_change = on_change
+        self.refresh_seconds = refresh_seconds
+        self.items: List[dict] = []
+        self._fingerprint: Any = None
+        self._checked_at = 0.0
+
+    def get(self) -> List[dict]:
+        if self._fingerprint is not None and time.time() - self._checked_at < self.refresh_seconds:
+            return self.items
+
+        fingerprint = self.fingerprint()
+        self._checked_at = time.time()
+        if fingerprint != self._fingerprint:
+            previous, self.items = self.items, self.loader()
+            self._fingerprint = fingerprint
+            logger.info(f"Registro recarregado: {len(self.items)} itens")
+            if self.on_change:
+                self.on_change(previous, self.items)
+        return self.items
+
+    def invalidate(self) -> None:
+        self._fingerprint = None
@@ -36,6 +36,24 @@ class DatabaseService:
         
         self._initialized = True
 
+    @classmethod
+    def dedicated(cls) -> 'DatabaseService':
+        """
+        Instância fora do singleton, com conexão própria: para trabalho executado em outra thread
+        (ex: asyncio.to_thread), já que a conexão compartilhada não é thread-safe. Fechar com close().
+        """
+        instance = super(DatabaseService, cls).__new__(cls)
+        instance._initialized = False
+        instance.__init__()
+        return instance
+
+    def close(self):
+        """Fecha a conexão (usado pelas instâncias dedicadas)."""
+        try:
+            self.connection.close()
+        except Exception as e:
+            print(f"Erro ao fechar conexão: {e}")
+
     def ensure_connection(self):
         """Garante que a conexão está ativa, reconectando se necessário"""
         try:
@@ -238,4 +256,19 @@ class DatabaseService:
         cursor.execute(query)
         vaults = cursor.fetchall()
         cursor.close()
-        return vaults
\ No newline at end of file
+        return vaults
+
+    def get_table_fingerprint(self, table: str, columns: tuple = ()) -> tuple:
+        """
+        Contagem, maior ID e checksum do conteúdo de uma tabela (vaults, carteiras): muda quando
+        registros são incluídos, removidos ou quando alguma das colunas informadas é alterada.
+        """
+        content = ", ".join(["id"] + [f"COALESCE(`{column}`, '')" for column in columns])
+        cursor = self.connection.cursor()
+        cursor.execute(f"""
+            SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', {content}))), 0)
+            FROM `{table}`
+        """)
+        fingerprint = cursor.fetchone()
+        cursor.close()
+        return tuple(fingerprint)
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""
+Backfill concorrente de dados históricos para vários ativos.
+Divide o período em janelas compatíveis com a API do CoinGecko, busca as janelas em threads
+sob um limite de chamadas compartilhado e grava cada uma pelo carregador em massa
+(HistoricalDataService.bulk_load). Janelas concluídas ficam registradas no índice de
+cobertura (historical_data_coverage), então uma execução interrompida retoma de onde parou.
+"""
+
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from services.historical_data_service import (
+    HistoricalDataService, RateLimiter, RESAMPLE_RULES, NATIVE_TIMEFRAMES
+)
+
+logger = logging.getLogger(__name__)
+
+# Limite do plano gratuito do CoinGecko (com folga)
+COINGECKO_CALLS_PER_MINUTE = float(os.getenv("COINGECKO_CALLS_PER_MINUTE", 25))
+BACKFILL_CONCURRENCY = int(os.getenv("HISTORICAL_BACKFILL_CONCURRENCY", 4))
+# Tamanho das janelas por timeframe: o CoinGecko só devolve pontos horários em intervalos de até 90 dias
+WINDOW_DAYS = {'1h': 90, '1d': 365}
+
+
+class HistoricalBackfillService:
+    """
+    Planeja e executa o backfill: as threads apenas buscam na API; a gravação acontece na
+    thread principal, pois a conexão do DatabaseService é compartilhada.
+    """
+
+    def __init__(self, data_service: Optional[HistoricalDataService] = None,
+                 max_concurrency: int = BACKFILL_CONCURRENCY,
+                 calls_per_minute: float = COINGECKO_CALLS_PER_MINUTE):
+        self.data_service = data_service or HistoricalDataService()
+        if self.data_service.rate_limiter is None:
+            self.data_service.rate_limiter = RateLimiter(calls_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+
+    @staticmethod
+    def storage_timeframe(timeframe: str) -> str:
+        """Timeframe efetivamente armazenado (timeframes derivados são agregados a partir da origem)."""
+        if timeframe in NATIVE_TIMEFRAMES:
+            return timeframe
+        if timeframe in RESAMPLE_RULES:
+            return RESAMPLE_RULES[timeframe][1][-1]
+        raise ValueError(f"Unsupported timeframe '{timeframe}'")
+
+    def plan(self, asset_symbols: List[str], timeframes: List[str], start_date: date, end_date: date,
+             force: bool = False) -> List[Dict]:
+        """
+        Monta a lista de janelas a carregar, pulando as já registradas no índice de cobertura.
+
+        Returns:
+            Lista de dicts com asset_symbol, timeframe, window_start e window_end (exclusivo)
+        """
+        unknown = [symbol for symbol in asset_symbols if symbol not in self.data_service.symbol_to_coingecko_id]
+        if unknown:
+            raise ValueError(f"Unknown asset symbols: {', '.join(unknown)}")
+        if start_date > end_date:
+            raise ValueError("start_date must be before end_date")
+
+        storage_timeframes = list(dict.fromkeys(self.storage_timeframe(tf) for tf in timeframes))
+        windows = []
+        for timeframe in storage_timeframes:
+            covered = set() if force else self.data_service.get_covered_windows(asset_symbols, timeframe)
+            step = timedelta(days=WINDOW_DAYS[timeframe])
+            for symbol in asset_symbols:
+                window_start = start_date
+                while window_start <= end_date:
+                    window_end = min(window_start + step, end_date + timedelta(days=1))
+                    if (symbol, window_start, window_end) not in covered:
+                        windows.append({
+                            'asset_symbol': symbol,
+                            'timeframe': timeframe,
+                            'window_start': window_start,
+                            'window_end': window_end
+                        })
+                    window_start = window_end
+        return windows
+
+    def run(self, asset_symbols: List[str], timeframes: List[str], start_date: date, end_date: date,
+            force: bool = False, batch_size: Optional[int] = None, method: Optional[str] = None) -> Dict:
+        """
+        Executa o backfill.
+
+        Args:
+            asset_symbols: Ativos a carregar
+            timeframes: Timeframes desejados (4h e 1w carregam a origem 1h/1d)
+            start_date, end_date: Período (inclusivo)
+            force: Recarrega janelas já cobertas
+            batch_size, method: Repassados ao bulk_load
+
+        Returns:
+            Resumo com janelas planejadas, carregadas, vazias e com falha, linhas e tempo total
+        """
+        started = time.perf_counter()
+        windows = self.plan(asset_symbols, timeframes, start_date, end_date, force)
+        summary = {'planned': len(windows), 'loaded': 0, 'empty': 0, 'failed': 0, 'rows': 0, 'failures': []}
+        logger.info(f"Backfill: {len(windows)} janelas para {len(asset_symbols)} ativos "
+                    f"({self.max_concurrency} threads)")
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='backfill') as executor:
+            futures = {executor.submit(self._fetch_window, window): window for window in windows}
+            for future in as_completed(futures):
+                window = futures[future]
+                label = f"{window['asset_symbol']} {window['timeframe']} {window['window_start']} - {window['window_end']}"
+                try:
+                    rows = self._store_window(window, future.result(), batch_size, method)
+                except Exception as e:
+                    logger.error(f"Falha no backfill de {label}: {str(e)}")
+                    summary['failed'] += 1
+                    summary['failures'].append({**window, 'error': str(e)})
+                    continue
+
+                if rows:
+                    summary['loaded'] += 1
+                    summary['rows'] += rows
+                else:
+                    summary['empty'] += 1
+                logger.info(f"Janela {label}: {rows} linhas")
+
+        summary['seconds'] = round(time.perf_counter() - started, 2)
+        summary['rows_per_second'] = round(summary['rows'] / summary['seconds'], 1) if summary['seconds'] > 0 else None
+        return summary
+
+    def _fetch_window(self, window: Dict):
+        """
+        Busca uma janela na API (executado nas threads; o limite de chamadas é compartilhado).
+        Janela sem preços (ex: antes da listagem do ativo) volta como DataFrame vazio e é registrada
+        como coberta com 0 linhas; apenas falhas da requisição contam como erro.
+        """
+        df = self.data_service._fetch_from_api(
+            window['asset_symbol'], window['timeframe'], window['window_start'], window['window_end']
+        )
+        if df is None:
+            raise RuntimeError("API request failed")
+        return df
+
+    def _store_window(self, window: Dict, df, batch_size: Optional[int], method: Optional[str]) -> int:
+        """Grava a janela e a registra como coberta quando ela já está totalmente no passado."""
+        rows = 0
+        if not df.empty:
+            rows = self.data_service.bulk_load(
+                window['asset_symbol'], window['timeframe'], df, batch_size=batch_size, method=method
+            )['rows']
+
+        # A janela que inclui hoje ainda vai receber candles: fica fora do índice e é recarregada na próxima execução
+        if window['window_end'] <= date.today():
+            self.data_service.mark_window_covered(
+                window['asset_symbol'], window['timeframe'], window['window_start'], window['window_end'], rows
+            )
+        return rows
@@ -7,21 +7,92 @@ import pandas as pd
 import numpy as np
 import requests
 import logging
-from datetime import date, datetime, timedelta
-from typing import Dict, Optional, List
+import os
+import itertools
+import tempfile
+import threading
+import mysql.connector
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, Optional, List, Union
 from services.database_service import DatabaseService
+from services.synthetic_data_service import OHLC_SYNTHESIZERS
 import time
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+# Timeframes derivados por agregação: regra de resample do pandas e timeframes de origem,
+# do mais fino para o mais grosso. Apenas a resolução de origem é buscada na API e armazenada.
+RESAMPLE_RULES = {
+    '4h': ('4H', ['1h']),
+    '1d': ('D', ['1h']),
+    '1w': ('W-MON', ['1h', '1d'])
+}
+# Timeframes que a API fornece diretamente (usados quando não há origem mais fina em cache)
+NATIVE_TIMEFRAMES = ('1h', '1d')
+# Quantidade de séries agregadas mantidas em memória
+RESAMPLE_CACHE_SIZE = 32
+
+# Carga em massa: linhas por transação e método ('insert' = INSERT multi-linha, 'load_data' = LOAD DATA LOCAL INFILE)
+BULK_BATCH_SIZE = int(os.getenv("HISTORICAL_BULK_BATCH_SIZE", 5000))
+BULK_LOAD_METHOD = os.getenv("HISTORICAL_BULK_METHOD", "insert")
+PRICE_COLUMNS = ['asset_symbol', 'timeframe', 'date', 'open_price', 'high_price', 'low_price', 'close_price', 'volume']
+
+
+class RateLimiter:
+    """
+    Limite de chamadas por minuto compartilhado entre threads: cada chamada reserva o próximo
+    horário livre, espaçando as requisições de forma uniforme.
+    """
+    
+    def __init__(self, calls_per_minute: float):
+        if calls_per_minute <= 0:
+            raise ValueError("calls_per_minute must be > 0")
+        self.interval = 60.0 / calls_per_minute
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+    
+    def acquire(self) -> None:
+        """Bloqueia até o horário reservado para esta chamada."""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+    
+    def pause(self, seconds: float) -> None:
+        """Adia todas as próximas chamadas (ex: após um 429 do provedor)."""
+        with self._lock:
+            self._next_call = max(self._next_call, time.monotonic() + seconds)
+
+
 class HistoricalDataService:
     """
     Serviço responsável por buscar dados históricos de preços com sistema de cache.
     Usa CoinGecko como fonte principal de dados.
     """
     
-    def __init__(self, db_service=None):
-        self.db_service = DatabaseService()
+    def __init__(self, db_service=None, ohlc_synthesizer: Union[str, Callable] = 'random',
+                 ohlc_seed: Optional[int] = None, rate_limiter: Optional[RateLimiter] = None):
+        """
+        Args:
+            db_service: Conexão a usar (ex: DatabaseService.dedicated() em outra thread); padrão: o singleton
+            ohlc_synthesizer: Nome em OHLC_SYNTHESIZERS ou função (df, timeframe, rng) -> df usada para
+                montar OHLC a partir dos preços intraday do CoinGecko
+            ohlc_seed: Semente da síntese de OHLC (None = aleatória a cada chamada)
+            rate_limiter: Limite de chamadas à API do CoinGecko (compartilhado entre threads)
+        """
+        self.db_service = db_service or DatabaseService()
+        if isinstance(ohlc_synthesizer, str):
+            if ohlc_synthesizer not in OHLC_SYNTHESIZERS:
+                raise ValueError(f"Unknown OHLC synthesizer '{ohlc_synthesizer}'. Use one of: {', '.join(OHLC_SYNTHESIZERS)}")
+            ohlc_synthesizer = OHLC_SYNTHESIZERS[ohlc_synthesizer]
+        self.ohlc_synthesizer = ohlc_synthesizer
+        self.ohlc_seed = ohlc_seed
+        self.rate_limiter = rate_limiter
+        # Séries agregadas recentes: (símbolo, timeframe, início, fim) -> (último candle da origem, df)
+        self._resample_cache = OrderedDict()
         # URLs da API do CoinGecko
         self.coingecko_base_url = "https://api.coingecko.com/api/v3"
         
@@ -62,6 +133,15 @@ class HistoricalDataService:
         try:
             logger.info(f"Buscando dados históricos: {asset_symbol} {timeframe} {start_date} - {end_date}")
             
+            # 0. Timeframes mais grossos são derivados da resolução mais fina disponível
+            if timeframe in RESAMPLE_RULES:
+                derived_data = self._get_derived_data(asset_symbol, timeframe, start_date, end_date)
+                if derived_data is not None:
+                    return derived_data
+                if timeframe not in NATIVE_TIMEFRAMES:
+                    logger.warning(f"Nenhum dado disponível para {asset_symbol} {timeframe} no período {start_date} - {end_date}")
+                    return None
+            
             # 1. Verificar se temos dados em cache
             cached_data = self._get_cached_data(asset_symbol, timeframe, start_date, end_date)
             
@@ -102,6 +182,146 @@ class HistoricalDataService:
             logger.error(f"Erro ao buscar dados históricos: {str(e)}")
             return None
 
+    def _get_derived_data(self, asset_symbol: str, timeframe: str, start_date: date,
+                          end_date: date) -> Optional[pd.DataFrame]:
+        """
+        Monta candles de um timeframe grosso agregando a resolução mais fina que cobre o período.
+        Sem origem em cache, timeframes não nativos buscam a origem na API (e só ela é armazenada).
+        """
+        rule, sources = RESAMPLE_RULES[timeframe]
+        
+        for source in sources:
+            base_data = self._get_cached_data(asset_symbol, source, start_date, end_date)
+            if base_data is not None and not base_data.empty and \
+                    not self._identify_missing_dates(base_data, start_date, end_date, source):
+                return self._resample_cached(asset_symbol, timeframe, start_date, end_date, base_data, rule)
+        
+        if timeframe in NATIVE_TIMEFRAMES:
+            return None
+        
+        base_data = self.get_historical_data(asset_symbol, sources[-1], start_date, end_date)
+        if base_data is None or base_data.empty:
+            return None
+        return self._resample_cached(asset_symbol, timeframe, start_date, end_date, base_data, rule)
+
+    def _resample_cached(self, asset_symbol: str, timeframe: str, start_date: date, end_date: date,
+                         base_data: pd.DataFrame, rule: str) -> pd.DataFrame:
+        """Agrega a série de origem, reaproveitando o resultado enquanto a origem não mudar."""
+        key = (asset_symbol, timeframe, start_date, end_date)
+        version = (len(base_data), base_data.index[-1])
+        
+        cached = self._resample_cache.get(key)
+        if cached is not None and cached[0] == version:
+            self._resample_cache.move_to_end(key)
+            return cached[1]
+        
+        resampled = self.resample_ohlcv(base_data, rule)
+        self._resample_cache[key] = (version, resampled)
+        if len(self._resample_cache) > RESAMPLE_CACHE_SIZE:
+            self._resample_cache.popitem(last=False)
+        
+        logger.info(f"Derivados {len(resampled)} candles {timeframe} a partir de {len(base_data)} candles")
+        return resampled
+
+    @staticmethod
+    def resample_ohlcv(df: pd.DataFrame, rule: str) -> pd.DataFrame:
+        """
+        Agrega candles OHLCV para uma regra de resample do pandas (ex: '4H', 'D', 'W-MON').
+        Intervalos sem candles de origem são descartados.
+        """
+        resampled = df.resample(rule, label='left', closed='left').agg({
+            'open': 'first',
+            'high': 'max',
+            'low': 'min',
+            'close': 'last',
+            'volume': 'sum'
+        })
+        return resampled.dropna(subset=['close'])
+
+    def get_price_matrix(self, asset_symbols: List[str], timeframe: str, start_date: date,
+                         end_date: date) -> Optional[Dict[str, pd.DataFrame]]:
+        """
+        Carrega vários ativos de uma vez e alinha os candles em matrizes (tempo × ativo).
+        
+        Args:
+            asset_symbols: Símbolos dos ativos (ex: ['BTCUSDT', 'ETHUSDT'])
+            timeframe: Timeframe (1d, 4h, 1h)
+            start_date: Data de início
+            end_date: Data de fim
+            
+        Returns:
+            Dict com as chaves open, high, low, close e volume; cada valor é um DataFrame
+            indexado pelas datas comuns a todos os ativos, com uma coluna por símbolo
+        """
+        try:
+            # 1. Uma única consulta ao cache para todos os ativos
+            frames = self._get_cached_data_multi(asset_symbols, timeframe, start_date, end_date)
+            
+            # 2. Ativos com lacunas passam pelo fluxo normal (API + cache)
+            for symbol in asset_symbols:
+                if self._identify_missing_dates(frames.get(symbol), start_date, end_date, timeframe):
+                    frames[symbol] = self.get_historical_data(symbol, timeframe, start_date, end_date)
+            
+            missing = [symbol for symbol in asset_symbols if frames.get(symbol) is None or frames[symbol].empty]
+            if missing:
+                logger.warning(f"Sem dados para {', '.join(missing)} no período {start_date} - {end_date}")
+            
+            available = [symbol for symbol in asset_symbols if symbol not in missing]
+            if not available:
+                return None
+            
+            # 3. Alinhar pelas datas presentes em todos os ativos
+            combined = pd.concat({symbol: frames[symbol] for symbol in available}, axis=1, join='inner')
+            
+            matrix = {
+                field: combined.xs(field, axis=1, level=1)[available]
+                for field in ['open', 'high', 'low', 'close', 'volume']
+            }
+            logger.info(f"Matriz de preços: {len(combined)} candles x {len(available)} ativos")
+            return matrix
+            
+        except Exception as e:
+            logger.error(f"Erro ao montar matriz de preços: {str(e)}")
+            return None
+
+    def _get_cached_data_multi(self, asset_symbols: List[str], timeframe: str, start_date: date,
+                               end_date: date) -> Dict[str, pd.DataFrame]:
+        """Busca em cache os dados de vários ativos com uma única consulta."""
+        try:
+            self.db_service.ensure_connection()
+            cursor = self.db_service.connection.cursor(dictionary=True)
+            
+            placeholders = ', '.join(['%s'] * len(asset_symbols))
+            query = f"""
+                SELECT asset_symbol, date, open_price as `open`, high_price as `high`, 
+                       low_price as `low`, close_price as `close`, volume
+                FROM historical_price_data 
+                WHERE asset_symbol IN ({placeholders}) AND timeframe = %s 
+                  AND date >= %s AND date < %s
+                ORDER BY asset_symbol, date
+            """
+            cursor.execute(query, (*asset_symbols, timeframe, start_date, end_date + timedelta(days=1)))
+            rows = cursor.fetchall()
+            cursor.close()
+            
+            if not rows:
+                return {}
+            
+            df = pd.DataFrame(rows)
+            df['date'] = pd.to_datetime(df['date'])
+            for col in ['open', 'high', 'low', 'close', 'volume']:
+                df[col] = df[col].astype(float)
+            
+            logger.info(f"Carregados {len(df)} pontos do cache para {df['asset_symbol'].nunique()} ativos")
+            return {
+                symbol: group.drop(columns='asset_symbol').set_index('date')
+                for symbol, group in df.groupby('asset_symbol', sort=False)
+            }
+            
+        except Exception as e:
+            logger.error(f"Erro ao buscar dados em cache: {str(e)}")
+            return {}
+
     def _get_cached_data(self, asset_symbol: str, timeframe: str, start_date: date, end_date: date) -> Optional[pd.DataFrame]:
         """Busca dados em cache no banco de dados."""
         try:
@@ -113,10 +333,11 @@ class HistoricalDataService:
                        low_price as `low`, close_price as `close`, volume
                 FROM historical_price_data 
                 WHERE asset_symbol = %s AND timeframe = %s 
-                  AND date >= %s AND date <= %s
+                  AND date >= %s AND date < %s
                 ORDER BY date
             """
-            cursor.execute(query, (asset_symbol, timeframe, start_date, end_date))
+            # date guarda data/hora do candle: o dia final inteiro entra no período
+            cursor.execute(query, (asset_symbol, timeframe, start_date, end_date + timedelta(days=1)))
             rows = cursor.fetchall()
             cursor.close()
             
@@ -162,7 +383,12 @@ class HistoricalDataService:
         return missing_dates
 
     def _fetch_from_api(self, asset_symbol: str, timeframe: str, start_date: date, end_date: date) -> Optional[pd.DataFrame]:
-        """Busca dados da API do CoinGecko."""
+        """
+        Busca dados da API do CoinGecko.
+        Retorna um DataFrame vazio quando a API responde sem preços no período (ex: antes da listagem
+        do ativo) e None apenas quando a requisição falha. Os candles são indexados em horário UTC
+        (sem fuso no índice, como na coluna DATETIME), o mesmo usado pelo datafeed e pelo streaming.
+        """
         try:
             # Mapear símbolo para ID do CoinGecko 
             coingecko_id = self.symbol_to_coingecko_id.get(asset_symbol)
@@ -170,9 +396,9 @@ class HistoricalDataService:
                 logger.error(f"Símbolo {asset_symbol} não encontrado no mapeamento CoinGecko")
                 return None
             
-            # Calcular timestamps Unix
-            start_timestamp = int(datetime.combine(start_date, datetime.min.time()).timestamp())
-            end_timestamp = int(datetime.combine(end_date, datetime.min.time()).timestamp())
+            # Calcular timestamps Unix (dias em UTC)
+            start_timestamp = int(datetime.combine(start_date, datetime.min.time(), tzinfo=timezone.utc).timestamp())
+            end_timestamp = int(datetime.combine(end_date, datetime.min.time(), tzinfo=timezone.utc).timestamp())
             
             # URL da API CoinGecko para dados históricos
             url = f"{self.coingecko_base_url}/coins/{coingecko_id}/market_chart/range"
@@ -183,11 +409,18 @@ class HistoricalDataService:
             }
             
             logger.info(f"Chamando CoinGecko API: {url}")
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
             response = requests.get(url, params=params, timeout=30)
             
             if response.status_code == 429:  # Rate limit
                 logger.warning("Rate limit atingido, aguardando...")
-                time.sleep(60)  # Aguardar 1 minuto
+                if self.rate_limiter:
+                    # Pausa todas as threads que compartilham o limite
+                    self.rate_limiter.pause(60)
+                    self.rate_limiter.acquire()
+                else:
+                    time.sleep(60)  # Aguardar 1 minuto
                 response = requests.get(url, params=params, timeout=30)
             
             response.raise_for_status()
@@ -196,14 +429,14 @@ class HistoricalDataService:
             # Processar dados da resposta
             if 'prices' not in data or not data['prices']:
                 logger.warning(f"Nenhum dado de preço recebido da API para {asset_symbol}")
-                return None
+                return self._empty_prices()
             
             # Converter para DataFrame
             prices = data['prices']
             
             df_data = []
             for i, [timestamp, price] in enumerate(prices):
-                dt = datetime.fromtimestamp(timestamp / 1000)
+                dt = datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc).replace(tzinfo=None)
                 
                 # Para dados diários, usar apenas um ponto por dia
                 if timeframe == '1d':
@@ -219,7 +452,7 @@ class HistoricalDataService:
                 })
             
             if not df_data:
-                return None
+                return self._empty_prices()
             
             df = pd.DataFrame(df_data)
             df.set_index('date', inplace=True)
@@ -238,38 +471,21 @@ class HistoricalDataService:
             logger.error(f"Erro ao processar dados da API: {str(e)}")
             return None
 
+    @staticmethod
+    def _empty_prices() -> pd.DataFrame:
+        """Resultado da API sem candles no período (não é uma falha)."""
+        return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'],
+                            index=pd.DatetimeIndex([], name='date'), dtype=float)
+
     def _simulate_ohlc_data(self, df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
         """
         Simula dados OHLC mais realistas baseados nos preços disponíveis.
         Para uso em backtesting quando dados detalhados não estão disponíveis.
+        A síntese é vetorizada (uma amostragem por coluna) e delegada a self.ohlc_synthesizer.
         """
         try:
-            df_copy = df.copy()
-            
-            for i in range(len(df_copy)):
-                base_price = df_copy.iloc[i]['close']
-                
-                # Simular volatilidade baseada no timeframe
-                volatility = 0.02 if timeframe == '1d' else 0.01  # 2% para daily, 1% para intraday
-                
-                # Gerar variação aleatória
-                variation = np.random.normal(0, volatility)
-                high_var = abs(np.random.normal(0, volatility/2))
-                low_var = abs(np.random.normal(0, volatility/2))
-                
-                # Calcular OHLC
-                open_price = base_price * (1 + variation)
-                high_price = max(open_price, base_price) * (1 + high_var)
-                low_price = min(open_price, base_price) * (1 - low_var)
-                close_price = base_price
-                
-                df_copy.iloc[i, df_copy.columns.get_loc('open')] = open_price
-                df_copy.iloc[i, df_copy.columns.get_loc('high')] = high_price
-                df_copy.iloc[i, df_copy.columns.get_loc('low')] = low_price
-                df_copy.iloc[i, df_copy.columns.get_loc('close')] = close_price
-                df_copy.iloc[i, df_copy.columns.get_loc('volume')] = np.random.randint(100000, 1000000)
-            
-            return df_copy
+            rng = np.random.default_rng(self.ohlc_seed)
+            return self.ohlc_synthesizer(df, timeframe, rng)
             
         except Exception as e:
             logger.error(f"Erro ao simular dados OHLC: {str(e)}")
@@ -278,46 +494,175 @@ class HistoricalDataService:
     def _save_to_cache(self, asset_symbol: str, timeframe: str, df: pd.DataFrame) -> None:
         """Salva dados no cache do banco de dados."""
         try:
-            self.db_service.ensure_connection()
-            cursor = self.db_service.connection.cursor()
-            
-            # Preparar dados para inserção
-            insert_data = []
-            for date_index, row in df.iterrows():
-                insert_data.append((
-                    asset_symbol,
-                    timeframe,
-                    date_index.date(),
-                    float(row['open']),
-                    float(row['high']),
-                    float(row['low']),
-                    float(row['close']),
-                    float(row['volume'])
-                ))
-            
-            # Inserção em lote com ON DUPLICATE KEY UPDATE
-            query = """
-                INSERT INTO historical_price_data 
-                (asset_symbol, timeframe, date, open_price, high_price, low_price, close_price, volume)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    open_price = VALUES(open_price),
-                    high_price = VALUES(high_price),
-                    low_price = VALUES(low_price),
-                    close_price = VALUES(close_price),
-                    volume = VALUES(volume),
-                    updated_at = CURRENT_TIMESTAMP
-            """
+            self.bulk_load(asset_symbol, timeframe, df)
+        except Exception as e:
+            logger.error(f"Erro ao salvar dados no cache: {str(e)}")
+
+    def bulk_load(self, asset_symbol: str, timeframe: str, df: pd.DataFrame,
+                  batch_size: Optional[int] = None, method: Optional[str] = None) -> Dict:
+        """
+        Grava candles em historical_price_data em blocos, com uma transação curta por bloco.
+        
+        Args:
+            asset_symbol: Símbolo do ativo
+            timeframe: Timeframe dos candles
+            df: DataFrame com colunas [open, high, low, close, volume] e índice de datas
+            batch_size: Linhas por bloco (padrão HISTORICAL_BULK_BATCH_SIZE)
+            method: 'insert' (INSERT multi-linha com ON DUPLICATE KEY UPDATE) ou
+                'load_data' (LOAD DATA LOCAL INFILE; exige local_infile habilitado no servidor)
             
-            cursor.executemany(query, insert_data)
-            self.db_service.connection.commit()
+        Returns:
+            Dict com rows, seconds, rows_per_second e method
+        """
+        batch_size = batch_size or BULK_BATCH_SIZE
+        method = method or BULK_LOAD_METHOD
+        if method not in ('insert', 'load_data'):
+            raise ValueError(f"Unknown bulk load method '{method}'. Use 'insert' or 'load_data'")
+        
+        started = time.perf_counter()
+        frame = self._to_price_frame(asset_symbol, timeframe, df)
+        
+        if method == 'load_data':
+            self._load_data_infile(frame, batch_size)
+        else:
+            self._insert_batches(frame, batch_size)
+        
+        elapsed = time.perf_counter() - started
+        stats = {
+            'rows': len(frame),
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(len(frame) / elapsed, 1) if elapsed > 0 else None,
+            'method': method
+        }
+        logger.info(f"Salvos {stats['rows']} pontos de {asset_symbol} {timeframe} em {stats['seconds']}s "
+                    f"({stats['rows_per_second']} linhas/s, {method})")
+        return stats
+
+    def _to_price_frame(self, asset_symbol: str, timeframe: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Converte os candles para as colunas da tabela com operações vetorizadas (sem iterrows)."""
+        frame = pd.DataFrame({
+            'asset_symbol': asset_symbol,
+            'timeframe': timeframe,
+            'date': pd.DatetimeIndex(df.index).strftime('%Y-%m-%d %H:%M:%S'),
+            'open_price': df['open'].to_numpy(dtype=float),
+            'high_price': df['high'].to_numpy(dtype=float),
+            'low_price': df['low'].to_numpy(dtype=float),
+            'close_price': df['close'].to_numpy(dtype=float),
+            'volume': df['volume'].fillna(0).to_numpy(dtype=float)
+        }, columns=PRICE_COLUMNS)
+        # Pontos repetidos (ex: vários preços no mesmo dia para 1d): vale o último
+        return frame.drop_duplicates(subset='date', keep='last')
+
+    def _insert_batches(self, frame: pd.DataFrame, batch_size: int) -> None:
+        """INSERT multi-linha com ON DUPLICATE KEY UPDATE, um commit por bloco."""
+        self.db_service.ensure_connection()
+        connection = self.db_service.connection
+        cursor = connection.cursor()
+        rows = list(frame.itertuples(index=False, name=None))
+        row_placeholder = "(" + ", ".join(["%s"] * len(PRICE_COLUMNS)) + ")"
+        
+        try:
+            for start in range(0, len(rows), batch_size):
+                chunk = rows[start:start + batch_size]
+                query = f"""
+                    INSERT INTO historical_price_data 
+                    ({', '.join(PRICE_COLUMNS)})
+                    VALUES {', '.join([row_placeholder] * len(chunk))}
+                    ON DUPLICATE KEY UPDATE
+                        open_price = VALUES(open_price),
+                        high_price = VALUES(high_price),
+                        low_price = VALUES(low_price),
+                        close_price = VALUES(close_price),
+                        volume = VALUES(volume),
+                        updated_at = CURRENT_TIMESTAMP
+                """
+                cursor.execute(query, list(itertools.chain.from_iterable(chunk)))
+                connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
             cursor.close()
-            
-            logger.info(f"Salvos {len(insert_data)} pontos no cache")
-            
-        except Exception as e:
+
+    def _load_data_infile(self, frame: pd.DataFrame, batch_size: int) -> None:
+        """
+        LOAD DATA LOCAL INFILE a partir de arquivos CSV temporários, um por bloco.
+        Usa uma conexão própria, pois a conexão compartilhada não habilita local_infile.
+        """
+        connection = mysql.connector.connect(
+            host=os.getenv("DB_HOST"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            database=os.getenv("DB_NAME"),
+            allow_local_infile=True,
+            autocommit=False
+        )
+        cursor = connection.cursor()
+        
+        try:
+            for start in range(0, len(frame), batch_size):
+                with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+                    frame.iloc[start:start + batch_size].to_csv(csv_file, header=False, index=False, float_format='%.8f')
+                    path = csv_file.name
+                try:
+                    cursor.execute(f"""
+                        LOAD DATA LOCAL INFILE %s
+                        REPLACE INTO TABLE historical_price_data
+                        FIELDS TERMINATED BY ',' LINES TERMINATED BY '\\n'
+                        ({', '.join(PRICE_COLUMNS)})
+                        SET updated_at = CURRENT_TIMESTAMP
+                    """, (path,))
+                    connection.commit()
+                finally:
+                    os.remove(path)
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+    def get_covered_windows(self, asset_symbols: List[str], timeframe: str) -> set:
+        """
+        Janelas já carregadas pelo backfill (índice de cobertura).
+        
+        Returns:
+            Conjunto de tuplas (asset_symbol, window_start, window_end)
+        """
+        if not asset_symbols:
+            return set()
+        
+        self.db_service.ensure_connection()
+        cursor = self.db_service.connection.cursor()
+        try:
+            placeholders = ", ".join(["%s"] * len(asset_symbols))
+            cursor.execute(f"""
+                SELECT asset_symbol, window_start, window_end
+                FROM historical_data_coverage
+                WHERE asset_symbol IN ({placeholders}) AND timeframe = %s
+            """, (*asset_symbols, timeframe))
+            return {(row[0], row[1], row[2]) for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+
+    def mark_window_covered(self, asset_symbol: str, timeframe: str, window_start: date,
+                            window_end: date, rows_loaded: int) -> None:
+        """Registra no índice de cobertura uma janela carregada por completo."""
+        self.db_service.ensure_connection()
+        cursor = self.db_service.connection.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO historical_data_coverage
+                (asset_symbol, timeframe, window_start, window_end, rows_loaded)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE rows_loaded = VALUES(rows_loaded), loaded_at = CURRENT_TIMESTAMP
+            """, (asset_symbol, timeframe, window_start, window_end, rows_loaded))
+            self.db_service.connection.commit()
+        except Exception:
             self.db_service.connection.rollback()
-            logger.error(f"Erro ao salvar dados no cache: {str(e)}")
+            raise
+        finally:
+            cursor.close()
 
     def clear_cache(self, asset_symbol: str = None, timeframe: str = None) -> None:
         """
@@ -331,15 +676,17 @@ class HistoricalDataService:
             self.db_service.ensure_connection()
             cursor = self.db_service.connection.cursor()
             
-            if asset_symbol and timeframe:
-                query = "DELETE FROM historical_price_data WHERE asset_symbol = %s AND timeframe = %s"
-                cursor.execute(query, (asset_symbol, timeframe))
-            elif asset_symbol:
-                query = "DELETE FROM historical_price_data WHERE asset_symbol = %s"
-                cursor.execute(query, (asset_symbol,))
-            else:
-                query = "DELETE FROM historical_price_data"
-                cursor.execute(query)
+            # O índice de cobertura do backfill é limpo junto com os preços
+            for table in ('historical_price_data', 'historical_data_coverage'):
+                if asset_symbol and timeframe:
+                    query = f"DELETE FROM {table} WHERE asset_symbol = %s AND timeframe = %s"
+                    cursor.execute(query, (asset_symbol, timeframe))
+                elif asset_symbol:
+                    query = f"DELETE FROM {table} WHERE asset_symbol = %s"
+                    cursor.execute(query, (asset_symbol,))
+                else:
+                    query = f"DELETE FROM {table}"
+                    cursor.execute(query)
             
             self.db_service.connection.commit()
             cursor.close()
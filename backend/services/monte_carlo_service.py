@@ -0,0 +1,139 @@
+"""
+Serviço de análise de robustez (Monte Carlo / bootstrap) para resultados de backtest.
+Reamostra os retornos da estratégia em lote com NumPy e devolve intervalos de confiança
+para lucro líquido, drawdown máximo e Sharpe.
+"""
+
+import numpy as np
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Limite de elementos da matriz (simulações × períodos) processada de uma vez, para conter a memória
+MAX_MATRIX_ELEMENTS = 4_000_000
+
+class MonteCarloService:
+    """
+    Métodos de reamostragem:
+    - block_bootstrap: sorteia blocos contíguos da série de retornos por candle (preserva autocorrelação)
+    - trade_shuffle: embaralha a ordem dos trades (mesmo lucro final, distribuição do drawdown)
+    - trade_bootstrap: sorteia trades com reposição (lucro, drawdown e Sharpe variam)
+    """
+
+    METHODS = ('block_bootstrap', 'trade_shuffle', 'trade_bootstrap')
+
+    def analyze(self, strategy_returns: np.ndarray, trade_returns: np.ndarray, annualization: float,
+                n_simulations: int = 2000, block_size: Optional[int] = None,
+                confidence: float = 0.95, seed: Optional[int] = None) -> Dict:
+        """
+        Executa todos os métodos de reamostragem aplicáveis.
+
+        Args:
+            strategy_returns: Retornos da equity por candle
+            trade_returns: Retorno de cada trade sobre o capital (fração), na ordem de execução
+            annualization: Candles por ano do timeframe
+            n_simulations: Quantidade de séries simuladas por método
+            block_size: Tamanho do bloco do bootstrap (padrão: raiz quadrada do tamanho da série)
+            confidence: Nível do intervalo de confiança (ex: 0.95 -> percentis 2,5 e 97,5)
+            seed: Semente para resultados reprodutíveis
+
+        Returns:
+            Dict com as métricas observadas e, por método, os intervalos de cada métrica
+        """
+        if not 0.0 < confidence < 1.0:
+            raise ValueError("confidence must be between 0 and 1")
+        if n_simulations < 1:
+            raise ValueError("n_simulations must be >= 1")
+
+        rng = np.random.default_rng(seed)
+        strategy_returns = np.asarray(strategy_returns, dtype=float)
+        trade_returns = np.asarray(trade_returns, dtype=float)
+
+        result = {
+            'n_simulations': n_simulations,
+            'confidence': confidence,
+            'observed': self._summarize_observed(strategy_returns, annualization),
+            'methods': {}
+        }
+
+        if len(strategy_returns) >= 2:
+            block_size = block_size or max(1, int(np.sqrt(len(strategy_returns))))
+            samples = self._simulate_metrics(
+                lambda count: self._block_bootstrap(strategy_returns, count, block_size, rng),
+                n_simulations, len(strategy_returns), annualization
+            )
+            result['methods']['block_bootstrap'] = {'block_size': block_size, **self._intervals(samples, confidence)}
+
+        if len(trade_returns) >= 2:
+            # Trades por ano, para anualizar o Sharpe calculado sobre a sequência de trades
+            trade_annualization = annualization * len(trade_returns) / max(len(strategy_returns), 1)
+            shuffled = self._simulate_metrics(
+                lambda count: rng.permuted(np.broadcast_to(trade_returns, (count, len(trade_returns))), axis=1),
+                n_simulations, len(trade_returns), trade_annualization
+            )
+            resampled = self._simulate_metrics(
+                lambda count: trade_returns[rng.integers(0, len(trade_returns), size=(count, len(trade_returns)))],
+                n_simulations, len(trade_returns), trade_annualization
+            )
+            result['methods']['trade_shuffle'] = self._intervals(shuffled, confidence)
+            result['methods']['trade_bootstrap'] = self._intervals(resampled, confidence)
+
+        return result
+
+    def _block_bootstrap(self, returns: np.ndarray, count: int, block_size: int,
+                         rng: np.random.Generator) -> np.ndarray:
+        """Gera count séries do mesmo tamanho concatenando blocos sorteados (moving block bootstrap)."""
+        length = len(returns)
+        block_size = min(block_size, length)
+        blocks = int(np.ceil(length / block_size))
+        starts = rng.integers(0, length - block_size + 1, size=(count, blocks))
+        indices = (starts[:, :, None] + np.arange(block_size)).reshape(count, -1)[:, :length]
+        return returns[indices]
+
+    def _simulate_metrics(self, sampler, n_simulations: int, length: int,
+                          annualization: float) -> Dict[str, np.ndarray]:
+        """Gera as séries em lotes (limitando a memória) e calcula as métricas de cada uma."""
+        chunk = max(1, MAX_MATRIX_ELEMENTS // max(length, 1))
+        parts = []
+        for start in range(0, n_simulations, chunk):
+            parts.append(self._path_metrics(sampler(min(chunk, n_simulations - start)), annualization))
+        return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+    def _path_metrics(self, paths: np.ndarray, annualization: float) -> Dict[str, np.ndarray]:
+        """Lucro líquido, drawdown máximo e Sharpe de cada linha (série simulada) da matriz."""
+        equity = np.cumprod(1 + paths, axis=1)
+        running_max = np.maximum.accumulate(np.maximum(equity, 1.0), axis=1)
+        drawdown = (running_max - equity) / running_max
+
+        mean = paths.mean(axis=1)
+        std = paths.std(axis=1, ddof=1)
+        sharpe = np.divide(mean, std, out=np.zeros_like(mean), where=std > 0) * np.sqrt(annualization)
+
+        return {
+            'net_profit_percent': (equity[:, -1] - 1) * 100,
+            'max_drawdown_percent': drawdown.max(axis=1) * 100,
+            'sharpe_ratio': sharpe
+        }
+
+    def _summarize_observed(self, strategy_returns: np.ndarray, annualization: float) -> Dict:
+        """Métricas da série original, no mesmo cálculo usado nas simulações."""
+        if len(strategy_returns) < 2:
+            return {}
+        metrics = self._path_metrics(strategy_returns[None, :], annualization)
+        return {key: round(float(values[0]), 4) for key, values in metrics.items()}
+
+    def _intervals(self, samples: Dict[str, np.ndarray], confidence: float) -> Dict:
+        """Percentis (intervalo de confiança e mediana) e média de cada métrica simulada."""
+        tail = (1 - confidence) / 2 * 100
+        intervals = {}
+        for metric, values in samples.items():
+            lower, median, upper = np.percentile(values, [tail, 50, 100 - tail])
+            intervals[metric] = {
+                'lower': round(float(lower), 4),
+                'median': round(float(median), 4),
+                'upper': round(float(upper), 4),
+                'mean': round(float(values.mean()), 4)
+            }
+        intervals['probability_of_loss'] = round(float((samples['net_profit_percent'] < 0).mean()), 4)
+        return intervals
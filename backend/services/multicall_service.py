@@ -0,0 +1,182 @@
+"""
+Serviço de Multicall3
+Agrupa várias chamadas de leitura (eth_call) em uma única requisição ao nó RPC usando o
+contrato Multicall3 (mesmo endereço em Polygon, Ethereum e na maioria das redes EVM).
+Sem Multicall3 na rede (ex: nó local sem fork), recorre a requisições JSON-RPC em lote e,
+por último, a chamadas individuais.
+"""
+
+import os
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from eth_abi import encode as abi_encode
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+
+logger = logging.getLogger(__name__)
+
+MULTICALL3_ADDRESS = os.getenv("MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11")
+# Chamadas por aggregate3 (limita o gás de cada eth_call e o tamanho da resposta)
+MULTICALL_CHUNK_SIZE = int(os.getenv("MULTICALL_CHUNK_SIZE", 300))
+
+# Seletor de balanceOf(address)
+BALANCE_OF_SELECTOR = Web3.keccak(text="balanceOf(address)")[:4]
+# Seletor de getEthBalance(address) do próprio Multicall3 (saldo nativo, MATIC na Polygon)
+GET_ETH_BALANCE_SELECTOR = Web3.keccak(text="getEthBalance(address)")[:4]
+
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+
+class MulticallService:
+    def __init__(self, w3: Web3, chunk_size: int = MULTICALL_CHUNK_SIZE,
+                 multicall_address: str = MULTICALL3_ADDRESS):
+        self.w3 = w3
+        self.chunk_size = max(1, chunk_size)
+        self.multicall = w3.eth.contract(address=Web3.to_checksum_address(multicall_address), abi=MULTICALL3_ABI)
+        # None = ainda não verificado se o Multicall3 existe nesta rede
+        self._multicall_available: Optional[bool] = None
+
+    def aggregate(self, calls: List[Tuple[str, bytes]], block_identifier: Any = 'latest') -> List[Tuple[bool, bytes]]:
+        """
+        Executa chamadas de leitura em lotes de chunk_size.
+
+        Args:
+            calls: Lista de (endereço do contrato, calldata)
+            block_identifier: Bloco de referência (o mesmo para todos os lotes)
+
+        Returns:
+            Lista (na ordem de calls) de (sucesso, dados retornados); falhas individuais não abortam o lote.
+            Dados None indicam que a chamada não chegou a ser avaliada (erro de transporte, limite do
+            provedor), diferente de um revert, que retorna (False, b'')
+        """
+        results: List[Tuple[bool, bytes]] = []
+        for start in range(0, len(calls), self.chunk_size):
+            chunk = calls[start:start + self.chunk_size]
+            if self._has_multicall():
+                try:
+                    results.extend(self._aggregate3(chunk, block_identifier))
+                    continue
+                except Exception as e:
+                    logger.warning(f"Multicall3 falhou, usando lote JSON-RPC: {e}")
+            results.extend(self._batch_calls(chunk, block_identifier))
+        return results
+
+    def erc20_balances(self, owner: str, token_addresses: List[str],
+                       block_identifier: Any = 'latest') -> Dict[str, Optional[int]]:
+        """
+        Saldos ERC-20 de um endereço para vários tokens.
+
+        Returns:
+            Dict token (como recebido) -> saldo bruto, ou None se a chamada falhou
+        """
+        call_data = BALANCE_OF_SELECTOR + abi_encode(['address'], [Web3.to_checksum_address(owner)])
+        calls = [(token, call_data) for token in token_addresses]
+        balances = {}
+        for token, (success, data) in zip(token_addresses, self.aggregate(calls, block_identifier)):
+            balances[token] = int.from_bytes(data[:32], 'big') if success and len(data) >= 32 else None
+        return balances
+
+    def native_balances(self, addresses: List[str], block_identifier: Any = 'latest') -> Dict[str, Optional[int]]:
+        """
+        Saldos nativos (wei) de vários endereços: getEthBalance do Multicall3 ou, sem ele,
+        um lote JSON-RPC de eth_getBalance.
+
+        Returns:
+            Dict endereço (como recebido) -> saldo em wei, ou None se a leitura falhou
+        """
+        if not addresses:
+            return {}
+        if self._has_multicall():
+            calls = [
+                (self.multicall.address, GET_ETH_BALANCE_SELECTOR + abi_encode(['address'], [Web3.to_checksum_address(address)]))
+                for address in addresses
+            ]
+            return {
+                address: int.from_bytes(data[:32], 'big') if success and len(data) >= 32 else None
+                for address, (success, data) in zip(addresses, self.aggregate(calls, block_identifier))
+            }
+
+        balances = {}
+        for start in range(0, len(addresses), self.chunk_size):
+            chunk = addresses[start:start + self.chunk_size]
+            try:
+                with self.w3.batch_requests() as batch:
+                    for address in chunk:
+                        batch.add(self.w3.eth.get_balance(Web3.to_checksum_address(address), block_identifier))
+                    balances.update(zip(chunk, batch.execute()))
+            except Exception as e:
+                logger.warning(f"Lote JSON-RPC de saldos falhou, usando chamadas individuais: {e}")
+                for address in chunk:
+                    try:
+                        balances[address] = self.w3.eth.get_balance(Web3.to_checksum_address(address), block_identifier)
+                    except Exception:
+                        balances[address] = None
+        return balances
+
+    def _has_multicall(self) -> bool:
+        if self._multicall_available is None:
+            try:
+                self._multicall_available = len(self.w3.eth.get_code(self.multicall.address)) > 0
+            except Exception as e:
+                logger.warning(f"Não foi possível verificar o Multicall3: {e}")
+                self._multicall_available = False
+            if not self._multicall_available:
+                logger.info(f"Multicall3 não encontrado em {self.multicall.address}, usando lotes JSON-RPC")
+        return self._multicall_available
+
+    def _aggregate3(self, chunk: List[Tuple[str, bytes]], block_identifier: Any) -> List[Tuple[bool, bytes]]:
+        calls = [(Web3.to_checksum_address(target), True, data) for target, data in chunk]
+        response = self.multicall.functions.aggregate3(calls).call(block_identifier=block_identifier)
+        return [(bool(success), bytes(data)) for success, data in response]
+
+    def _batch_calls(self, chunk: List[Tuple[str, bytes]], block_identifier: Any) -> List[Tuple[bool, bytes]]:
+        """Fallback: um lote JSON-RPC de eth_call; se o nó não aceitar lotes, chamadas individuais."""
+        transactions = [{'to': Web3.to_checksum_address(target), 'data': Web3.to_hex(data)} for target, data in chunk]
+        try:
+            with self.w3.batch_requests() as batch:
+                for transaction in transactions:
+                    batch.add(self.w3.eth.call(transaction, block_identifier))
+                responses = batch.execute()
+            return [(True, bytes(response)) for response in responses]
+        except Exception as e:
+            logger.warning(f"Lote JSON-RPC falhou, usando chamadas individuais: {e}")
+
+        results = []
+        for transaction in transactions:
+            try:
+                results.append((True, bytes(self.w3.eth.call(transaction, block_identifier))))
+            except ContractLogicError:
+                results.append((False, b''))
+            except Exception as e:
+                logger.warning(f"Chamada a {transaction['to']} não avaliada: {e}")
+                results.append((False, None))
+        return results
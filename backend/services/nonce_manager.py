@@ -0,0 +1,192 @@
+"""
+Gerenciador de nonce e gas para uma conta que envia várias transações seguidas (ex: Keeper)
+Os nonces são controlados localmente, então várias transações podem ser enviadas em sequência
+sem aguardar confirmação. O gas price é consultado no máximo uma vez por bloco e transações
+presas são substituídas (mesmo nonce, gas price maior); esgotadas as substituições, o nonce é
+cancelado com uma transferência de valor zero para a própria conta e, se nem isso for minerado,
+a transação é abandonada e o nonce ressincronizado com a rede.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+logger = logging.getLogger(__name__)
+
+# Validade do gas price em cache quando ninguém informa um bloco novo (~tempo de bloco da Polygon)
+GAS_PRICE_TTL_SECONDS = float(os.getenv("GAS_PRICE_TTL_SECONDS", 2))
+# Segundos sem ser minerada antes de substituir a transação
+TX_STUCK_SECONDS = int(os.getenv("TX_STUCK_SECONDS", 60))
+# Aumento do gas price na substituição (os nós exigem pelo menos 10%)
+TX_REPLACEMENT_BUMP = float(os.getenv("TX_REPLACEMENT_BUMP", 1.125))
+TX_MAX_REPLACEMENTS = int(os.getenv("TX_MAX_REPLACEMENTS", 3))
+
+# Erros de envio que indicam nonce local dessincronizado da rede
+NONCE_ERROR_MARKERS = ('nonce too low', 'replacement transaction underpriced', 'nonce has already been used')
+# O nó já tem exatamente esta transação assinada: o envio conta como feito (reenviar duplicaria a execução)
+ALREADY_KNOWN_MARKERS = ('already known', 'known transaction', 'already imported')
+
+
+class NonceManager:
+    def __init__(self, w3: Web3, address: str, private_key: str):
+        self.w3 = w3
+        self.address = Web3.to_checksum_address(address)
+        self.private_key = private_key
+        self.chain_id = w3.eth.chain_id
+        self._lock = threading.RLock()
+        self._next_nonce: Optional[int] = None
+        self._gas_price: Optional[int] = None
+        self._gas_price_block: Optional[int] = None
+        self._gas_price_at = 0.0
+        # nonce -> transação enviada (hashes de todas as versões, a última primeiro)
+        self.pending: Dict[int, Dict[str, Any]] = {}
+
+    def on_new_block(self, block_number: int) -> None:
+        """Invalida o gas price em cache quando chega um bloco novo."""
+        with self._lock:
+            if block_number != self._gas_price_block:
+                self._gas_price = None
+                self._gas_price_block = block_number
+
+    def gas_price(self) -> int:
+        with self._lock:
+            if self._gas_price is None or time.time() - self._gas_price_at > GAS_PRICE_TTL_SECONDS:
+                self._gas_price = self.w3.eth.gas_price
+                self._gas_price_at = time.time()
+            return self._gas_price
+
+    def send(self, transaction: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Assina e envia a transação com o próximo nonce local e o gas price em cache.
+
+        Args:
+            transaction: Campos da transação (to, data, gas, value); nonce, gasPrice e chainId são preenchidos aqui
+
+        Returns:
+            {'nonce', 'tx_hash'}
+        """
+        with self._lock:
+            if self._next_nonce is None:
+                self._sync_nonce()
+            try:
+                tx_hash = self._sign_and_send(transaction, self._next_nonce, self.gas_price())
+            except Exception as e:
+                if not any(marker in str(e).lower() for marker in NONCE_ERROR_MARKERS):
+                    raise
+                # Outra origem usou a conta: ressincroniza e tenta uma vez com o nonce da rede
+                logger.warning(f"Nonce {self._next_nonce} recusado ({e}), ressincronizando")
+                self._sync_nonce()
+                tx_hash = self._sign_and_send(transaction, self._next_nonce, self.gas_price())
+
+            nonce = self._next_nonce
+            self._next_nonce += 1
+            self.pending[nonce] = {
+                'transaction': transaction,
+                'gas_price': self._gas_price,
+                'tx_hashes': [tx_hash],
+                'sent_at': time.time(),
+                'replacements': 0,
+                'cancel_hash': None
+            }
+            return {'nonce': nonce, 'tx_hash': tx_hash}
+
+    def poll(self) -> List[Dict[str, Any]]:
+        """
+        Verifica as transações pendentes: uma consulta do nonce confirmado da conta e recibos
+        apenas das que já foram mineradas. Transações presas há mais de TX_STUCK_SECONDS são
+        substituídas até TX_MAX_REPLACEMENTS vezes, depois canceladas e, por fim, abandonadas.
+
+        Returns:
+            Lista de {'nonce', 'tx_hash', 'receipt', 'error'} das transações finalizadas. receipt é
+            None se o nonce foi consumido por uma transação desconhecida ou se a transação foi
+            abandonada; error é None apenas quando a transação original (ou substituta) foi minerada
+        """
+        with self._lock:
+            if not self.pending:
+                return []
+
+            confirmed_nonce = self.w3.eth.get_transaction_count(self.address, 'latest')
+            finished = []
+            dropped = False
+            for nonce in sorted(self.pending):
+                pending = self.pending[nonce]
+                if nonce < confirmed_nonce:
+                    tx_hash, receipt = self._find_receipt(pending['tx_hashes'])
+                    error = None
+                    if receipt is None:
+                        error = "nonce consumido por outra transação"
+                    elif tx_hash == pending['cancel_hash']:
+                        error = "transação cancelada após esgotar as substituições"
+                    finished.append({'nonce': nonce, 'tx_hash': tx_hash, 'receipt': receipt, 'error': error})
+                    del self.pending[nonce]
+                elif time.time() - pending['sent_at'] <= TX_STUCK_SECONDS:
+                    continue
+                elif pending['replacements'] < TX_MAX_REPLACEMENTS:
+                    self._replace(nonce, pending, pending['transaction'])
+                elif pending['cancel_hash'] is None:
+                    self._cancel(nonce, pending)
+                else:
+                    # Nem o cancelamento foi minerado: libera a entrada e volta a seguir o nonce da rede
+                    logger.error(f"Transação de nonce {nonce} abandonada após o cancelamento: {pending['tx_hashes'][0]}")
+                    finished.append({'nonce': nonce, 'tx_hash': pending['tx_hashes'][0], 'receipt': None,
+                                     'error': "transação abandonada (nem o cancelamento foi minerado)"})
+                    del self.pending[nonce]
+                    dropped = True
+
+            if dropped:
+                self._sync_nonce()
+            return finished
+
+    def _replace(self, nonce: int, pending: Dict[str, Any], transaction: Dict[str, Any]) -> Optional[str]:
+        """Reenvia o nonce com a transação informada e gas price maior. Retorna o hash, ou None se falhou."""
+        gas_price = max(int(pending['gas_price'] * TX_REPLACEMENT_BUMP) + 1, self.gas_price())
+        try:
+            tx_hash = self._sign_and_send(transaction, nonce, gas_price)
+        except Exception as e:
+            # Ex: a original foi minerada entre a consulta do nonce e o reenvio
+            logger.warning(f"Falha ao substituir a transação de nonce {nonce}: {e}")
+            return None
+        logger.info(f"Transação de nonce {nonce} substituída: {tx_hash} (gas price {gas_price})")
+        pending['tx_hashes'].insert(0, tx_hash)
+        pending['gas_price'] = gas_price
+        pending['sent_at'] = time.time()
+        pending['replacements'] += 1
+        return tx_hash
+
+    def _cancel(self, nonce: int, pending: Dict[str, Any]) -> None:
+        """Ocupa o nonce com uma transferência de valor zero para a própria conta."""
+        cancel = {'to': self.address, 'data': b'', 'value': 0, 'gas': 21000}
+        pending['cancel_hash'] = self._replace(nonce, pending, cancel)
+        if pending['cancel_hash']:
+            logger.warning(f"Transação de nonce {nonce} cancelada após {TX_MAX_REPLACEMENTS} substituições")
+
+    def _find_receipt(self, tx_hashes: List[str]):
+        for tx_hash in tx_hashes:
+            try:
+                return tx_hash, self.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+        return tx_hashes[0], None
+
+    def _sync_nonce(self) -> None:
+        self._next_nonce = self.w3.eth.get_transaction_count(self.address, 'pending')
+
+    def _sign_and_send(self, transaction: Dict[str, Any], nonce: int, gas_price: int) -> str:
+        signed = self.w3.eth.account.sign_transaction({
+            **transaction,
+            'nonce': nonce,
+            'gasPrice': gas_price,
+            'chainId': self.chain_id
+        }, private_key=self.private_key)
+        try:
+            return Web3.to_hex(self.w3.eth.send_raw_transaction(signed.raw_transaction))
+        except Exception as e:
+            if not any(marker in str(e).lower() for marker in ALREADY_KNOWN_MARKERS):
+                raise
+            # Envio anterior (ex: repetido após timeout) já chegou ao nó: o hash é o da transação assinada
+            logger.info(f"Transação de nonce {nonce} já conhecida pelo nó")
+            return Web3.to_hex(signed.hash)
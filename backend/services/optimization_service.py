@@ -2,8 +2,9 @@ import mysql.connector
 import json
 import random
 import logging
+import itertools
 from typing import List, Dict, Optional, Tuple
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from services.database_service import DatabaseService
 import numpy as np
 # IMPORTS REMOVIDOS PARA EVITAR PROBLEMAS DE SERIALIZAÇÃO EM ProcessPoolExecutor:
@@ -11,46 +12,126 @@ import numpy as np
 # from services.historical_data_service import HistoricalDataService
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import multiprocessing
+import time
 import os
 
 logger = logging.getLogger(__name__)
 
+# Tentativas de gravar os resultados e o checkpoint de um passo antes de falhar o job
+RESULTS_FLUSH_ATTEMPTS = int(os.getenv("OPTIMIZATION_FLUSH_ATTEMPTS", 3))
 
-def _evaluate_individual_parallel(task_data: dict) -> dict:
+# Métodos de busca suportados e configuração padrão (sobrescrita por job via search_config)
+SEARCH_METHODS = ('genetic', 'grid', 'random')
+# Métricas gravadas também para o período de teste (fora da amostra) de cada fold walk-forward
+OOS_METRICS = ('total_trades', 'win_rate_percent', 'net_profit_percent',
+               'max_drawdown_percent', 'sharpe_ratio', 'fitness_score')
+DEFAULT_SEARCH_CONFIG = {
+    'method': 'genetic',
+    'population_size': 20,    # GA: indivíduos por geração | grid/random: avaliações por lote
+    'generations': 10,
+    'mutation_rate': 0.1,
+    'elite_size': 2,
+    'patience': None,         # GA: gerações sem melhoria antes de parar (None = desativado)
+    'min_improvement': 0.0,   # Melhoria mínima do fitness para zerar a contagem de patience
+    'n_samples': 100,         # random: total de combinações sorteadas
+    'grid_points': 5,         # grid: pontos por parâmetro float sem 'step'
+    'max_grid_size': 1000,    # grid: limite de combinações para busca exaustiva
+    'seed': None,             # random: semente do sorteio (padrão: id do job, para retomada determinística)
+    'screening_window': None,     # multi-fidelity: fração final do período usada na triagem (None = desativado)
+    'screening_decimation': 1,    # multi-fidelity: usa 1 a cada N candles na triagem
+    'promotion_fraction': 0.25,   # multi-fidelity: fração dos melhores da triagem promovida ao backtest completo
+    'walk_forward_folds': None,   # walk-forward: quantidade de folds treino/teste (None = desativado)
+    'walk_forward_test_fraction': 0.25  # walk-forward: fração de cada fold usada como teste fora da amostra
+}
+
+
+# Estado por processo de avaliação: serviços e séries históricas são reaproveitados entre tarefas,
+# gerações e folds enquanto o pool do job estiver vivo
+_worker_state = {}
+MAX_CACHED_SERIES = 4
+
+
+def _get_worker_services():
     """
-    Função auxiliar para avaliar um indivíduo em processo paralelo.
+    Instancia os serviços de backtest uma única vez por processo.
     As importações são feitas aqui dentro para evitar erros de serialização (pickle).
     """
-    # Passo 1: Importações locais dentro do worker
-    from services.historical_data_service import HistoricalDataService
+    if 'backtesting_service' not in _worker_state:
+        from services.historical_data_service import HistoricalDataService
+        from services.backtesting_service import BacktestingService
+        
+        historical_data_service = HistoricalDataService()
+        _worker_state['historical_data_service'] = historical_data_service
+        _worker_state['backtesting_service'] = BacktestingService(historical_data_service)
+        _worker_state['series'] = {}
+    return _worker_state['historical_data_service'], _worker_state['backtesting_service']
+
+
+def _init_worker_services(data_service_factory) -> None:
+    """
+    Inicializador do pool: usa uma fonte de dados alternativa ao HistoricalDataService
+    (ex.: dados sintéticos em memória no benchmark). data_service_factory precisa ser serializável.
+    """
     from services.backtesting_service import BacktestingService
+    
+    historical_data_service = data_service_factory()
+    _worker_state['historical_data_service'] = historical_data_service
+    _worker_state['backtesting_service'] = BacktestingService(historical_data_service)
+    _worker_state['series'] = {}
+
+
+def _get_worker_series(task_data: dict):
+    """
+    Carrega (uma vez por processo) a série do período completo do job; cada tarefa usa um recorte dela.
+    """
+    historical_data_service, _ = _get_worker_services()
+    cache = _worker_state['series']
+    key = (
+        task_data['asset_symbol'], task_data['timeframe'],
+        task_data['data_start_date'], task_data['data_end_date']
+    )
+    
+    if key not in cache:
+        if len(cache) >= MAX_CACHED_SERIES:
+            cache.pop(next(iter(cache)))
+        cache[key] = historical_data_service.get_historical_data(
+            task_data['asset_symbol'], task_data['timeframe'],
+            task_data['data_start_date'], task_data['data_end_date']
+        )
+    return cache[key]
+
+
+def _evaluate_individual_parallel(task_data: dict) -> dict:
+    """
+    Função auxiliar para avaliar um indivíduo em processo paralelo.
+    """
     import logging
 
     # Configura um logger básico para o processo filho, se necessário
     logger = logging.getLogger(f"worker_{os.getpid()}")
 
     try:
-        # Passo 2: Instanciar os serviços
-        historical_data_service = HistoricalDataService()
-        backtesting_service = BacktestingService(historical_data_service)
+        # Passo 1: Serviços e dados históricos em cache no processo
+        _, backtesting_service = _get_worker_services()
+        data = _get_worker_series(task_data) if 'data_start_date' in task_data else None
         
-        # Passo 3: Executar o backtest
+        # Passo 2: Executar o backtest
         results = backtesting_service.run_backtest(
             asset_symbol=task_data['asset_symbol'],
             timeframe=task_data['timeframe'],
             start_date=task_data['start_date'],
             end_date=task_data['end_date'],
             base_strategy_name=task_data['base_strategy_name'],
-            parameters=task_data['parameters']
+            parameters=task_data['parameters'],
+            decimation=task_data.get('decimation', 1),
+            data=data
         )
         
-        return results
-        
     except Exception as e:
         # Usar o logger para capturar o erro exato do processo filho
         logger.error(f"Erro fatal no processo de avaliação individual: {str(e)}", exc_info=True)
         # Retornar um resultado de falha
-        return {
+        results = {
             'total_trades': 0,
             'win_rate_percent': 0.0,
             'net_profit_percent': -100.0,
@@ -58,14 +139,25 @@ def _evaluate_individual_parallel(task_data: dict) -> dict:
             'sharpe_ratio': -10.0,
             'fitness_score': -1000.0
         }
+    
+    # Fração dos dados usada na avaliação (1.0 = backtest completo) e fold do walk-forward
+    results['fidelity'] = task_data.get('fidelity', 1.0)
+    results['fold'] = task_data.get('fold')
+    return results
 
 
 class OptimizationService:
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None, data_service_factory=None):
         self.db_service = DatabaseService()
         # Não instanciamos os serviços aqui para evitar problemas de serialização
         # Eles serão instanciados localmente nos workers quando necessário
-        self.max_workers = max(1, multiprocessing.cpu_count() // 2)
+        # max_workers pode ser definido pelo optimizer_worker conforme o orçamento global de CPU
+        self.max_workers = max_workers or max(1, multiprocessing.cpu_count() // 2)
+        # Pool de avaliação compartilhado por todas as gerações e folds de um job; mantém em cada
+        # processo os dados carregados e as séries com indicadores já calculados
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Fonte de dados alternativa para os processos de avaliação (None = HistoricalDataService)
+        self.data_service_factory = data_service_factory
 
     def create_optimization_job(self, user_id: int, job_data: dict) -> dict:
         """
@@ -84,13 +176,19 @@ class OptimizationService:
             if not cursor.fetchone():
                 raise ValueError("Asset not found")
             
-            # Serializar parameter_ranges como JSON
+            # Validar configuração de busca (grid muito grande é rejeitado já na criação)
+            search_config = self.normalize_search_config(job_data.get('search_config'))
+            if search_config['method'] == 'grid':
+                self._build_parameter_grid(job_data['parameter_ranges'], search_config)
+            
+            # Serializar parameter_ranges e search_config como JSON
             parameter_ranges_json = json.dumps(job_data['parameter_ranges'])
+            search_config_json = json.dumps(search_config)
             
             query = """
                 INSERT INTO strategy_optimization_jobs 
-                (user_id, base_strategy_name, asset_id, timeframe, start_date, end_date, parameter_ranges, status) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s, 'PENDING')
+                (user_id, base_strategy_name, asset_id, timeframe, start_date, end_date, parameter_ranges, search_config, status) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'PENDING')
             """
             cursor.execute(query, (
                 user_id,
@@ -99,7 +197,8 @@ class OptimizationService:
                 job_data['timeframe'],
                 job_data['start_date'],
                 job_data['end_date'],
-                parameter_ranges_json
+                parameter_ranges_json,
+                search_config_json
             ))
             self.db_service.connection.commit()
             job_id = cursor.lastrowid
@@ -108,9 +207,9 @@ class OptimizationService:
             cursor.execute("SELECT * FROM strategy_optimization_jobs WHERE id = %s", (job_id,))
             job = cursor.fetchone()
             
-            # Deserializar parameter_ranges de volta para dict
-            if job and job['parameter_ranges']:
-                job['parameter_ranges'] = json.loads(job['parameter_ranges'])
+            # Deserializar parameter_ranges e search_config de volta para dict
+            if job:
+                self._deserialize_job_json(job)
             
             logger.info(f"Optimization job created: {job_id} for user {user_id}")
             return job
@@ -143,12 +242,9 @@ class OptimizationService:
             jobs = cursor.fetchall()
             # print(f"[get_optimization_jobs_by_user] QUERY EXECUTADA - JOBS: {jobs}")
             
-            # Deserializar parameter_ranges para cada job
+            # Deserializar parameter_ranges e search_config para cada job
             for job in jobs:
-                if job['parameter_ranges']:
-                    job['parameter_ranges'] = json.loads(job['parameter_ranges'])
-                else:
-                    job['parameter_ranges'] = {}
+                self._deserialize_job_json(job)
             
             return jobs
             
@@ -172,14 +268,72 @@ class OptimizationService:
             cursor.execute(query, (job_id, user_id))
             job = cursor.fetchone()
             
-            if job and job['parameter_ranges']:
-                job['parameter_ranges'] = json.loads(job['parameter_ranges'])
+            if job:
+                self._deserialize_job_json(job)
             
             return job
             
         finally:
             cursor.close()
     
+    def _deserialize_job_json(self, job: dict) -> dict:
+        """
+        Converte as colunas JSON do job para dict
+        """
+        job['parameter_ranges'] = json.loads(job['parameter_ranges']) if job.get('parameter_ranges') else {}
+        job['search_config'] = self.normalize_search_config(
+            json.loads(job['search_config']) if job.get('search_config') else None
+        )
+        return job
+    
+    def normalize_search_config(self, search_config: Optional[dict]) -> dict:
+        """
+        Mescla a configuração de busca do job com os padrões e valida os valores
+        """
+        config = {**DEFAULT_SEARCH_CONFIG, **(search_config or {})}
+        
+        if config['method'] not in SEARCH_METHODS:
+            raise ValueError(f"Invalid search method '{config['method']}'. Use one of: {', '.join(SEARCH_METHODS)}")
+        
+        for key in ('population_size', 'generations', 'elite_size', 'n_samples', 'grid_points', 'max_grid_size'):
+            config[key] = int(config[key])
+        config['mutation_rate'] = float(config['mutation_rate'])
+        config['min_improvement'] = float(config['min_improvement'])
+        if config['patience'] is not None:
+            config['patience'] = int(config['patience'])
+        
+        if config['population_size'] < 2 or config['generations'] < 1 or config['n_samples'] < 1:
+            raise ValueError("population_size must be >= 2, generations and n_samples must be >= 1")
+        if not 0 <= config['elite_size'] < config['population_size']:
+            raise ValueError("elite_size must be between 0 and population_size - 1")
+        if not 0.0 <= config['mutation_rate'] <= 1.0:
+            raise ValueError("mutation_rate must be between 0 and 1")
+        if config['patience'] is not None and config['patience'] < 1:
+            raise ValueError("patience must be >= 1")
+        if config['grid_points'] < 2:
+            raise ValueError("grid_points must be >= 2")
+        
+        config['screening_decimation'] = int(config['screening_decimation'])
+        config['promotion_fraction'] = float(config['promotion_fraction'])
+        if config['screening_window'] is not None:
+            config['screening_window'] = float(config['screening_window'])
+            if not 0.0 < config['screening_window'] <= 1.0:
+                raise ValueError("screening_window must be between 0 and 1")
+        if config['screening_decimation'] < 1:
+            raise ValueError("screening_decimation must be >= 1")
+        if not 0.0 < config['promotion_fraction'] <= 1.0:
+            raise ValueError("promotion_fraction must be between 0 and 1")
+        
+        config['walk_forward_test_fraction'] = float(config['walk_forward_test_fraction'])
+        if config['walk_forward_folds'] is not None:
+            config['walk_forward_folds'] = int(config['walk_forward_folds'])
+            if config['walk_forward_folds'] < 1:
+                raise ValueError("walk_forward_folds must be >= 1")
+        if not 0.0 < config['walk_forward_test_fraction'] < 1.0:
+            raise ValueError("walk_forward_test_fraction must be between 0 and 1 (exclusive)")
+        
+        return config
+    
     def update_job_status(self, job_id: int, status: str, completed_at: Optional[datetime] = None, progress: Optional[float] = None) -> None:
         """
         Atualiza o status de um job de otimização
@@ -265,6 +419,219 @@ class OptimizationService:
         finally:
             cursor.close()
     
+    def save_optimization_results_batch(self, job_id: int, results: List[Tuple[dict, dict]],
+                                        progress: Optional[float] = None,
+                                        checkpoint: Optional[dict] = None) -> int:
+        """
+        Salva um lote de resultados de otimização com um único INSERT multi-linha.
+        Se informados, o progresso e o checkpoint da geração são gravados na mesma transação,
+        garantindo que um job retomado não duplique resultados.
+        """
+        if not results and progress is None and checkpoint is None:
+            return 0
+        
+        self.db_service.ensure_connection()
+        cursor = self.db_service.connection.cursor()
+        
+        try:
+            if results:
+                rows = [
+                    (
+                        job_id,
+                        json.dumps(parameters),
+                        fitness.get('total_trades', 0),
+                        fitness.get('win_rate_percent', 0.0),
+                        fitness.get('net_profit_percent', 0.0),
+                        fitness.get('max_drawdown_percent', 0.0),
+                        fitness.get('sharpe_ratio', 0.0),
+                        fitness.get('fitness_score', 0.0),
+                        fitness.get('fidelity', 1.0),
+                        fitness.get('fold')
+                    ) + tuple(
+                        fitness['oos'].get(metric) if fitness.get('oos') else None
+                        for metric in OOS_METRICS
+                    )
+                    for parameters, fitness in results
+                ]
+                
+                # executemany de um INSERT simples é reescrito pelo conector como um único INSERT multi-linha
+                query = f"""
+                    INSERT INTO optimization_job_results 
+                    (job_id, parameters, total_trades, win_rate_percent, net_profit_percent, 
+                     max_drawdown_percent, sharpe_ratio, fitness_score, fidelity, fold,
+                     {', '.join('oos_' + metric for metric in OOS_METRICS)})
+                    VALUES ({', '.join(['%s'] * (10 + len(OOS_METRICS)))})
+                """
+                cursor.executemany(query, rows)
+            
+            if progress is not None:
+                progress = max(0.0, min(100.0, progress))
+                cursor.execute(
+                    "UPDATE strategy_optimization_jobs SET progress = %s WHERE id = %s",
+                    (progress, job_id)
+                )
+            
+            if checkpoint is not None:
+                cursor.execute(
+                    "UPDATE strategy_optimization_jobs SET current_generation = %s, checkpoint = %s WHERE id = %s",
+                    (checkpoint['generation'], json.dumps(checkpoint), job_id)
+                )
+            
+            self.db_service.connection.commit()
+            return len(results)
+            
+        except Exception as e:
+            self.db_service.connection.rollback()
+            logger.error(f"Error saving optimization results batch: {str(e)}")
+            raise e
+        finally:
+            cursor.close()
+    
+    # === FILA DE JOBS (consumida pelo optimizer_worker.py) ===
+
+    def claim_next_job(self, worker_id: str) -> Optional[dict]:
+        """
+        Reivindica o próximo job PENDING da fila de forma atômica.
+        Usa SELECT ... FOR UPDATE SKIP LOCKED para que vários workers possam consumir a fila sem conflito.
+        """
+        self.db_service.ensure_connection()
+        cursor = self.db_service.connection.cursor(dictionary=True)
+        
+        try:
+            # Rollback preventivo para iniciar uma transação limpa
+            self.db_service.connection.rollback()
+            
+            cursor.execute("""
+                SELECT id FROM strategy_optimization_jobs
+                WHERE status = 'PENDING'
+                ORDER BY created_at ASC, id ASC
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            """)
+            row = cursor.fetchone()
+            
+            if not row:
+                self.db_service.connection.commit()
+                return None
+            
+            cursor.execute("""
+                UPDATE strategy_optimization_jobs
+                SET status = 'RUNNING', worker_id = %s, heartbeat_at = NOW(), attempts = attempts + 1
+                WHERE id = %s
+            """, (worker_id, row['id']))
+            
+            cursor.execute("SELECT * FROM strategy_optimization_jobs WHERE id = %s", (row['id'],))
+            job = cursor.fetchone()
+            self.db_service.connection.commit()
+            
+            logger.info(f"Job {job['id']} claimed by worker {worker_id} (attempt {job['attempts']})")
+            return job
+            
+        except Exception as e:
+            self.db_service.connection.rollback()
+            logger.error(f"Error claiming optimization job: {str(e)}")
+            raise e
+        finally:
+            cursor.close()
+    
+    def enqueue_job(self, job_id: int) -> None:
+        """
+        Recoloca um job na fila zerando as tentativas (o checkpoint é mantido para retomada)
+        """
+        self.db_service.ensure_connection()
+        cursor = self.db_service.connection.cursor()
+        
+        try:
+            cursor.execute("""
+                UPDATE strategy_optimization_jobs
+                SET status = 'PENDING', attempts = 0, worker_id = NULL, heartbeat_at = NULL, completed_at = NULL
+                WHERE id = %s
+            """, (job_id,))
+            self.db_service.connection.commit()
+            logger.info(f"Job {job_id} enqueued")
+            
+        except Exception as e:
+            self.db_service.connection.rollback()
+            logger.error(f"Error enqueueing job {job_id}: {str(e)}")
+            raise e
+        finally:
+            cursor.close()
+    
+    def heartbeat_jobs(self, job_ids: List[int], worker_id: str) -> None:
+        """
+        Atualiza o heartbeat dos jobs em execução por um worker
+        """
+        if not job_ids:
+            return
+        
+        self.db_service.ensure_connection()
+        cursor = self.db_service.connection.cursor()
+        
+        try:
+            placeholders = ', '.join(['%s'] * len(job_ids))
+            query = f"""
+                UPDATE strategy_optimization_jobs SET heartbeat_at = NOW()
+                WHERE worker_id = %s AND status = 'RUNNING' AND id IN ({placeholders})
+            """
+            cursor.execute(query, (worker_id, *job_ids))
+            self.db_service.connection.commit()
+            
+        except Exception as e:
+            self.db_service.connection.rollback()
+            logger.error(f"Error updating job heartbeats: {str(e)}")
+        finally:
+            cursor.close()
+    
+    def requeue_job(self, job_id: int, max_attempts: int) -> None:
+        """
+        Devolve um job interrompido para a fila (ou marca como FAILED se excedeu as tentativas).
+        O checkpoint é preservado para que a execução seja retomada da última geração concluída.
+        """
+        self.db_service.ensure_connection()
+        cursor = self.db_service.connection.cursor()
+        
+        try:
+            cursor.execute("""
+                UPDATE strategy_optimization_jobs
+                SET status = IF(attempts >= %s, 'FAILED', 'PENDING'), worker_id = NULL, heartbeat_at = NULL
+                WHERE id = %s AND status = 'RUNNING'
+            """, (max_attempts, job_id))
+            self.db_service.connection.commit()
+            
+        except Exception as e:
+            self.db_service.connection.rollback()
+            logger.error(f"Error requeueing job {job_id}: {str(e)}")
+        finally:
+            cursor.close()
+    
+    def requeue_stale_jobs(self, stale_after_seconds: int, max_attempts: int) -> int:
+        """
+        Recupera jobs RUNNING cujo worker parou de enviar heartbeats (crash, restart, máquina perdida)
+        """
+        self.db_service.ensure_connection()
+        cursor = self.db_service.connection.cursor()
+        
+        try:
+            cursor.execute("""
+                UPDATE strategy_optimization_jobs
+                SET status = IF(attempts >= %s, 'FAILED', 'PENDING'), worker_id = NULL, heartbeat_at = NULL
+                WHERE status = 'RUNNING'
+                  AND (heartbeat_at IS NULL OR heartbeat_at < NOW() - INTERVAL %s SECOND)
+            """, (max_attempts, stale_after_seconds))
+            recovered = cursor.rowcount
+            self.db_service.connection.commit()
+            
+            if recovered:
+                logger.warning(f"Recovered {recovered} stale optimization jobs")
+            return recovered
+            
+        except Exception as e:
+            self.db_service.connection.rollback()
+            logger.error(f"Error recovering stale jobs: {str(e)}")
+            return 0
+        finally:
+            cursor.close()
+    
     def get_optimization_results(self, job_id: int, user_id: int, limit: int = 100) -> List[dict]:
         """
         Retorna os resultados de otimização ordenados por fitness score
@@ -279,10 +646,14 @@ class OptimizationService:
             if not cursor.fetchone():
                 raise ValueError("Optimization job not found or does not belong to user")
             
+            # Resumos walk-forward (com métricas fora da amostra) vêm primeiro, ordenados pelo teste.
+            # Resultados de triagem (fidelity < 1) usam um período reduzido e não são comparáveis
+            # aos backtests completos, por isso ficam sempre depois deles
             query = """
                 SELECT * FROM optimization_job_results 
                 WHERE job_id = %s 
-                ORDER BY fitness_score DESC 
+                ORDER BY (oos_fitness_score IS NOT NULL) DESC, oos_fitness_score DESC,
+                         fidelity DESC, fitness_score DESC 
                 LIMIT %s
             """
             cursor.execute(query, (job_id, limit))
@@ -298,14 +669,109 @@ class OptimizationService:
         finally:
             cursor.close()
     
-    def run_genetic_optimization(self, job_id: int) -> None:
+    def run_robustness_analysis(self, result_id: int, user_id: int, n_simulations: int = 2000,
+                                block_size: Optional[int] = None, confidence: float = 0.95,
+                                seed: Optional[int] = None, window: str = 'train',
+                                db_service: Optional[DatabaseService] = None) -> dict:
+        """
+        Reexecuta o backtest de um resultado salvo e aplica a análise Monte Carlo sobre os retornos
+        por candle e por trade. Resultados de um fold walk-forward usam a janela do próprio fold
+        (window='train' ou 'test'); os demais, o período completo do job.
+        Com db_service (ex: conexão dedicada da thread que executa a análise), todas as leituras,
+        inclusive as do histórico de preços, usam essa conexão em vez da compartilhada.
+        """
+        if window not in ('train', 'test'):
+            raise ValueError("window must be 'train' or 'test'")
+        
+        from services.monte_carlo_service import MonteCarloService
+        
+        db_service = db_service or self.db_service
+        db_service.ensure_connection()
+        cursor = db_service.connection.cursor(dictionary=True)
+        
+        try:
+            query = """
+                SELECT ojr.id, ojr.job_id, ojr.parameters, ojr.fold, soj.base_strategy_name, soj.timeframe,
+                       soj.start_date, soj.end_date, soj.search_config, a.symbol AS asset_symbol
+                FROM optimization_job_results ojr
+                JOIN strategy_optimization_jobs soj ON soj.id = ojr.job_id
+                JOIN assets a ON a.id = soj.asset_id
+                WHERE ojr.id = %s AND soj.user_id = %s
+            """
+            cursor.execute(query, (result_id, user_id))
+            result = cursor.fetchone()
+        finally:
+            cursor.close()
+        
+        if not result:
+            raise ValueError("Optimization result not found or does not belong to user")
+        
+        parameters = json.loads(result['parameters'])
+        start_date, end_date = result['start_date'], result['end_date']
+        if result['fold'] is not None:
+            # Mesma divisão usada na otimização: o resultado só vale para a janela do seu fold
+            config = self.normalize_search_config(
+                json.loads(result['search_config']) if result['search_config'] else None
+            )
+            fold_jobs = self._build_walk_forward_folds(result, config)
+            if result['fold'] >= len(fold_jobs):
+                raise ValueError(f"Walk-forward fold {result['fold']} not found in the job configuration")
+            fold_job = fold_jobs[result['fold']]
+            if window == 'test':
+                start_date, end_date = fold_job['test_start_date'], fold_job['test_end_date']
+            else:
+                start_date, end_date = fold_job['start_date'], fold_job['end_date']
+        
+        if db_service is self.db_service:
+            _, backtesting_service = _get_worker_services()
+        else:
+            from services.historical_data_service import HistoricalDataService
+            from services.backtesting_service import BacktestingService
+            backtesting_service = BacktestingService(HistoricalDataService(db_service))
+        backtest = backtesting_service.run_backtest(
+            asset_symbol=result['asset_symbol'],
+            timeframe=result['timeframe'],
+            start_date=start_date,
+            end_date=end_date,
+            base_strategy_name=result['base_strategy_name'],
+            parameters=parameters,
+            include_returns=True
+        )
+        if 'strategy_returns' not in backtest:
+            raise ValueError("Backtest failed for this result; robustness analysis is not available")
+        
+        analysis = MonteCarloService().analyze(
+            backtest['strategy_returns'],
+            backtest['trade_returns'],
+            backtesting_service.annualization_factor.get(result['timeframe'], 252),
+            n_simulations=n_simulations,
+            block_size=block_size,
+            confidence=confidence,
+            seed=seed if seed is not None else result_id
+        )
+        
+        return {
+            'result_id': result_id,
+            'job_id': result['job_id'],
+            'fold': result['fold'],
+            'start_date': start_date,
+            'end_date': end_date,
+            'parameters': parameters,
+            'total_trades': backtest['total_trades'],
+            **analysis
+        }
+    
+    def run_optimization(self, job_id: int) -> None:
         """
-        Executa o algoritmo genético para otimização de parâmetros
+        Executa a otimização de parâmetros de um job usando o método definido em search_config.
+        Com walk_forward_folds, a busca roda em cada janela de treino e o melhor conjunto de
+        cada fold é validado na janela de teste seguinte (fora da amostra).
         """
-        logger.info(f"Starting genetic optimization for job {job_id}")
+        logger.info(f"Starting optimization for job {job_id}")
 
         try:
             # Buscar dados do job
+            self.db_service.ensure_connection()
             cursor = self.db_service.connection.cursor(dictionary=True)
             cursor.execute("select soj.*,a.symbol as asset_symbol from strategy_optimization_jobs soj join assets a on a.id = soj.asset_id WHERE soj.id = %s", (job_id,))
             job = cursor.fetchone()
@@ -317,105 +783,367 @@ class OptimizationService:
             # Atualizar status para RUNNING
             self.update_job_status(job_id, 'RUNNING')
             
-            # Deserializar parameter_ranges
-            parameter_ranges = json.loads(job['parameter_ranges'])
+            # Deserializar parameter_ranges e search_config
+            self._deserialize_job_json(job)
+            parameter_ranges = job['parameter_ranges']
+            config = job['search_config']
+            fold_jobs = self._build_walk_forward_folds(job, config)
             
-            # Configurações do algoritmo genético
-            # EXEMPLO
-            POPULATION_SIZE = 20
-            GENERATIONS = 10
-            MUTATION_RATE = 0.1
-            ELITE_SIZE = 2
-
-            # Gerar população inicial
-            population = self._generate_initial_population(parameter_ranges, POPULATION_SIZE)
+            # Checkpoint existe quando o job foi reenfileirado após falha do worker
+            checkpoint = json.loads(job['checkpoint']) if job.get('checkpoint') else None
+            if checkpoint:
+                checkpoint = self._upgrade_checkpoint(checkpoint, config)
+                logger.info(f"Resuming job {job_id} after step {checkpoint['generation'] + 1}")
             
-            best_fitness = -float('inf')
-            best_individual = None
+            if config['method'] == 'grid':
+                candidates = self._build_parameter_grid(parameter_ranges, config)
+                checkpoint = self._run_batched_search(job, fold_jobs, candidates, config, checkpoint)
+            elif config['method'] == 'random':
+                seed = config['seed'] if config['seed'] is not None else job_id
+                rng = random.Random(seed)
+                candidates = [self._sample_individual(parameter_ranges, rng) for _ in range(config['n_samples'])]
+                checkpoint = self._run_batched_search(job, fold_jobs, candidates, config, checkpoint)
+            else:
+                checkpoint = self._run_genetic_search(job, fold_jobs, parameter_ranges, config, checkpoint)
             
-            # Evolução por gerações
-            for generation in range(GENERATIONS):
-                logger.info(f"Generation {generation + 1}/{GENERATIONS}")
-                
-                # Calcular e atualizar progresso
-                progress = ((generation + 1) / GENERATIONS) * 100
-                self.update_job_progress(job_id, progress)
-                
-                # Avaliar fitness de cada indivíduo em paralelo
-                fitness_scores = self._evaluate_population_parallel(population, job, job_id)
-                
-                # Rastrear melhor indivíduo desta geração
-                for i, fitness in enumerate(fitness_scores):
-                    if fitness['fitness_score'] > best_fitness:
-                        best_fitness = fitness['fitness_score']
-                        best_individual = population[i].copy()
-                
-                # Seleção, crossover e mutação para próxima geração
-                if generation < GENERATIONS - 1:  # Não evolui na última geração
-                    population = self._evolve_population(
-                        population, fitness_scores, ELITE_SIZE, MUTATION_RATE, parameter_ranges
-                    )
+            if config['walk_forward_folds'] and not checkpoint.get('walk_forward_done'):
+                self._evaluate_walk_forward_folds(job, fold_jobs, checkpoint)
             
             # Atualizar status para COMPLETED com progresso 100%
             self.update_job_status(job_id, 'COMPLETED', datetime.now(), 100.0)
             
-            logger.info(f"Genetic optimization completed for job {job_id}")
-            logger.info(f"Best fitness: {best_fitness}")
-            logger.info(f"Best parameters: {best_individual}")
+            logger.info(f"Optimization ({config['method']}) completed for job {job_id}")
+            for fold_job, state in zip(fold_jobs, checkpoint['fold_states']):
+                prefix = f"Fold {fold_job['fold'] + 1} - " if config['walk_forward_folds'] else ""
+                logger.info(f"{prefix}Best fitness: {state['best_fitness']}")
+                logger.info(f"{prefix}Best parameters: {state['best_individual']}")
             
         except Exception as e:
-            logger.error(f"Error in genetic optimization: {str(e)}")
-            print(f"Error in genetic optimization: {str(e)}")
+            logger.error(f"Error in optimization: {str(e)}")
+            print(f"Error in optimization: {str(e)}")
             self.update_job_status(job_id, 'FAILED')
             raise e
+        finally:
+            self._shutdown_executor()
     
-    def _generate_initial_population(self, parameter_ranges: dict, population_size: int) -> List[dict]:
+    def _run_genetic_search(self, job: dict, fold_jobs: List[dict], parameter_ranges: dict, config: dict,
+                            checkpoint: Optional[dict]) -> dict:
         """
-        Gera população inicial aleatória dentro dos ranges especificados
+        Algoritmo genético com parada antecipada quando o fitness converge (patience).
+        Cada fold evolui sua própria população; as populações de todos os folds ainda ativos
+        são avaliadas juntas a cada geração, no mesmo pool de processos.
+        Retorna o checkpoint final (estado de cada fold).
         """
-        population = []
+        generations = config['generations']
         
-        for _ in range(population_size):
-            individual = {}
-            for param_name, param_range in parameter_ranges.items():
-                if param_range['type'] == 'int':
-                    individual[param_name] = random.randint(param_range['min'], param_range['max'])
-                elif param_range['type'] == 'float':
-                    individual[param_name] = random.uniform(param_range['min'], param_range['max'])
-                elif param_range['type'] == 'choice':
-                    individual[param_name] = random.choice(param_range['values'])
+        if checkpoint:
+            # Retomar a partir da última geração concluída
+            start_generation = checkpoint['generation'] + 1
+            states = checkpoint['fold_states']
+            populations = checkpoint['populations']
+            fold_scores = [[{'fitness_score': score} for score in scores] for scores in checkpoint['fitness_scores']]
             
-            population.append(individual)
+            if start_generation < generations:
+                populations = [
+                    population if self._has_converged(state, config) else self._evolve_population(
+                        population, scores, config['elite_size'], config['mutation_rate'], parameter_ranges
+                    )
+                    for population, scores, state in zip(populations, fold_scores, states)
+                ]
+        else:
+            # Gerar população inicial de cada fold
+            start_generation = 0
+            states = [self._new_search_state() for _ in fold_jobs]
+            populations = [self._generate_initial_population(parameter_ranges, config['population_size']) for _ in fold_jobs]
+            fold_scores = [[] for _ in fold_jobs]
+            checkpoint = self._build_checkpoint(-1, states)
         
-        return population
+        # Evolução por gerações
+        for generation in range(start_generation, generations):
+            active = [k for k, state in enumerate(states) if not self._has_converged(state, config)]
+            if not active:
+                break
+            
+            logger.info(f"Generation {generation + 1}/{generations} ({len(active)} active folds)")
+            
+            # Progresso é gravado junto com os resultados da geração
+            progress = ((generation + 1) / generations) * 100
+            
+            # Avaliar fitness de cada indivíduo (de todos os folds ativos) em paralelo
+            population = [individual for k in active for individual in populations[k]]
+            eval_jobs = [fold_jobs[k] for k in active for _ in populations[k]]
+            fitness_scores, pending_results = self._evaluate_population(job, population, eval_jobs)
+            
+            # Rastrear melhor indivíduo e convergência de cada fold
+            for k, scores in zip(active, self._split_by_fold(fitness_scores, [len(populations[k]) for k in active])):
+                fold_scores[k] = scores
+                states[k] = self._update_search_state(states[k], populations[k], scores, config)
+            
+            checkpoint = self._build_checkpoint(generation, states, populations, fold_scores)
+            self._flush_results(job['id'], pending_results, progress, checkpoint)
+            
+            if all(self._has_converged(state, config) for state in states):
+                logger.info(f"Fitness converged: no improvement for {config['patience']} generations, stopping early")
+                break
+            
+            # Seleção, crossover e mutação para próxima geração
+            if generation < generations - 1:  # Não evolui na última geração
+                for k in active:
+                    if not self._has_converged(states[k], config):
+                        populations[k] = self._evolve_population(
+                            populations[k], fold_scores[k], config['elite_size'], config['mutation_rate'], parameter_ranges
+                        )
+        
+        return checkpoint
     
-    def _evaluate_fitness(self, parameters: dict, job: dict) -> dict:
+    def _run_batched_search(self, job: dict, fold_jobs: List[dict], candidates: List[dict], config: dict,
+                            checkpoint: Optional[dict]) -> dict:
         """
-        Avalia o fitness de um conjunto de parâmetros executando um backtest real.
+        Avalia uma lista fixa de candidatos (grid ou random search) em lotes de population_size.
+        Cada lote é avaliado em todos os folds ao mesmo tempo. Retorna o checkpoint final.
         """
-        try:
-            # Chama o serviço de backtest com os dados do job e os parâmetros do indivíduo
-            backtest_results = self.backtesting_service.run_backtest(
-                asset_symbol=job['asset_symbol'], 
-                timeframe=job['timeframe'],
-                start_date=job['start_date'],
-                end_date=job['end_date'],
-                base_strategy_name=job['base_strategy_name'],
-                parameters=parameters
-            )
-            return backtest_results
+        batch_size = config['population_size']
+        batches = [candidates[i:i + batch_size] for i in range(0, len(candidates), batch_size)]
+        
+        if checkpoint:
+            # A lista de candidatos é determinística, então basta pular os lotes já avaliados
+            start_batch = checkpoint['generation'] + 1
+            states = checkpoint['fold_states']
+        else:
+            start_batch = 0
+            states = [self._new_search_state() for _ in fold_jobs]
+            checkpoint = self._build_checkpoint(-1, states)
+        
+        logger.info(f"Evaluating {len(candidates)} candidates in {len(batches)} batches across {len(fold_jobs)} folds")
+        
+        for batch_index in range(start_batch, len(batches)):
+            batch = batches[batch_index]
+            progress = ((batch_index + 1) / len(batches)) * 100
             
-        except Exception as e:
-            logger.error(f"Error in fitness evaluation via backtesting service: {str(e)}")
-            # Retorna um resultado de erro/penalidade se o serviço de backtest falhar
-            return {
-                'total_trades': 0,
-                'win_rate_percent': 0.0,
-                'net_profit_percent': -100.0,
-                'max_drawdown_percent': 100.0,
-                'sharpe_ratio': -10.0,
-                'fitness_score': -1000.0
-            }
+            population = batch * len(fold_jobs)
+            eval_jobs = [fold_job for fold_job in fold_jobs for _ in batch]
+            fitness_scores, pending_results = self._evaluate_population(job, population, eval_jobs)
+            
+            states = [
+                self._update_search_state(state, batch, scores, config)
+                for state, scores in zip(states, self._split_by_fold(fitness_scores, [len(batch)] * len(fold_jobs)))
+            ]
+            checkpoint = self._build_checkpoint(batch_index, states)
+            self._flush_results(job['id'], pending_results, progress, checkpoint)
+        
+        return checkpoint
+    
+    def _build_walk_forward_folds(self, job: dict, config: dict) -> List[dict]:
+        """
+        Divide o período do job em folds walk-forward (janela deslizante): cada fold tem uma
+        janela de treino seguida de uma janela de teste, e o fold seguinte avança o tamanho do teste.
+        Sem walk-forward, o próprio job é o único fold.
+        """
+        folds = config['walk_forward_folds']
+        if not folds:
+            return [job]
+        
+        test_fraction = config['walk_forward_test_fraction']
+        total_days = (job['end_date'] - job['start_date']).days
+        # n testes consecutivos + 1 janela de treino cobrem o período inteiro
+        test_days = int(total_days / (folds + (1 - test_fraction) / test_fraction))
+        train_days = total_days - folds * test_days
+        if test_days < 1:
+            raise ValueError(f"Period of {total_days} days is too short for {folds} walk-forward folds")
+        
+        fold_jobs = []
+        for fold in range(folds):
+            train_start = job['start_date'] + timedelta(days=fold * test_days)
+            train_end = train_start + timedelta(days=train_days)
+            fold_jobs.append({
+                **job,
+                'fold': fold,
+                'start_date': train_start,
+                'end_date': train_end,
+                'test_start_date': train_end + timedelta(days=1),
+                'test_end_date': min(train_end + timedelta(days=test_days), job['end_date']),
+                # Todos os folds recortam a mesma série carregada uma única vez por processo
+                'data_start_date': job['start_date'],
+                'data_end_date': job['end_date']
+            })
+        
+        return fold_jobs
+    
+    def _evaluate_walk_forward_folds(self, job: dict, fold_jobs: List[dict], checkpoint: dict) -> None:
+        """
+        Reavalia o melhor conjunto de cada fold na janela de treino e na de teste e grava
+        um resumo por fold com as métricas fora da amostra (oos_*).
+        """
+        folds = [
+            (fold_job, state['best_individual'])
+            for fold_job, state in zip(fold_jobs, checkpoint['fold_states'])
+            if state['best_individual'] is not None
+        ]
+        
+        tasks = []
+        population = []
+        for fold_job, best_individual in folds:
+            test_job = {**fold_job, 'start_date': fold_job['test_start_date'], 'end_date': fold_job['test_end_date']}
+            tasks.extend([self._build_evaluation_task(best_individual, fold_job),
+                          self._build_evaluation_task(best_individual, test_job)])
+            population.extend([best_individual, best_individual])
+        
+        scores, _ = self._evaluate_population_parallel(tasks, population)
+        
+        summaries = []
+        for index, (fold_job, best_individual) in enumerate(folds):
+            in_sample, out_of_sample = scores[2 * index], scores[2 * index + 1]
+            summaries.append((best_individual, {**in_sample, 'oos': out_of_sample}))
+            logger.info(
+                f"Walk-forward fold {fold_job['fold'] + 1}: in-sample fitness {in_sample.get('fitness_score')}, "
+                f"out-of-sample fitness {out_of_sample.get('fitness_score')}"
+            )
+        
+        # O resumo é gravado junto com a marcação no checkpoint para não duplicar ao retomar
+        self._flush_results(job['id'], summaries, 100.0, {**checkpoint, 'walk_forward_done': True})
+    
+    def _new_search_state(self) -> dict:
+        """
+        Estado inicial de busca de um fold
+        """
+        return {'best_fitness': None, 'best_individual': None, 'stale_generations': 0}
+    
+    def _split_by_fold(self, fitness_scores: List[dict], sizes: List[int]) -> List[List[dict]]:
+        """
+        Separa os fitness de uma avaliação conjunta em uma lista por fold
+        """
+        groups = []
+        offset = 0
+        for size in sizes:
+            groups.append(fitness_scores[offset:offset + size])
+            offset += size
+        return groups
+    
+    def _upgrade_checkpoint(self, checkpoint: dict, config: dict) -> dict:
+        """
+        Converte checkpoints gravados antes do suporte a folds (estado anterior ao passo,
+        população única) para o formato atual (estado após o passo, um item por fold).
+        """
+        if 'fold_states' in checkpoint:
+            return checkpoint
+        
+        fitness_scores = [{'fitness_score': score} for score in checkpoint['fitness_scores']]
+        state = self._update_search_state(checkpoint, checkpoint['population'], fitness_scores, config)
+        return self._build_checkpoint(checkpoint['generation'], [state], [checkpoint['population']], [fitness_scores])
+    
+    def _update_search_state(self, state: dict, population: List[dict], fitness_scores: List[dict],
+                             config: dict) -> dict:
+        """
+        Atualiza melhor indivíduo e contagem de gerações sem melhoria após uma avaliação
+        """
+        previous_best = state.get('best_fitness')
+        best_fitness = previous_best
+        best_individual = state.get('best_individual')
+        
+        for individual, fitness in zip(population, fitness_scores):
+            score = fitness.get('fitness_score', -1000)
+            if best_fitness is None or score > best_fitness:
+                best_fitness = score
+                best_individual = dict(individual)
+        
+        improved = previous_best is None or best_fitness - previous_best > config['min_improvement']
+        
+        return {
+            'best_fitness': best_fitness,
+            'best_individual': best_individual,
+            'stale_generations': 0 if improved else state.get('stale_generations', 0) + 1
+        }
+    
+    def _has_converged(self, state: dict, config: dict) -> bool:
+        """
+        Indica se o GA deve parar por falta de melhoria (patience)
+        """
+        return config['patience'] is not None and state['stale_generations'] >= config['patience']
+    
+    def _generate_initial_population(self, parameter_ranges: dict, population_size: int) -> List[dict]:
+        """
+        Gera população inicial aleatória dentro dos ranges especificados
+        """
+        return [self._sample_individual(parameter_ranges) for _ in range(population_size)]
+    
+    def _sample_individual(self, parameter_ranges: dict, rng=random) -> dict:
+        """
+        Sorteia um conjunto de parâmetros dentro dos ranges especificados
+        """
+        individual = {}
+        for param_name, param_range in parameter_ranges.items():
+            if param_range['type'] == 'int':
+                individual[param_name] = rng.randint(param_range['min'], param_range['max'])
+            elif param_range['type'] == 'float':
+                individual[param_name] = rng.uniform(param_range['min'], param_range['max'])
+            elif param_range['type'] == 'choice':
+                individual[param_name] = rng.choice(param_range['values'])
+        
+        return individual
+    
+    def _build_parameter_grid(self, parameter_ranges: dict, config: dict) -> List[dict]:
+        """
+        Monta todas as combinações de parâmetros para busca exaustiva.
+        int usa 'step' (padrão 1); float usa 'step' ou grid_points pontos igualmente espaçados.
+        """
+        axes = {}
+        for param_name, param_range in parameter_ranges.items():
+            if param_range['type'] == 'int':
+                step = int(param_range.get('step', 1))
+                axes[param_name] = list(range(param_range['min'], param_range['max'] + 1, step))
+            elif param_range['type'] == 'float':
+                if param_range.get('step'):
+                    values = np.arange(param_range['min'], param_range['max'] + param_range['step'] / 2, param_range['step'])
+                else:
+                    values = np.linspace(param_range['min'], param_range['max'], config['grid_points'])
+                axes[param_name] = [round(float(value), 10) for value in values]
+            elif param_range['type'] == 'choice':
+                axes[param_name] = list(param_range['values'])
+        
+        grid_size = int(np.prod([len(values) for values in axes.values()])) if axes else 0
+        if grid_size > config['max_grid_size']:
+            raise ValueError(
+                f"Parameter grid has {grid_size} combinations (max_grid_size={config['max_grid_size']}). "
+                f"Use 'random' or 'genetic' search, or increase the step sizes"
+            )
+        
+        names = list(axes.keys())
+        return [dict(zip(names, combination)) for combination in itertools.product(*axes.values())]
+    
+    def _evaluate_fitness(self, parameters: dict, job: dict, fidelity: Optional[dict] = None) -> dict:
+        """
+        Avalia o fitness de um conjunto de parâmetros executando um backtest real no processo atual.
+        """
+        return _evaluate_individual_parallel(self._build_evaluation_task(parameters, job, fidelity))
+    
+    def _build_evaluation_task(self, parameters: dict, job: dict, fidelity: Optional[dict] = None) -> dict:
+        """
+        Monta os dados de um backtest. Com fidelity, o período é reduzido à fração final
+        (window) e/ou decimado (decimation) para uma triagem barata.
+        data_start_date/data_end_date indicam a série carregada (e mantida em cache) pelo processo
+        de avaliação; o backtest usa apenas o recorte start_date..end_date dela.
+        """
+        task_data = {
+            'parameters': parameters,
+            'asset_symbol': job['asset_symbol'],
+            'timeframe': job['timeframe'],
+            'start_date': job['start_date'],
+            'end_date': job['end_date'],
+            'data_start_date': job.get('data_start_date', job['start_date']),
+            'data_end_date': job.get('data_end_date', job['end_date']),
+            'base_strategy_name': job['base_strategy_name'],
+            'fold': job.get('fold')
+        }
+        
+        if fidelity:
+            window = fidelity.get('window') or 1.0
+            decimation = fidelity.get('decimation', 1)
+            total_days = (job['end_date'] - job['start_date']).days
+            task_data['start_date'] = job['end_date'] - timedelta(days=int(total_days * window))
+            task_data['decimation'] = decimation
+            task_data['fidelity'] = round(window / decimation, 4)
+        
+        return task_data
     
     def _evolve_population(self, population: List[dict], fitness_scores: List[dict], 
                           elite_size: int, mutation_rate: float, parameter_ranges: dict) -> List[dict]:
@@ -487,93 +1215,201 @@ class OptimizationService:
         
         return mutated
     
-    def _evaluate_population_parallel(self, population: List[dict], job: dict, job_id: int) -> List[dict]:
+    def _evaluate_population(self, job: dict, population: List[dict],
+                             eval_jobs: List[dict]) -> Tuple[List[dict], List[Tuple[dict, dict]]]:
+        """
+        Avalia uma população (geração ou lote); eval_jobs traz o job (ou fold) de cada indivíduo.
+        Com multi-fidelity ativo, todos são triados em um período reduzido e apenas a fração
+        promotion_fraction com melhor fitness de cada fold recebe o backtest completo.
+        Retorna os fitness e os resultados ainda não gravados.
+        """
+        config = job['search_config']
+        multi_fidelity = config['screening_window'] is not None or config['screening_decimation'] > 1
+        
+        if not multi_fidelity:
+            tasks = [self._build_evaluation_task(individual, eval_job) for individual, eval_job in zip(population, eval_jobs)]
+            return self._evaluate_population_parallel(tasks, population)
+        
+        fidelity = {'window': config['screening_window'], 'decimation': config['screening_decimation']}
+        tasks = [self._build_evaluation_task(individual, eval_job, fidelity) for individual, eval_job in zip(population, eval_jobs)]
+        screening_scores, pending_results = self._evaluate_population_parallel(tasks, population)
+        
+        # Promover os melhores da triagem de cada fold (fitness de períodos diferentes não são comparáveis)
+        groups = self._group_by_fold(eval_jobs)
+        promoted_groups = []
+        for indices in groups:
+            promoted_count = max(1, int(np.ceil(len(indices) * config['promotion_fraction'])))
+            ranking = sorted(indices, key=lambda i: screening_scores[i]['fitness_score'], reverse=True)
+            promoted_groups.append(ranking[:promoted_count])
+        promoted = [i for group in promoted_groups for i in group]
+        
+        full_tasks = [self._build_evaluation_task(population[i], eval_jobs[i]) for i in promoted]
+        full_scores, full_pending = self._evaluate_population_parallel(full_tasks, [population[i] for i in promoted])
+        pending_results.extend(full_pending)
+        full_by_index = dict(zip(promoted, full_scores))
+        
+        fitness_scores = list(screening_scores)
+        for indices, group_promoted in zip(groups, promoted_groups):
+            positions = {index: position for position, index in enumerate(indices)}
+            merged = self._merge_fidelity_scores(
+                [screening_scores[i] for i in indices],
+                [positions[i] for i in group_promoted],
+                [full_by_index[i] for i in group_promoted]
+            )
+            for index, fitness in zip(indices, merged):
+                fitness_scores[index] = fitness
+        
+        logger.info(f"Multi-fidelity: {len(population)} screened, {len(promoted)} promoted to full backtest")
+        return fitness_scores, pending_results
+    
+    def _group_by_fold(self, eval_jobs: List[dict]) -> List[List[int]]:
+        """
+        Agrupa os índices da população pelo fold avaliado, na ordem de aparição
+        """
+        groups = {}
+        for index, eval_job in enumerate(eval_jobs):
+            groups.setdefault(eval_job.get('fold'), []).append(index)
+        return list(groups.values())
+    
+    def _merge_fidelity_scores(self, screening_scores: List[dict], promoted: List[int],
+                               full_scores: List[dict]) -> List[dict]:
+        """
+        Combina os fitness da triagem e do backtest completo para a seleção.
+        Candidatos não promovidos são deslocados para ficar abaixo do pior promovido,
+        preservando a ordem relativa entre eles.
+        """
+        fitness_scores = list(screening_scores)
+        for index, fitness in zip(promoted, full_scores):
+            fitness_scores[index] = fitness
+        
+        promoted_set = set(promoted)
+        eliminated = [i for i in range(len(fitness_scores)) if i not in promoted_set]
+        if not eliminated:
+            return fitness_scores
+        
+        worst_promoted = min(fitness['fitness_score'] for fitness in full_scores)
+        best_eliminated = max(fitness_scores[i]['fitness_score'] for i in eliminated)
+        offset = worst_promoted - best_eliminated - 1
+        
+        if offset < 0:
+            for i in eliminated:
+                fitness_scores[i] = {**fitness_scores[i], 'fitness_score': fitness_scores[i]['fitness_score'] + offset}
+        
+        return fitness_scores
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """
+        Retorna o pool de avaliação do job, criando-o na primeira utilização
+        """
+        if self._executor is None:
+            if self.data_service_factory is not None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_init_worker_services,
+                    initargs=(self.data_service_factory,)
+                )
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+    
+    def _shutdown_executor(self) -> None:
+        """
+        Encerra o pool de avaliação (fim do job ou pool quebrado)
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+    
+    def _evaluate_population_parallel(self, tasks: List[dict],
+                                      population: List[dict]) -> Tuple[List[dict], List[Tuple[dict, dict]]]:
         """
-        Avalia uma população de indivíduos em paralelo.
+        Avalia uma lista de tarefas de backtest em paralelo no pool do job.
+        Retorna os fitness na ordem das tarefas e os resultados ainda não gravados; eles só são
+        gravados junto com o checkpoint do passo, para que um job retomado não os duplique.
         """
         try:
-            # Preparar dados para processamento paralelo
-            evaluation_tasks = []
-            for individual in population:
-                task_data = {
-                    'parameters': individual,
-                    'asset_symbol': job['asset_symbol'],
-                    'timeframe': job['timeframe'],
-                    'start_date': job['start_date'],
-                    'end_date': job['end_date'],
-                    'base_strategy_name': job['base_strategy_name']
-                }
-                evaluation_tasks.append(task_data)
-            
             # Executar avaliações em paralelo
             fitness_scores = []
+            pending_results = []
+            executor = self._get_executor()
             
-            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
-                # Submeter todas as tarefas
-                future_to_individual = {
-                    executor.submit(_evaluate_individual_parallel, task): i 
-                    for i, task in enumerate(evaluation_tasks)
-                }
-                
-                # Coletar resultados conforme completam
-                for future in as_completed(future_to_individual):
-                    individual_index = future_to_individual[future]
-                    try:
-                        fitness = future.result()
-                        fitness_scores.append((individual_index, fitness))
-                        
-                        # Salvar resultado no banco
-                        self.save_optimization_result(
-                            job_id=job_id,
-                            parameters=population[individual_index],
-                            total_trades=fitness.get('total_trades', 0),
-                            win_rate_percent=fitness.get('win_rate_percent', 0.0),
-                            net_profit_percent=fitness.get('net_profit_percent', 0.0),
-                            max_drawdown_percent=fitness.get('max_drawdown_percent', 0.0),
-                            sharpe_ratio=fitness.get('sharpe_ratio', 0.0),
-                            fitness_score=fitness.get('fitness_score', 0.0)
-                        )
-                        
-                    except Exception as e:
-                        logger.error(f"Error in parallel evaluation: {str(e)}")
-                        fitness_scores.append((individual_index, {'fitness_score': -1000}))
+            # Submeter todas as tarefas
+            future_to_individual = {
+                executor.submit(_evaluate_individual_parallel, task): i 
+                for i, task in enumerate(tasks)
+            }
+            
+            # Coletar resultados conforme completam
+            for future in as_completed(future_to_individual):
+                individual_index = future_to_individual[future]
+                try:
+                    fitness = future.result()
+                    fitness_scores.append((individual_index, fitness))
+                    pending_results.append((population[individual_index], fitness))
+                except Exception as e:
+                    logger.error(f"Error in parallel evaluation: {str(e)}")
+                    fitness_scores.append((individual_index, {'fitness_score': -1000}))
             
             # Reorganizar resultados na ordem original
             fitness_scores.sort(key=lambda x: x[0])
-            return [fitness for _, fitness in fitness_scores]
+            return [fitness for _, fitness in fitness_scores], pending_results
             
         except Exception as e:
             logger.error(f"Error in parallel population evaluation: {str(e)}")
-            # Fallback para processamento sequencial
-            return self._evaluate_population_sequential(population, job, job_id)
+            # Pool possivelmente quebrado: encerrar (sem deixar processos órfãos) e usar processamento sequencial
+            self._shutdown_executor()
+            return self._evaluate_population_sequential(tasks, population)
     
-    def _evaluate_population_sequential(self, population: List[dict], job: dict, job_id: int) -> List[dict]:
+    def _evaluate_population_sequential(self, tasks: List[dict],
+                                        population: List[dict]) -> Tuple[List[dict], List[Tuple[dict, dict]]]:
         """
-        Avalia uma população sequencialmente (fallback).
+        Avalia uma lista de tarefas sequencialmente no processo atual (fallback).
         """
         fitness_scores = []
-        for individual in population:
+        pending_results = []
+        for individual, task in zip(population, tasks):
             try:
-                fitness = self._evaluate_fitness(individual, job)
+                fitness = _evaluate_individual_parallel(task)
                 fitness_scores.append(fitness)
-                
-                # Salvar resultado no banco
-                self.save_optimization_result(
-                    job_id=job_id,
-                    parameters=individual,
-                    total_trades=fitness.get('total_trades', 0),
-                    win_rate_percent=fitness.get('win_rate_percent', 0.0),
-                    net_profit_percent=fitness.get('net_profit_percent', 0.0),
-                    max_drawdown_percent=fitness.get('max_drawdown_percent', 0.0),
-                    sharpe_ratio=fitness.get('sharpe_ratio', 0.0),
-                    fitness_score=fitness.get('fitness_score', 0.0)
-                )
-                
+                pending_results.append((individual, fitness))
             except Exception as e:
                 logger.error(f"Error evaluating individual: {str(e)}")
                 fitness_scores.append({'fitness_score': -1000})
                 
-        return fitness_scores
+        return fitness_scores, pending_results
+    
+    def _build_checkpoint(self, generation: int, fold_states: List[dict],
+                          populations: Optional[List[List[dict]]] = None,
+                          fold_scores: Optional[List[List[dict]]] = None) -> dict:
+        """
+        Monta o estado necessário para retomar a busca após o passo (geração/lote) avaliado:
+        melhor resultado de cada fold e, no GA, as populações e fitness do passo.
+        """
+        checkpoint = {'generation': generation, 'fold_states': fold_states}
+        if populations is not None:
+            checkpoint['populations'] = populations
+            checkpoint['fitness_scores'] = [
+                [fitness.get('fitness_score', -1000) for fitness in scores] for scores in fold_scores
+            ]
+        return checkpoint
+    
+    def _flush_results(self, job_id: int, results: List[Tuple[dict, dict]],
+                       progress: Optional[float] = None, checkpoint: Optional[dict] = None) -> None:
+        """
+        Grava o buffer de resultados junto com o checkpoint do passo. Falhas do banco são repetidas
+        (com reconexão); se persistirem, a exceção é propagada e o job falha, em vez de seguir sem o
+        passo gravado e ser retomado de um checkpoint que não corresponde aos resultados salvos.
+        """
+        for attempt in range(1, RESULTS_FLUSH_ATTEMPTS + 1):
+            try:
+                self.save_optimization_results_batch(job_id, results, progress, checkpoint)
+                return
+            except Exception as e:
+                if attempt >= RESULTS_FLUSH_ATTEMPTS:
+                    raise
+                logger.warning(f"Error flushing {len(results)} optimization results "
+                               f"(attempt {attempt}/{RESULTS_FLUSH_ATTEMPTS}): {str(e)}")
+                time.sleep(2 ** attempt)
     
     def get_best_parameters(self, job_id: int, user_id: int) -> Optional[dict]:
         """
@@ -591,8 +1427,13 @@ class OptimizationService:
                     'net_profit_percent': best_result['net_profit_percent'],
                     'max_drawdown_percent': best_result['max_drawdown_percent'],
                     'sharpe_ratio': best_result['sharpe_ratio'],
-                    'fitness_score': best_result['fitness_score']
-                }
+                    'fitness_score': best_result['fitness_score'],
+                    'fidelity': best_result['fidelity']
+                },
+                'fold': best_result.get('fold'),
+                'out_of_sample_metrics': {
+                    metric: best_result.get(f'oos_{metric}') for metric in OOS_METRICS
+                } if best_result.get('oos_fitness_score') is not None else None
             }
         
         return None
\ No newline at end of file
@@ -5,7 +5,7 @@ import logging
 import os
 import requests
 import xml.etree.ElementTree as ET
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 from decimal import Decimal
 from datetime import datetime, timedelta
 from .database_service import DatabaseService
@@ -14,6 +14,10 @@ from .historical_data_service import HistoricalDataService
 logger = logging.getLogger(__name__)
 
 class PriceService:
+    # Ouvintes notificados a cada busca de preços cripto (ex: streaming de barras do datafeed),
+    # compartilhados por todas as instâncias: callback(prices_usd_por_api_id, timestamp_unix)
+    price_listeners: List[Callable[[Dict[str, float], float], None]] = []
+
     def __init__(self, db_service: DatabaseService = None):
         self.base_url = "https://api.coingecko.com/api/v3"
         self.alpha_vantage_base = "https://www.alphavantage.co/query"
@@ -99,6 +103,7 @@ class PriceService:
                     # NÃO adicionar ao dict prices - deixar que o asset_service trate a ausência
             
             logger.info(f"Successfully fetched {len(prices)} crypto prices")
+            self._notify_price_listeners(prices)
             return prices
             
         except httpx.RequestError as e:
@@ -111,6 +116,23 @@ class PriceService:
             logger.error(f"Unexpected error fetching crypto prices: {e}")
             return {}
     
+    @classmethod
+    def add_price_listener(cls, listener: Callable[[Dict[str, float], float], None]) -> None:
+        """Registra um ouvinte dos preços cripto buscados por qualquer instância."""
+        if listener not in cls.price_listeners:
+            cls.price_listeners.append(listener)
+
+    def _notify_price_listeners(self, prices: Dict[str, float]) -> None:
+        """Repassa os preços recém-buscados aos ouvintes (falhas de um ouvinte não afetam a busca)."""
+        if not prices:
+            return
+        fetched_at = time.time()
+        for listener in self.price_listeners:
+            try:
+                listener(prices, fetched_at)
+            except Exception as e:
+                logger.error(f"Erro em ouvinte de preços: {e}")
+
     async def get_usd_to_brl_rate(self) -> float:
         """
         Busca a cotação USD/BRL usando o preço do Tether (USDT) em BRL.
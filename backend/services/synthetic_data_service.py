@@ -0,0 +1,212 @@
+"""
+Geração de séries de preços sintéticas (OHLCV) reprodutíveis.
+Usada pelo benchmark de backtests/otimização como substituto em memória do HistoricalDataService,
+sem depender do CoinGecko nem do MySQL, e pelos sintetizadores de OHLC aplicados aos preços
+intraday do CoinGecko (que fornece apenas um preço por ponto).
+"""
+
+import zlib
+import numpy as np
+import pandas as pd
+import logging
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Frequência pandas e candles por ano de cada timeframe
+TIMEFRAME_FREQUENCIES = {'1h': 'H', '4h': '4H', '1d': 'D', '1w': 'W-MON'}
+PERIODS_PER_YEAR = {'1h': 24 * 365, '4h': 6 * 365, '1d': 365, '1w': 52}
+
+# Regimes padrão do modelo regime-switching: drift e volatilidade anualizados
+DEFAULT_REGIMES = [
+    {'name': 'bull', 'drift': 0.8, 'volatility': 0.55},
+    {'name': 'bear', 'drift': -0.6, 'volatility': 0.75},
+    {'name': 'sideways', 'drift': 0.0, 'volatility': 0.35}
+]
+
+
+def synthesize_ohlc(close: np.ndarray, rng: np.random.Generator, intrabar_volatility: float,
+                    first_open: Optional[float] = None) -> Dict[str, np.ndarray]:
+    """
+    Deriva open/high/low/volume a partir dos fechamentos com uma única amostragem por coluna.
+    open = fechamento anterior; high/low envolvem open e close com um ruído proporcional à volatilidade.
+    """
+    close = np.asarray(close, dtype=float)
+    open_ = np.empty_like(close)
+    if len(close):
+        open_[0] = close[0] if first_open is None else first_open
+        open_[1:] = close[:-1]
+
+    wick_up = np.abs(rng.normal(0.0, intrabar_volatility, size=len(close)))
+    wick_down = np.abs(rng.normal(0.0, intrabar_volatility, size=len(close)))
+    high = np.maximum(open_, close) * (1 + wick_up)
+    low = np.minimum(open_, close) * (1 - wick_down)
+
+    # Volume maior em candles de maior amplitude
+    bar_range = (high - low) / np.where(close > 0, close, 1.0)
+    volume = rng.lognormal(mean=10.0, sigma=0.5, size=len(close)) * (1 + 20 * bar_range)
+
+    return {'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume}
+
+
+def random_ohlc_synthesizer(df: pd.DataFrame, timeframe: str, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Mantém o fechamento e sorteia open/high/low em torno dele (comportamento original do
+    HistoricalDataService), com uma amostragem vetorizada por coluna.
+    """
+    close = df['close'].to_numpy(dtype=float)
+    volatility = 0.02 if timeframe == '1d' else 0.01  # 2% para daily, 1% para intraday
+    
+    open_ = close * (1 + rng.normal(0.0, volatility, size=len(close)))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0.0, volatility / 2, size=len(close))))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0.0, volatility / 2, size=len(close))))
+    
+    result = df.copy()
+    result['open'] = open_
+    result['high'] = high
+    result['low'] = low
+    result['close'] = close
+    result['volume'] = rng.integers(100000, 1000000, size=len(close))
+    return result
+
+
+def previous_close_ohlc_synthesizer(df: pd.DataFrame, timeframe: str, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Abertura igual ao fechamento anterior (sem gaps artificiais) e pavios proporcionais à
+    volatilidade realizada da série.
+    """
+    close = df['close'].to_numpy(dtype=float)
+    log_returns = np.diff(np.log(close)) if len(close) > 1 else np.zeros(1)
+    columns = synthesize_ohlc(close, rng, intrabar_volatility=float(np.std(log_returns)) / 2)
+    
+    result = df.copy()
+    for column, values in columns.items():
+        result[column] = values
+    return result
+
+
+# Sintetizadores disponíveis para HistoricalDataService(ohlc_synthesizer=...)
+OHLC_SYNTHESIZERS: Dict[str, Callable[[pd.DataFrame, str, np.random.Generator], pd.DataFrame]] = {
+    'random': random_ohlc_synthesizer,
+    'previous_close': previous_close_ohlc_synthesizer
+}
+
+
+class SyntheticPriceGenerator:
+    """
+    Gerador de candles sintéticos a partir de uma semente.
+    Modelos: 'gbm' (movimento browniano geométrico) e 'regime' (GBM com troca de regimes markoviana).
+    """
+
+    def __init__(self, seed: int = 42):
+        self.seed = seed
+
+    def generate(self, periods: int, timeframe: str = '1d', start: datetime = datetime(2020, 1, 1),
+                 model: str = 'gbm', initial_price: float = 100.0, drift: float = 0.1,
+                 volatility: float = 0.6, regimes: Optional[List[dict]] = None,
+                 mean_regime_length: int = 200, stream: int = 0) -> pd.DataFrame:
+        """
+        Gera um DataFrame OHLCV indexado por data.
+
+        Args:
+            periods: Quantidade de candles
+            timeframe: 1h, 4h, 1d ou 1w (define o espaçamento e a escala de drift/volatilidade)
+            start: Data do primeiro candle
+            model: 'gbm' ou 'regime'
+            initial_price: Preço inicial
+            drift, volatility: Parâmetros anualizados do GBM
+            regimes: Regimes do modelo 'regime' (padrão DEFAULT_REGIMES)
+            mean_regime_length: Duração média (em candles) de cada regime
+            stream: Identificador da série (ex: um por ativo) para sementes independentes
+        """
+        if timeframe not in TIMEFRAME_FREQUENCIES:
+            raise ValueError(f"Unsupported timeframe '{timeframe}'")
+        if model not in ('gbm', 'regime'):
+            raise ValueError(f"Unsupported model '{model}'. Use 'gbm' or 'regime'")
+
+        rng = np.random.default_rng([self.seed, stream])
+        dt = 1.0 / PERIODS_PER_YEAR[timeframe]
+
+        if model == 'regime':
+            drifts, volatilities = self._regime_parameters(periods, rng, regimes or DEFAULT_REGIMES, mean_regime_length)
+        else:
+            drifts = np.full(periods, drift)
+            volatilities = np.full(periods, volatility)
+
+        # Log-retornos do GBM: (mu - sigma^2 / 2) dt + sigma sqrt(dt) Z
+        log_returns = (drifts - volatilities ** 2 / 2) * dt + volatilities * np.sqrt(dt) * rng.standard_normal(periods)
+        close = initial_price * np.exp(np.cumsum(log_returns))
+
+        columns = synthesize_ohlc(close, rng, intrabar_volatility=float(np.mean(volatilities)) * np.sqrt(dt) / 2,
+                                  first_open=initial_price)
+        index = pd.date_range(start=start, periods=periods, freq=TIMEFRAME_FREQUENCIES[timeframe], name='date')
+        return pd.DataFrame(columns, index=index)
+
+    def _regime_parameters(self, periods: int, rng: np.random.Generator, regimes: List[dict],
+                           mean_regime_length: int):
+        """Sorteia a sequência de regimes (durações geométricas) e expande drift/volatilidade por candle."""
+        expected_segments = int(np.ceil(periods / mean_regime_length)) * 2 + 1
+        lengths = rng.geometric(1.0 / mean_regime_length, size=expected_segments)
+        while lengths.sum() < periods:
+            lengths = np.concatenate([lengths, rng.geometric(1.0 / mean_regime_length, size=expected_segments)])
+
+        # Regime seguinte sempre diferente do atual
+        steps = rng.integers(1, len(regimes), size=len(lengths)) if len(regimes) > 1 else np.zeros(len(lengths), dtype=int)
+        states = np.cumsum(steps) % len(regimes)
+        state_per_period = np.repeat(states, lengths)[:periods]
+
+        drifts = np.array([regime['drift'] for regime in regimes])[state_per_period]
+        volatilities = np.array([regime['volatility'] for regime in regimes])[state_per_period]
+        return drifts, volatilities
+
+
+class InMemoryHistoricalDataService:
+    """
+    Substituto em memória do HistoricalDataService (mesma interface de leitura).
+    Cada ativo recebe uma série sintética determinística, gerada uma vez e recortada por período.
+    """
+
+    def __init__(self, seed: int = 42, periods: int = 10000, start: datetime = datetime(2020, 1, 1),
+                 model: str = 'gbm', symbols: Optional[List[str]] = None):
+        self.generator = SyntheticPriceGenerator(seed)
+        self.periods = periods
+        self.start = start
+        self.model = model
+        self.symbol_to_coingecko_id = {
+            symbol: symbol.lower() for symbol in (symbols or [
+                'BTCUSDT', 'ETHUSDT', 'ADAUSDT', 'BNBUSDT', 'XRPUSDT',
+                'SOLUSDT', 'DOTUSDT', 'DOGEUSDT', 'AVAXUSDT', 'LINKUSDT'
+            ])
+        }
+        self._series: Dict[tuple, pd.DataFrame] = {}
+
+    def get_series(self, asset_symbol: str, timeframe: str) -> pd.DataFrame:
+        """Série completa do ativo (gerada na primeira chamada)."""
+        key = (asset_symbol, timeframe)
+        if key not in self._series:
+            self._series[key] = self.generator.generate(
+                self.periods, timeframe, self.start, model=self.model,
+                stream=zlib.crc32(asset_symbol.encode())
+            )
+        return self._series[key]
+
+    def get_historical_data(self, asset_symbol: str, timeframe: str, start_date: date,
+                            end_date: date) -> Optional[pd.DataFrame]:
+        df = self.get_series(asset_symbol, timeframe)
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+        df = df[(df.index >= start) & (df.index < end)]
+        return df if len(df) >= 10 else None
+
+    def get_price_matrix(self, asset_symbols: List[str], timeframe: str, start_date: date,
+                         end_date: date) -> Optional[Dict[str, pd.DataFrame]]:
+        frames = {symbol: self.get_historical_data(symbol, timeframe, start_date, end_date) for symbol in asset_symbols}
+        frames = {symbol: frame for symbol, frame in frames.items() if frame is not None}
+        if not frames:
+            return None
+        combined = pd.concat(frames, axis=1, join='inner')
+        return {
+            field: combined.xs(field, axis=1, level=1)[list(frames)]
+            for field in ['open', 'high', 'low', 'close', 'volume']
+        }
@@ -0,0 +1,165 @@
+"""
+Resolução de metadados de tokens ERC-20 (name, symbol, decimals)
+Consulta vários contratos de uma vez via Multicall3 e guarda o resultado em token_metadata_cache,
+inclusive para contratos que não são ERC-20 (resultado negativo, revalidado após um TTL),
+evitando novas leituras on-chain. Erros de transporte do RPC nunca são gravados como resultado negativo.
+"""
+
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+from eth_abi import decode as abi_decode
+from web3 import Web3
+
+from services.multicall_service import MulticallService
+
+logger = logging.getLogger(__name__)
+
+NAME_SELECTOR = Web3.keccak(text="name()")[:4]
+SYMBOL_SELECTOR = Web3.keccak(text="symbol()")[:4]
+DECIMALS_SELECTOR = Web3.keccak(text="decimals()")[:4]
+# Validade de um resultado negativo (contrato não ERC-20) antes de ser verificado de novo
+TOKEN_METADATA_NEGATIVE_TTL_HOURS = int(os.getenv("TOKEN_METADATA_NEGATIVE_TTL_HOURS", 24))
+
+
+def _decode_text(success: bool, data: bytes) -> str:
+    """string ABI ou bytes32 (tokens antigos como MKR); vazio se a chamada falhou."""
+    if not success or not data:
+        return ""
+    try:
+        return abi_decode(['string'], data)[0]
+    except Exception:
+        if len(data) == 32:
+            return data.rstrip(b'\x00').decode('utf-8', errors='ignore')
+        return ""
+
+
+class TokenMetadataService:
+    def __init__(self, db_service, multicall: MulticallService):
+        self.db = db_service
+        self.multicall = multicall
+        # contrato (lowercase) -> metadados, ou None para contratos que não são ERC-20
+        self._cache: Dict[str, Optional[Dict]] = {}
+        # contrato -> horário em que o resultado negativo foi carregado/obtido (expira com o TTL)
+        self._negative_at: Dict[str, float] = {}
+
+    def resolve(self, contract_addresses: List[str], commit: bool = True) -> Dict[str, Optional[Dict]]:
+        """
+        Metadados de vários contratos: memória, depois token_metadata_cache e, para o que faltar,
+        uma leitura on-chain agrupada (três chamadas por contrato no mesmo multicall).
+
+        Args:
+            contract_addresses: Endereços dos contratos
+            commit: Com False, as linhas novas do cache entram na transação de quem chama
+
+        Returns:
+            Dict contrato (lowercase) -> {'name', 'symbol', 'decimals'}, ou None se não for ERC-20
+            (ou se a leitura on-chain falhou por erro transitório, caso em que nada é gravado)
+        """
+        addresses = list(dict.fromkeys(address.lower() for address in contract_addresses))
+        expired_before = time.time() - TOKEN_METADATA_NEGATIVE_TTL_HOURS * 3600
+        for address in addresses:
+            if self._negative_at.get(address, expired_before) < expired_before:
+                self._cache.pop(address, None)
+                self._negative_at.pop(address, None)
+        missing = [address for address in addresses if address not in self._cache]
+
+        if missing:
+            self._remember(self._load_cached(missing))
+            missing = [address for address in missing if address not in self._cache]
+
+        if missing:
+            resolved = self._fetch_onchain(missing)
+            self._save(resolved, commit)
+            self._remember(resolved)
+            logger.info(f"Metadados de {len(resolved)} de {len(missing)} tokens resolvidos on-chain "
+                        f"({sum(1 for value in resolved.values() if value is None)} não ERC-20)")
+
+        return {address: self._cache.get(address) for address in addresses}
+
+    def get(self, contract_address: str) -> Optional[Dict]:
+        return self.resolve([contract_address]).get(contract_address.lower())
+
+    def _remember(self, resolved: Dict[str, Optional[Dict]]) -> None:
+        self._cache.update(resolved)
+        now = time.time()
+        for address, metadata in resolved.items():
+            if metadata is None:
+                self._negative_at[address] = now
+
+    def _fetch_onchain(self, addresses: List[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Metadados lidos on-chain. Contratos com alguma chamada não avaliada (erro de transporte)
+        ficam fora do resultado, para não serem gravados como não ERC-20.
+        """
+        calls = []
+        for address in addresses:
+            calls.extend([(address, NAME_SELECTOR), (address, SYMBOL_SELECTOR), (address, DECIMALS_SELECTOR)])
+        results = self.multicall.aggregate(calls)
+
+        resolved = {}
+        for index, address in enumerate(addresses):
+            name, symbol, decimals = results[index * 3:index * 3 + 3]
+            if any(data is None for _, data in (name, symbol, decimals)):
+                continue
+            # Sem decimals() válido o contrato é tratado como não ERC-20
+            if not decimals[0] or len(decimals[1]) < 32:
+                resolved[address] = None
+                continue
+            resolved[address] = {
+                'name': _decode_text(*name),
+                'symbol': _decode_text(*symbol),
+                'decimals': int.from_bytes(decimals[1][:32], 'big')
+            }
+        return resolved
+
+    def _load_cached(self, addresses: List[str]) -> Dict[str, Optional[Dict]]:
+        cursor = self.db.connection.cursor(dictionary=True)
+        try:
+            placeholders = ", ".join(["%s"] * len(addresses))
+            cursor.execute(f"""
+                SELECT contract_address, name, symbol, decimals, is_erc20
+                FROM token_metadata_cache
+                WHERE contract_address IN ({placeholders})
+                  AND (is_erc20 = 1 OR resolved_at >= NOW() - INTERVAL %s HOUR)
+            """, addresses + [TOKEN_METADATA_NEGATIVE_TTL_HOURS])
+            return {
+                row['contract_address']: (
+                    {'name': row['name'], 'symbol': row['symbol'], 'decimals': row['decimals']}
+                    if row['is_erc20'] else None
+                )
+                for row in cursor.fetchall()
+            }
+        finally:
+            cursor.close()
+
+    def _save(self, resolved: Dict[str, Optional[Dict]], commit: bool) -> None:
+        if not resolved:
+            return
+        rows = []
+        for address, metadata in resolved.items():
+            metadata = metadata or {}
+            rows.append((address, metadata.get('name'), metadata.get('symbol'), metadata.get('decimals'),
+                         bool(metadata)))
+
+        cursor = self.db.connection.cursor()
+        try:
+            placeholders = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+            cursor.execute(f"""
+                INSERT INTO token_metadata_cache (contract_address, name, symbol, decimals, is_erc20)
+                VALUES {placeholders}
+                ON DUPLICATE KEY UPDATE
+                    name = VALUES(name), symbol = VALUES(symbol),
+                    decimals = VALUES(decimals), is_erc20 = VALUES(is_erc20),
+                    resolved_at = CURRENT_TIMESTAMP
+            """, [value for row in rows for value in row])
+            if commit:
+                self.db.connection.commit()
+        except Exception as e:
+            # O cache persistente é uma otimização: falhas não impedem o uso dos metadados resolvidos
+            if commit:
+                self.db.connection.rollback()
+            logger.warning(f"Erro ao salvar metadados de tokens: {e}")
+        finally:
+            cursor.close()
@@ -0,0 +1,169 @@
+"""
+Indexador de transferências ERC-20 via eth_getLogs
+Lê os eventos Transfer envolvendo endereços monitorados direto do nó RPC, sem depender da API
+do PolygonScan. O intervalo de blocos é percorrido em janelas adaptativas (reduzidas quando o nó
+recusa o intervalo, ampliadas enquanto as consultas passam), com várias janelas em paralelo.
+"""
+
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = Web3.to_hex(Web3.keccak(text="Transfer(address,address,uint256)"))
+
+TRANSFER_SCAN_CHUNK_BLOCKS = int(os.getenv("TRANSFER_SCAN_CHUNK_BLOCKS", 2000))
+TRANSFER_SCAN_MAX_CHUNK_BLOCKS = int(os.getenv("TRANSFER_SCAN_MAX_CHUNK_BLOCKS", 50000))
+TRANSFER_SCAN_CONCURRENCY = int(os.getenv("TRANSFER_SCAN_CONCURRENCY", 4))
+# Blocos de confirmação antes de indexar (0 em uma rede local de desenvolvimento)
+TRANSFER_SCAN_CONFIRMATIONS = int(os.getenv("TRANSFER_SCAN_CONFIRMATIONS", 12))
+TRANSFER_SCAN_MAX_RETRIES = 3
+
+# Trechos das mensagens de erro dos provedores quando o intervalo (ou a resposta) é grande demais
+RANGE_ERROR_MARKERS = (
+    'block range', 'range too large', 'range is too large', 'exceed maximum block range',
+    'returned more than', 'more than 10000 results', 'response size', 'query timeout'
+)
+# Limite de requisições do provedor (Infura/Alchemy usam -32005 e 'limit exceeded' também para isso):
+# tratado com espera e nova tentativa, nunca dividindo o intervalo
+RATE_LIMIT_MARKERS = (
+    '429', 'too many requests', 'rate limit', 'rate-limit', 'throttl', 'request limit', 'limit exceeded',
+    'exceeded its', 'compute units'
+)
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def _is_range_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return not _is_rate_limit_error(error) and any(marker in message for marker in RANGE_ERROR_MARKERS)
+
+
+class TransferLogScanner:
+    def __init__(self, w3: Web3, chunk_blocks: int = TRANSFER_SCAN_CHUNK_BLOCKS,
+                 max_chunk_blocks: int = TRANSFER_SCAN_MAX_CHUNK_BLOCKS,
+                 concurrency: int = TRANSFER_SCAN_CONCURRENCY,
+                 max_retries: int = TRANSFER_SCAN_MAX_RETRIES):
+        self.w3 = w3
+        self.chunk_blocks = max(1, chunk_blocks)
+        self.max_chunk_blocks = max(self.chunk_blocks, max_chunk_blocks)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+
+    def scan(self, addresses: List[str], from_block: int, to_block: int,
+             on_wave: Callable[[List[Dict[str, Any]], int], None]) -> int:
+        """
+        Percorre [from_block, to_block] em ondas de até `concurrency` janelas consecutivas.
+
+        Args:
+            addresses: Endereços monitorados (origem ou destino das transferências)
+            on_wave: Chamado após cada onda, em ordem, com as transferências normalizadas e o último
+                bloco coberto (permite gravar e avançar o cursor de forma incremental)
+
+        Returns:
+            Quantidade total de transferências encontradas
+        """
+        topics = ['0x' + '0' * 24 + Web3.to_checksum_address(address)[2:].lower() for address in addresses]
+        chunk = self.chunk_blocks
+        current = from_block
+        total = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='getlogs') as executor:
+            while current <= to_block:
+                ranges = []
+                start = current
+                while len(ranges) < self.concurrency and start <= to_block:
+                    end = min(start + chunk - 1, to_block)
+                    ranges.append((start, end))
+                    start = end + 1
+
+                results = list(executor.map(lambda block_range: self._fetch_range(topics, *block_range), ranges))
+                logs = [log for range_logs, _ in results for log in range_logs]
+                split = any(range_split for _, range_split in results)
+
+                transfers = self._normalize(logs, executor)
+                on_wave(transfers, ranges[-1][1])
+                total += len(transfers)
+
+                # Janela adaptativa: encolhe se o nó recusou algum intervalo, cresce caso contrário
+                chunk = max(1, chunk // 2) if split else min(self.max_chunk_blocks, chunk * 2)
+                current = ranges[-1][1] + 1
+                logger.info(f"Logs indexados até o bloco {ranges[-1][1]} ({len(transfers)} transferências, janela {chunk})")
+
+        return total
+
+    def _fetch_range(self, topics: List[str], start: int, end: int) -> Tuple[List[dict], bool]:
+        """
+        Logs Transfer com os endereços como origem ou destino no intervalo.
+        Se o nó recusar o intervalo, divide ao meio recursivamente.
+
+        Returns:
+            (logs, se houve divisão)
+        """
+        try:
+            return self._get_logs_with_retry(topics, start, end), False
+        except Exception as e:
+            if not _is_range_error(e) or start == end:
+                raise
+            middle = (start + end) // 2
+            logger.info(f"Intervalo {start}-{end} recusado pelo nó, dividindo: {e}")
+            left, _ = self._fetch_range(topics, start, middle)
+            right, _ = self._fetch_range(topics, middle + 1, end)
+            return left + right, True
+
+    def _get_logs_with_retry(self, topics: List[str], start: int, end: int) -> List[dict]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                sent = self.w3.eth.get_logs({'fromBlock': start, 'toBlock': end, 'topics': [TRANSFER_TOPIC, topics]})
+                received = self.w3.eth.get_logs({'fromBlock': start, 'toBlock': end, 'topics': [TRANSFER_TOPIC, None, topics]})
+                # Transferências para o próprio endereço aparecem nas duas consultas
+                unique = {(Web3.to_hex(log['transactionHash']), log['logIndex']): log for log in sent + received}
+                return sorted(unique.values(), key=lambda log: (log['blockNumber'], log['logIndex']))
+            except Exception as e:
+                if _is_range_error(e) or attempt == self.max_retries:
+                    raise
+                # Limite do provedor: espera mais longa antes de tentar o mesmo intervalo de novo
+                delay = min(60, 5 * 2 ** attempt) if _is_rate_limit_error(e) else 2 ** attempt
+                logger.warning(f"getLogs {start}-{end} falhou (tentativa {attempt + 1}), nova tentativa em {delay}s: {e}")
+                time.sleep(delay)
+
+    def _normalize(self, logs: List[dict], executor: ThreadPoolExecutor) -> List[Dict[str, Any]]:
+        """
+        Converte os logs para o formato de transferência usado na gravação dos movimentos
+        (sem os metadados do token, preenchidos por quem grava).
+        """
+        # ERC-721 usa a mesma assinatura com o tokenId indexado (4 tópicos): ignorado
+        logs = [log for log in logs if len(log['topics']) == 3]
+        block_numbers = sorted({log['blockNumber'] for log in logs})
+        timestamps = dict(zip(block_numbers, executor.map(
+            lambda number: self.w3.eth.get_block(number)['timestamp'], block_numbers
+        )))
+
+        transfers = []
+        for log in logs:
+            data = bytes(log['data'])
+            transfers.append({
+                "tx_hash": Web3.to_hex(log['transactionHash']),
+                "log_index": log['logIndex'],
+                "from_address": '0x' + bytes(log['topics'][1])[-20:].hex(),
+                "to_address": '0x' + bytes(log['topics'][2])[-20:].hex(),
+                "contract_address": log['address'].lower(),
+                "value": int.from_bytes(data[:32], 'big') if data else 0,
+                "block_number": log['blockNumber'],
+                "timestamp": timestamps.get(log['blockNumber']),
+                "gas_fee": None
+            })
+        return transfers
+
+
+def latest_indexable_block(w3: Web3, confirmations: int = TRANSFER_SCAN_CONFIRMATIONS) -> int:
+    """Último bloco com as confirmações exigidas."""
+    return w3.eth.block_number - max(0, confirmations)
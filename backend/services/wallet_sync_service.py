@@ -4,62 +4,59 @@ Responsável pela sincronização automática de saldos e posições on-chain
 """
 
 import asyncio
+import os
 import time
 import logging
-from typing import Dict, List, Any, Optional
+import mysql.connector
+import requests
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
 from decimal import Decimal, getcontext
 from web3 import Web3
 
 from services.database_service import DatabaseService
 from services.price_service import PriceService
+from services.multicall_service import MulticallService
+from services.token_metadata_service import TokenMetadataService
+from services.transfer_indexer_service import (
+    TransferLogScanner, latest_indexable_block, TRANSFER_SCAN_CONFIRMATIONS
+)
 
 # Configurar precisão alta para Decimal
 getcontext().prec = 50
 
 logger = logging.getLogger(__name__)
 
-# ABI mínima para tokens ERC-20
-ERC20_ABI = [
-    {
-        "constant": True,
-        "inputs": [],
-        "name": "name",
-        "outputs": [{"name": "", "type": "string"}],
-        "type": "function"
-    },
-    {
-        "constant": True,
-        "inputs": [],
-        "name": "symbol",
-        "outputs": [{"name": "", "type": "string"}],
-        "type": "function"
-    },
-    {
-        "constant": True,
-        "inputs": [],
-        "name": "decimals",
-        "outputs": [{"name": "", "type": "uint8"}],
-        "type": "function"
-    },
-    {
-        "constant": True,
-        "inputs": [{"name": "_owner", "type": "address"}],
-        "name": "balanceOf",
-        "outputs": [{"name": "balance", "type": "uint256"}],
-        "type": "function"
-    }
-]
+# Carteiras consultadas ao mesmo tempo no nó RPC durante a sincronização em massa
+WALLET_SYNC_RPC_CONCURRENCY = int(os.getenv("WALLET_SYNC_RPC_CONCURRENCY", 4))
+
+# Reconciliação incremental via PolygonScan
+POLYGONSCAN_API_URL = "https://api.polygonscan.com/api"
+POLYGONSCAN_API_KEY = os.getenv("POLYGONSCAN_API_KEY", "UJSDR6UFV3PB3514ACGV255GHPJU9K2PPN")
+# Transferências por página; a API só pagina até page * offset = 10000 a partir do startblock
+POLYGONSCAN_PAGE_SIZE = 1000
+POLYGONSCAN_RESULT_WINDOW = 10000
+# Movimentos por INSERT durante a reconciliação
+RECONCILE_INSERT_BATCH_SIZE = 500
+# Bloco inicial padrão da primeira indexação via eth_getLogs (ex: bloco de criação das carteiras);
+# sem ele, a primeira indexação exige start_block (varrer a Polygon desde o bloco 0 é inviável)
+TRANSFER_SCAN_START_BLOCK = int(os.getenv("TRANSFER_SCAN_START_BLOCK")) if os.getenv("TRANSFER_SCAN_START_BLOCK") else None
 
 class WalletSyncService:
     def __init__(self, database_service: DatabaseService):
         self.db = database_service
         self.price_service = PriceService()
         
-        # Configuração Polygon
-        self.polygon_rpc = "https://polygon-rpc.com"
+        # Configuração Polygon (POLYGON_RPC_URL permite apontar para um nó local Hardhat/anvil)
+        self.polygon_rpc = os.getenv("POLYGON_RPC_URL", "https://polygon-rpc.com")
         
         # Inicializar Web3
         self.w3 = Web3(Web3.HTTPProvider(self.polygon_rpc))
+        # Leituras de saldo agrupadas via Multicall3
+        self.multicall = MulticallService(self.w3)
+        # Metadados de contratos desconhecidos (name/symbol/decimals), compartilhados entre sincronização e reconciliação
+        self.token_metadata = TokenMetadataService(self.db, self.multicall)
         
     async def sync_wallet_holdings(self, user_id: int, account_id: int, public_address: str) -> Dict[str, Any]:
         """
@@ -79,73 +76,20 @@ class WalletSyncService:
             crypto_assets = self._load_crypto_assets()
             logger.info(f"Carregados {len(crypto_assets)} ativos crypto do banco")
             
-            # 2. Coletar todos os price_api_identifier
-            api_ids = [asset['price_api_identifier'] for asset in crypto_assets.values() 
-                      if asset['price_api_identifier']]
-            
-            # 3. Buscar todos os preços em uma única chamada
-            crypto_prices_usd = {}
-            usd_to_brl_rate = 0.0
-            
-            async with self.price_service as price_svc:
-                if api_ids:
-                    crypto_prices_usd = await price_svc.get_crypto_prices_in_usd(api_ids)
-                    logger.info(f"Obtidos preços para {len(crypto_prices_usd)} ativos")
-                
-                usd_to_brl_rate = await price_svc.get_usd_to_brl_rate()
-                logger.info(f"Taxa USD/BRL: {usd_to_brl_rate}")
+            # 2. Buscar todos os preços em uma única chamada
+            crypto_prices_usd, usd_to_brl_rate = await self._fetch_prices(crypto_assets)
             
-            # 4. Buscar tokens da carteira
-            tokens = await self._fetch_wallet_tokens(public_address)
+            # 3. Buscar tokens da carteira
+            tokens = await self._fetch_wallet_tokens(public_address, crypto_assets)
             logger.info(f"Encontrados {len(tokens)} tokens na carteira")
             
-            # 5. Acumulador para valor total da carteira
-            total_wallet_value_brl = Decimal('0.0')
-            
-            # 6. Processar cada token encontrado na carteira
-            for token in tokens:
-                try:
-                    contract_address = token["contractAddress"].lower()
-                    raw_balance = token["balance"]
-                    
-                    # Encontrar o ativo correspondente no banco de dados
-                    asset = crypto_assets.get(contract_address)
-                    
-                    if not asset:
-                        # Ativo não existe no banco, criar dinamicamente
-                        asset = await self._create_asset_from_contract(contract_address)
-                        if not asset:
-                            logger.warning(f"Não foi possível criar ativo para {contract_address}")
-                            continue
-                            
-                    # Executar cálculo de precisão
-                    decimals = asset['decimals']
-                    api_id = asset['price_api_identifier']
-                    
-                    actual_quantity = Decimal(raw_balance) / (Decimal(10) ** decimals)
-                    price_usd = Decimal(str(crypto_prices_usd.get(api_id, 0.0)))
-                    value_brl = actual_quantity * price_usd * Decimal(str(usd_to_brl_rate))
-                    
-                    # Criar movimento de sincronização
-                    self._create_sync_movement(
-                        user_id, account_id, asset['id'], 
-                        float(actual_quantity), float(price_usd * Decimal(str(usd_to_brl_rate)))
-                    )
-                    
-                    # Somar ao total da carteira
-                    total_wallet_value_brl += value_brl
-                    
-                    result["tokens_synced"] += 1
-                    logger.info(f"Sincronizado: {actual_quantity} {asset['symbol']} = R$ {value_brl}")
-                    
-                except Exception as e:
-                    logger.error(f"Erro ao sincronizar token {token.get('contractAddress')}: {e}")
-                    result["errors"].append(f"Token {token.get('contractAddress')}: {str(e)}")
+            # 4. Processar cada token encontrado na carteira
+            result["total_value_brl"] = float(await self._process_wallet_tokens(
+                user_id, account_id, tokens, crypto_assets, crypto_prices_usd, usd_to_brl_rate, result
+            ))
             
-            # 7. Saldo da conta agora é calculado dinamicamente, não precisa mais ser atualizado
-            result["total_value_brl"] = float(total_wallet_value_brl)
-            
-            logger.info(f"Sincronização concluída. Valor total: R$ {total_wallet_value_brl}")
+            # 5. Saldo da conta agora é calculado dinamicamente, não precisa mais ser atualizado
+            logger.info(f"Sincronização concluída. Valor total: R$ {result['total_value_brl']}")
             return result
             
         except Exception as e:
@@ -157,6 +101,160 @@ class WalletSyncService:
                 "total_value_brl": 0.0
             }
     
+    async def sync_all_wallets(self, user_id: Optional[int] = None,
+                               rpc_concurrency: int = WALLET_SYNC_RPC_CONCURRENCY) -> Dict[str, Any]:
+        """
+        Sincroniza todas as contas CARTEIRA_CRIPTO (de um usuário ou de todos) de uma vez:
+        catálogo de ativos e preços carregados uma vez, saldos de todos os endereços via multicall
+        (com no máximo rpc_concurrency carteiras consultadas ao mesmo tempo) e uma transação por usuário.
+        """
+        result = {
+            "success": True,
+            "wallets_synced": 0,
+            "tokens_synced": 0,
+            "total_value_brl": 0.0,
+            "errors": []
+        }
+        
+        accounts = self._load_wallet_accounts(user_id)
+        if not accounts:
+            return result
+        logger.info(f"Sincronização em massa de {len(accounts)} carteiras")
+        
+        # 1. Catálogo de ativos e preços: uma vez para todas as carteiras
+        crypto_assets = self._load_crypto_assets()
+        crypto_prices_usd, usd_to_brl_rate = await self._fetch_prices(crypto_assets)
+        
+        # 2. Saldos de todos os endereços no mesmo bloco, com concorrência limitada
+        block_number = await asyncio.to_thread(lambda: self.w3.eth.block_number)
+        semaphore = asyncio.Semaphore(max(1, rpc_concurrency))
+        
+        async def scan(account):
+            async with semaphore:
+                return await self._fetch_wallet_tokens(account['public_address'], crypto_assets, block_number)
+        
+        scans = await asyncio.gather(*(scan(account) for account in accounts), return_exceptions=True)
+        
+        # 3. Gravar os movimentos de cada usuário em uma única transação
+        by_user: Dict[int, List[Tuple[Dict[str, Any], Any]]] = defaultdict(list)
+        for account, tokens in zip(accounts, scans):
+            if isinstance(tokens, Exception):
+                logger.error(f"Erro ao buscar saldos da conta {account['id']}: {tokens}")
+                result["errors"].append(f"Conta {account['id']}: {str(tokens)}")
+                continue
+            by_user[account['user_id']].append((account, tokens))
+        
+        for wallet_user_id, user_wallets in by_user.items():
+            user_result = {"tokens_synced": 0, "errors": []}
+            try:
+                user_value = Decimal('0.0')
+                for account, tokens in user_wallets:
+                    user_value += await self._process_wallet_tokens(
+                        wallet_user_id, account['id'], tokens, crypto_assets,
+                        crypto_prices_usd, usd_to_brl_rate, user_result, commit=False
+                    )
+                self.db.connection.commit()
+                
+                result["wallets_synced"] += len(user_wallets)
+                result["tokens_synced"] += user_result["tokens_synced"]
+                result["total_value_brl"] += float(user_value)
+                result["errors"].extend(user_result["errors"])
+            except Exception as e:
+                self.db.connection.rollback()
+                logger.error(f"Erro ao gravar sincronização do usuário {wallet_user_id}: {e}")
+                result["errors"].append(f"Usuário {wallet_user_id}: {str(e)}")
+        
+        result["success"] = not result["errors"]
+        logger.info(f"Sincronização em massa concluída: {result['wallets_synced']} carteiras, "
+                    f"{result['tokens_synced']} tokens, R$ {result['total_value_brl']}")
+        return result
+    
+    def _load_wallet_accounts(self, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Contas CARTEIRA_CRIPTO com endereço público (de um usuário ou de todos)
+        """
+        cursor = self.db.connection.cursor(dictionary=True)
+        
+        try:
+            query = """
+                SELECT id, user_id, public_address
+                FROM accounts
+                WHERE type = 'CARTEIRA_CRIPTO' AND public_address IS NOT NULL AND public_address <> ''
+            """
+            params = ()
+            if user_id is not None:
+                query += " AND user_id = %s"
+                params = (user_id,)
+            cursor.execute(query + " ORDER BY user_id, id", params)
+            return cursor.fetchall()
+            
+        finally:
+            cursor.close()
+    
+    async def _fetch_prices(self, crypto_assets: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, float], float]:
+        """
+        Preços em USD de todos os ativos (uma única chamada) e taxa USD/BRL
+        """
+        api_ids = list({asset['price_api_identifier'] for asset in crypto_assets.values()
+                        if asset['price_api_identifier']})
+        crypto_prices_usd = {}
+        
+        async with self.price_service as price_svc:
+            if api_ids:
+                crypto_prices_usd = await price_svc.get_crypto_prices_in_usd(api_ids)
+                logger.info(f"Obtidos preços para {len(crypto_prices_usd)} ativos")
+            
+            usd_to_brl_rate = await price_svc.get_usd_to_brl_rate()
+            logger.info(f"Taxa USD/BRL: {usd_to_brl_rate}")
+        
+        return crypto_prices_usd, usd_to_brl_rate
+    
+    async def _process_wallet_tokens(self, user_id: int, account_id: int, tokens: List[Dict[str, Any]],
+                                     crypto_assets: Dict[str, Dict[str, Any]], crypto_prices_usd: Dict[str, float],
+                                     usd_to_brl_rate: float, result: Dict[str, Any], commit: bool = True) -> Decimal:
+        """
+        Grava os movimentos de sincronização dos tokens da carteira (um upsert para todos)
+        e retorna o valor total em BRL. Com commit=False, a transação fica a cargo de quem chama.
+        """
+        total_wallet_value_brl = Decimal('0.0')
+        movements = []
+        
+        for token in tokens:
+            try:
+                contract_address = token["contractAddress"].lower()
+                raw_balance = token["balance"]
+                
+                # Encontrar o ativo correspondente no banco de dados
+                asset = crypto_assets.get(contract_address)
+                
+                if not asset:
+                    # Ativo não existe no banco, criar dinamicamente
+                    asset = await self._create_asset_from_contract(contract_address, commit=commit)
+                    if not asset:
+                        logger.warning(f"Não foi possível criar ativo para {contract_address}")
+                        continue
+                        
+                # Executar cálculo de precisão
+                decimals = asset['decimals']
+                api_id = asset['price_api_identifier']
+                
+                actual_quantity = Decimal(raw_balance) / (Decimal(10) ** decimals)
+                price_usd = Decimal(str(crypto_prices_usd.get(api_id, 0.0)))
+                value_brl = actual_quantity * price_usd * Decimal(str(usd_to_brl_rate))
+                
+                movements.append((asset['id'], float(actual_quantity), float(price_usd * Decimal(str(usd_to_brl_rate)))))
+                
+                # Somar ao total da carteira
+                total_wallet_value_brl += value_brl
+                logger.info(f"Sincronizado: {actual_quantity} {asset['symbol']} = R$ {value_brl}")
+                
+            except Exception as e:
+                logger.error(f"Erro ao sincronizar token {token.get('contractAddress')}: {e}")
+                result["errors"].append(f"Token {token.get('contractAddress')}: {str(e)}")
+        
+        result["tokens_synced"] += self._upsert_sync_movements(user_id, account_id, movements, commit=commit)
+        return total_wallet_value_brl
+    
     def _load_crypto_assets(self) -> Dict[str, Dict[str, Any]]:
         """
         Carrega todos os ativos do tipo 'CRIPTO' do banco de dados
@@ -185,52 +283,32 @@ class WalletSyncService:
         finally:
             cursor.close()
     
-    async def _fetch_wallet_tokens(self, address: str) -> List[Dict[str, Any]]:
+    async def _fetch_wallet_tokens(self, address: str, crypto_assets: Optional[Dict[str, Dict[str, Any]]] = None,
+                                   block_identifier: Any = 'latest') -> List[Dict[str, Any]]:
         """
         Busca tokens com saldo > 0 da carteira do usuário
-        Implementação simplificada que verifica ativos conhecidos
+        Verifica os ativos conhecidos com chamadas balanceOf agrupadas (Multicall3), em poucas requisições RPC
         """
-        tokens_with_balance = []
+        # Carregar ativos conhecidos (se ainda não carregados por quem chama)
+        if crypto_assets is None:
+            crypto_assets = self._load_crypto_assets()
         
-        # Carregar ativos conhecidos
-        crypto_assets = self._load_crypto_assets()
+        # As chamadas RPC são bloqueantes: executar fora do event loop
+        balances = await asyncio.to_thread(
+            self.multicall.erc20_balances, address, list(crypto_assets), block_identifier
+        )
         
-        # Verificar saldo de cada ativo conhecido
-        for contract_address, asset in crypto_assets.items():
-            try:
-                balance = self._get_token_balance(address, contract_address)
-                if balance > 0:
-                    tokens_with_balance.append({
-                        "contractAddress": contract_address,
-                        "balance": balance
-                    })
-            except Exception as e:
-                logger.warning(f"Erro ao verificar saldo do token {contract_address}: {e}")
-                continue
-                
-        return tokens_with_balance
-    
-    def _get_token_balance(self, address: str, contract_address: str) -> int:
-        """
-        Busca saldo de um token ERC-20 específico
-        """
-        try:
-            contract = self.w3.eth.contract(
-                address=Web3.to_checksum_address(contract_address),
-                abi=ERC20_ABI
-            )
-            
-            balance = contract.functions.balanceOf(
-                Web3.to_checksum_address(address)
-            ).call()
-            
-            return balance
-            
-        except Exception as e:
-            logger.error(f"Erro ao buscar saldo do token {contract_address}: {e}")
-            return 0
+        failed = [contract_address for contract_address, balance in balances.items() if balance is None]
+        if failed:
+            logger.warning(f"Falha ao verificar saldo de {len(failed)} tokens: {', '.join(failed[:10])}")
+        
+        return [
+            {"contractAddress": contract_address, "balance": balance}
+            for contract_address, balance in balances.items()
+            if balance
+        ]
     
-    async def _create_asset_from_contract(self, contract_address: str) -> Optional[Dict[str, Any]]:
+    async def _create_asset_from_contract(self, contract_address: str, commit: bool = True) -> Optional[Dict[str, Any]]:
         """
         Cria um novo ativo no banco de dados baseado no contrato
         """
@@ -261,7 +339,8 @@ class WalletSyncService:
                 ))
                 
                 asset_id = cursor.lastrowid
-                self.db.connection.commit()
+                if commit:
+                    self.db.connection.commit()
                 
                 return {
                     'id': asset_id,
@@ -283,24 +362,11 @@ class WalletSyncService:
     
     def _get_token_info(self, contract_address: str) -> Optional[Dict[str, Any]]:
         """
-        Busca informações do token (name, symbol, decimals) na blockchain
+        Busca informações do token (name, symbol, decimals) via cache de metadados
+        (memória, token_metadata_cache e, por último, a blockchain)
         """
         try:
-            contract = self.w3.eth.contract(
-                address=Web3.to_checksum_address(contract_address),
-                abi=ERC20_ABI
-            )
-            
-            name = contract.functions.name().call()
-            symbol = contract.functions.symbol().call()
-            decimals = contract.functions.decimals().call()
-            
-            return {
-                "name": name,
-                "symbol": symbol,
-                "decimals": decimals
-            }
-            
+            return self.token_metadata.get(contract_address)
         except Exception as e:
             logger.error(f"Erro ao buscar informações do token {contract_address}: {e}")
             return None
@@ -364,234 +430,437 @@ class WalletSyncService:
         
         return mapped_id
     
-    def _create_sync_movement(self, user_id: int, account_id: int, asset_id: int, 
-                             quantity: float, price_per_unit: float):
+    def _upsert_sync_movements(self, user_id: int, account_id: int,
+                               movements: List[Tuple[int, float, float]], commit: bool = True) -> int:
         """
-        Cria um movimento de sincronização na tabela asset_movements
-        Primeiro verifica se já existe um movimento de sincronização para evitar duplicatas
-        Com validações defensivas completas
+        Grava os movimentos SINCRONIZACAO da carteira com um único INSERT ... ON DUPLICATE KEY UPDATE.
+        A chave única unique_sync_movement (account_id, asset_id, sync_slot) garante uma linha de
+        sincronização por ativo/conta; as existentes têm quantidade e data atualizadas.
+        
+        Args:
+            movements: Lista de (asset_id, quantidade, preço unitário em BRL)
+            commit: Com False, o commit/rollback fica a cargo de quem chama (sincronização em massa)
+            
+        Returns:
+            Quantidade de movimentos gravados
         """
-        cursor = self.db.connection.cursor()
+        # Validações defensivas dos parâmetros de entrada
+        if not isinstance(user_id, int) or user_id <= 0:
+            raise ValueError(f"user_id inválido: {user_id}")
+        if not isinstance(account_id, int) or account_id <= 0:
+            raise ValueError(f"account_id inválido: {account_id}")
         
-        try:
-            # Validações defensivas dos parâmetros de entrada
-            if not isinstance(user_id, int) or user_id <= 0:
-                raise ValueError(f"user_id inválido: {user_id}")
-            if not isinstance(account_id, int) or account_id <= 0:
-                raise ValueError(f"account_id inválido: {account_id}")
-            if not isinstance(asset_id, int) or asset_id <= 0:
-                raise ValueError(f"asset_id inválido: {asset_id}")
+        rows = []
+        for asset_id, quantity, price_per_unit in movements:
             if quantity is None or quantity < 0:
                 logger.warning(f"Quantidade inválida {quantity} para asset {asset_id}, ignorando")
-                return
+                continue
             if price_per_unit is None or price_per_unit < 0:
                 logger.warning(f"Preço inválido {price_per_unit} para asset {asset_id}, usando 0.00")
                 price_per_unit = 0.00
-            
-            logger.info(f"Criando movimento de sincronização: user_id={user_id}, account_id={account_id}, asset_id={asset_id}, quantity={quantity}, price={price_per_unit}")
-            
-            # Verificar se já existe movimento de sincronização para este ativo/conta
-            cursor.execute("""
-                SELECT id FROM asset_movements 
-                WHERE user_id = %s AND account_id = %s AND asset_id = %s 
-                AND movement_type = 'SINCRONIZACAO' 
-            """, (user_id, account_id, asset_id))
-            
-            existing_movement = cursor.fetchone()
-            
-            if existing_movement:
-                # Atualizar movimento existente
-                cursor.execute("""
-                    UPDATE asset_movements 
-                    SET quantity = %s, movement_date = NOW()
-                    WHERE id = %s
-                """, (quantity, existing_movement[0]))
-                logger.info(f"Movimento de sincronização atualizado para asset {asset_id}")
-            else:
-                # Criar novo movimento
-                cursor.execute("""
-                    INSERT INTO asset_movements 
-                    (user_id, account_id, asset_id, movement_type, movement_date, quantity, price_per_unit, notes)
-                    VALUES (%s, %s, %s, 'SINCRONIZACAO', NOW(), %s, %s, 'Sincronização automática da carteira')
-                """, (user_id, account_id, asset_id, quantity, price_per_unit))
-                logger.info(f"Novo movimento de sincronização criado para asset {asset_id}")
-            
-            self.db.connection.commit()
-            logger.info(f"Transação commitada com sucesso para asset {asset_id}")
+            rows.append((user_id, account_id, asset_id, quantity, price_per_unit))
+        
+        if not rows:
+            return 0
+        
+        cursor = self.db.connection.cursor()
+        
+        try:
+            placeholders = ", ".join(
+                ["(%s, %s, %s, 'SINCRONIZACAO', NOW(), %s, %s, 'Sincronização automática da carteira')"] * len(rows)
+            )
+            cursor.execute(f"""
+                INSERT INTO asset_movements 
+                (user_id, account_id, asset_id, movement_type, movement_date, quantity, price_per_unit, notes)
+                VALUES {placeholders}
+                ON DUPLICATE KEY UPDATE
+                    quantity = VALUES(quantity),
+                    movement_date = VALUES(movement_date)
+            """, [value for row in rows for value in row])
+            
+            if commit:
+                self.db.connection.commit()
+            logger.info(f"{len(rows)} movimentos de sincronização gravados para a conta {account_id}")
+            return len(rows)
             
         except mysql.connector.Error as db_err:
-            self.db.connection.rollback()
-            logger.error(f"Erro de banco ao criar movimento de sincronização: {db_err}")
+            if commit:
+                self.db.connection.rollback()
+            logger.error(f"Erro de banco ao gravar movimentos de sincronização: {db_err}")
             raise Exception(f"Erro de banco de dados: {db_err}")
-        except ValueError as val_err:
-            logger.error(f"Erro de validação ao criar movimento: {val_err}")
-            raise val_err
-        except Exception as e:
-            self.db.connection.rollback()
-            logger.error(f"Erro geral ao criar movimento de sincronização: {e}")
-            raise Exception(f"Erro interno ao criar movimento: {e}")
         finally:
             cursor.close()
     
-    def reconcile_wallet_history(self, user_id: int, account_id: int, public_address: str) -> Dict[str, Any]:
+    def reconcile_wallet_history(self, user_id: int, account_id: int, public_address: str,
+                                 full: bool = False) -> Dict[str, Any]:
         """
-        NOVA FUNCIONALIDADE: Reconciliação profunda com histórico on-chain
-        Usa a API do PolygonScan para obter TODO o histórico de transações de tokens ERC-20
-        e reconstrói completamente o histórico da carteira
+        Reconciliação com o histórico on-chain de transferências ERC-20 (API do PolygonScan).
+        Incremental: guarda o último bloco processado da conta (wallet_sync_cursors) e busca a partir
+        dele, inclusive: o PolygonScan indexa com atraso, e transferências do mesmo bloco podem
+        aparecer depois (as já gravadas são ignoradas pelo tx_hash). Na primeira reconciliação, ou
+        com full=True, o histórico da conta é reconstruído do bloco 0.
         """
-        import requests
-        import json
-        from datetime import datetime
-        
-        logger.info(f"[RECONCILE] Iniciando reconciliação profunda para carteira {public_address}")
+        logger.info(f"[RECONCILE] Iniciando reconciliação para carteira {public_address}")
         
         try:
-            # 1. Buscar histórico completo de transações de tokens na API do PolygonScan
-            polygonscan_api_key = "UJSDR6UFV3PB3514ACGV255GHPJU9K2PPN"  # Substituir pela chave real
-            api_url = "https://api.polygonscan.com/api"
-            
-            params = {
-                "module": "account",
-                "action": "tokentx",
-                "address": public_address,
-                "startblock": 0,
-                "endblock": 99999999,
-                "sort": "asc",
-                "apikey": polygonscan_api_key
-            }
-            
-            print(f"[RECONCILE] Chamando PolygonScan API para {public_address}")
-            response = requests.get(api_url, params=params, timeout=30)
-            
-            if response.status_code != 200:
-                raise Exception(f"Erro na API PolygonScan: {response.status_code}")
-                
-            data = response.json()
-            
-            if data.get("status") != "1":
-                raise Exception(f"PolygonScan retornou erro: {data.get('message', 'Unknown error')}")
-            
-            transactions = data.get("result", [])
-            print(f"[RECONCILE] {len(transactions)} transações encontradas no histórico on-chain")
-            
-            # 2. Iniciar transação ACID no banco de dados
             cursor = self.db.connection.cursor(dictionary=True)
-            self.db.connection.autocommit = False
             
             try:
-                # 3. Limpar histórico antigo para evitar duplicatas
-                print(f"[RECONCILE] Limpando histórico antigo da conta {account_id}")
-                cursor.execute("DELETE FROM asset_movements WHERE account_id = %s", (account_id,))
-                deleted_count = cursor.rowcount
-                print(f"[RECONCILE] {deleted_count} movimentos antigos removidos")
+                last_block = None if full else self._get_sync_cursor(cursor, account_id, 'polygonscan')
+                start_block = 0 if last_block is None else last_block
                 
-                # 4. Buscar todas as carteiras do usuário para identificar transferências internas
-                cursor.execute("""
-                    SELECT public_address 
-                    FROM accounts 
-                    WHERE user_id = %s AND type = 'CARTEIRA_CRIPTO' AND public_address IS NOT NULL
-                """, (user_id,))
-                user_wallets = set(row['public_address'].lower() for row in cursor.fetchall())
-                print(f"[RECONCILE] Carteiras do usuário: {user_wallets}")
+                # 1. Buscar apenas as transferências novas (paginado)
+                transfers = self._fetch_polygonscan_transfers(public_address, start_block)
+                logger.info(f"[RECONCILE] {len(transfers)} transferências a partir do bloco {start_block}")
                 
-                # 5. Processar cada transação do histórico on-chain
-                processed_count = 0
-                created_assets = 0
+                # 2. Primeira reconciliação: reconstruir o histórico da conta (o cursor 'logs' também é zerado)
+                if last_block is None:
+                    self._reset_account_history(cursor, account_id)
                 
-                for tx in transactions:
-                    tx_hash = tx.get("hash")
-                    from_address = tx.get("from", "").lower()
-                    to_address = tx.get("to", "").lower()
-                    contract_address = tx.get("contractAddress", "").lower()
-                    value = tx.get("value", "0")
-                    block_number = tx.get("blockNumber")
-                    gas_fee = tx.get("gasPrice", "0")  # Aproximação da taxa de gás
-                    timestamp = tx.get("timeStamp", "0")
-                    token_name = tx.get("tokenName", "")
-                    token_symbol = tx.get("tokenSymbol", "")
-                    token_decimal = int(tx.get("tokenDecimal", "18"))
-                    
-                    # Converter timestamp para datetime
-                    tx_date = datetime.fromtimestamp(int(timestamp)) if timestamp != "0" else datetime.now()
-                    
-                    # Verificar se já existe movimento com este tx_hash (dupla segurança)
-                    cursor.execute("SELECT id FROM asset_movements WHERE tx_hash = %s", (tx_hash,))
-                    if cursor.fetchone():
-                        print(f"[RECONCILE] Transação {tx_hash} já processada, pulando...")
-                        continue
-                    
-                    # Determinar tipo de movimento
-                    current_address = public_address.lower()
-                    if to_address == current_address:
-                        movement_type = "TRANSFERENCIA_ENTRADA"
-                    elif from_address == current_address:
-                        movement_type = "TRANSFERENCIA_SAIDA"
-                    else:
-                        print(f"[RECONCILE] Transação {tx_hash} não envolve esta carteira, pulando...")
-                        continue
-                    
-                    # Buscar ou criar asset baseado no contractAddress
-                    cursor.execute("SELECT id FROM assets WHERE LOWER(contract_address) = %s", (contract_address,))
-                    asset_row = cursor.fetchone()
-                    
-                    if asset_row:
-                        asset_id = asset_row['id']
-                        print(f"[RECONCILE] Asset encontrado: {asset_id} para contrato {contract_address}")
-                    else:
-                        # Auto-discovery: criar novo asset
-                        print(f"[RECONCILE] Criando novo asset para contrato {contract_address}")
-                        cursor.execute("""
-                            INSERT INTO assets (name, symbol, asset_class, contract_address, price_api_identifier)
-                            VALUES (%s, %s, 'CRIPTO', %s, %s)
-                        """, (token_name or f"Token {token_symbol}", token_symbol, contract_address, token_symbol.lower()))
-                        asset_id = cursor.lastrowid
-                        created_assets += 1
-                        print(f"[RECONCILE] Novo asset criado: ID {asset_id}")
-                    
-                    # Calcular quantidade real (considerando decimais)
-                    quantity = Decimal(value) / Decimal(10 ** token_decimal)
-                    
-                    # Inserir novo movimento com dados on-chain completos
-                    cursor.execute("""
-                        INSERT INTO asset_movements 
-                        (user_id, account_id, asset_id, movement_type, movement_date, quantity, 
-                         tx_hash, from_address, to_address, block_number, gas_fee, notes)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        user_id, account_id, asset_id, movement_type, tx_date, float(quantity),
-                        tx_hash, from_address, to_address, int(block_number) if block_number else None,
-                        float(gas_fee) if gas_fee != "0" else None,
-                        f"Reconciliação on-chain: {token_symbol} via {tx_hash[:10]}..."
-                    ))
-                    
-                    processed_count += 1
-                    if processed_count % 50 == 0:
-                        print(f"[RECONCILE] Processadas {processed_count} transações...")
+                # 3. Inserir em lotes e avançar o cursor na mesma transação
+                processed_count, created_assets = self._insert_transfer_movements(
+                    cursor, user_id, account_id, public_address, transfers
+                )
+                new_last_block = max([transfer['block_number'] for transfer in transfers], default=last_block or 0)
+                self._set_sync_cursor(cursor, account_id, 'polygonscan', new_last_block)
                 
-                # Commit da transação ACID
                 self.db.connection.commit()
-                print(f"[RECONCILE] Reconciliação concluída com sucesso!")
+                logger.info(f"[RECONCILE] Reconciliação concluída: {processed_count} movimentos até o bloco {new_last_block}")
                 
                 return {
                     "status": "success",
                     "transactions_processed": processed_count,
                     "assets_created": created_assets,
                     "wallet_address": public_address,
-                    "historical_transactions": len(transactions)
+                    "historical_transactions": len(transfers),
+                    "from_block": start_block,
+                    "last_block": new_last_block
                 }
                 
             except Exception as e:
-                # Rollback em caso de erro
+                # Rollback em caso de erro (o cursor não avança)
                 self.db.connection.rollback()
-                print(f"[RECONCILE] Erro durante processamento, fazendo rollback: {e}")
+                logger.error(f"[RECONCILE] Erro durante processamento, fazendo rollback: {e}")
                 raise e
             finally:
                 cursor.close()
-                self.db.connection.autocommit = True
                 
         except Exception as e:
             logger.error(f"Erro na reconciliação profunda: {e}")
             raise Exception(f"Falha na reconciliação on-chain: {str(e)}")
             
         finally:
-            logger.info(f"[RECONCILE] Processo de reconciliação finalizado para {public_address}")
\ No newline at end of file
+            logger.info(f"[RECONCILE] Processo de reconciliação finalizado para {public_address}")
+    
+    def index_wallet_transfers(self, user_id: int, account_id: int, public_address: str,
+                               start_block: Optional[int] = None, full: bool = False,
+                               confirmations: int = TRANSFER_SCAN_CONFIRMATIONS) -> Dict[str, Any]:
+        """
+        Reconciliação pelo próprio nó RPC: varre os eventos Transfer da carteira com eth_getLogs
+        a partir do último bloco indexado (cursor 'logs'). Cada onda de blocos é gravada e
+        commitada junto com o avanço do cursor, então uma indexação interrompida retoma de onde parou.
+        Chamada bloqueante e potencialmente longa: a API a executa fora do event loop.
+        
+        Args:
+            start_block: Bloco inicial da primeira indexação (ou de full=True); padrão TRANSFER_SCAN_START_BLOCK
+            full: Reindexa a partir de start_block; como na primeira indexação, os movimentos da conta
+                e os cursores de todas as origens são removidos antes
+        
+        Raises:
+            ValueError: Primeira indexação (ou full) sem bloco inicial definido
+        """
+        cursor = self.db.connection.cursor(dictionary=True)
+        totals = {"transfers": 0, "processed": 0, "assets_created": 0}
+        
+        try:
+            last_block = None if full else self._get_sync_cursor(cursor, account_id, 'logs')
+            if last_block is None:
+                start_block = start_block if start_block is not None else TRANSFER_SCAN_START_BLOCK
+                if start_block is None:
+                    raise ValueError("start_block é obrigatório na primeira indexação (ex: bloco de criação da carteira)")
+            if last_block is None:
+                # Primeira indexação (ou full): o histórico da conta passa a vir só dos logs, com a chave
+                # (tx_hash, log_index); movimentos de outra origem seriam duplicados
+                self._reset_account_history(cursor, account_id)
+                self.db.connection.commit()
+        except Exception:
+            self.db.connection.rollback()
+            cursor.close()
+            raise
+        
+        try:
+            from_block = start_block if last_block is None else last_block + 1
+            to_block = latest_indexable_block(self.w3, confirmations)
+            
+            asset_ids = self._load_asset_ids_by_contract(cursor)
+            catalog = self._load_crypto_assets()
+            token_metadata = {}
+            
+            def on_wave(transfers: List[Dict[str, Any]], wave_end: int) -> None:
+                unknown = {
+                    transfer["contract_address"] for transfer in transfers
+                    if transfer["contract_address"] not in token_metadata
+                    and (catalog.get(transfer["contract_address"]) or {}).get('decimals') is None
+                }
+                try:
+                    # Contratos novos da onda resolvidos juntos; o cache persistente entra no commit da onda
+                    if unknown:
+                        self.token_metadata.resolve(list(unknown), commit=False)
+                    for transfer in transfers:
+                        transfer.update(self._transfer_token_metadata(transfer["contract_address"], catalog, token_metadata))
+                    processed, created = self._insert_transfer_movements(
+                        cursor, user_id, account_id, public_address, transfers, asset_ids
+                    )
+                    self._set_sync_cursor(cursor, account_id, 'logs', wave_end)
+                    self.db.connection.commit()
+                except Exception:
+                    self.db.connection.rollback()
+                    raise
+                totals["transfers"] += len(transfers)
+                totals["processed"] += processed
+                totals["assets_created"] += created
+            
+            if from_block <= to_block:
+                logger.info(f"[INDEXER] Indexando {public_address} do bloco {from_block} ao {to_block}")
+                TransferLogScanner(self.w3).scan([public_address], from_block, to_block, on_wave)
+            
+            return {
+                "status": "success",
+                "transactions_processed": totals["processed"],
+                "assets_created": totals["assets_created"],
+                "wallet_address": public_address,
+                "historical_transactions": totals["transfers"],
+                "from_block": from_block,
+                "last_block": max(to_block, last_block if last_block is not None else to_block)
+            }
+            
+        except Exception as e:
+            logger.error(f"[INDEXER] Erro na indexação de {public_address}: {e}")
+            raise Exception(f"Falha na indexação on-chain: {str(e)}")
+        finally:
+            cursor.close()
+    
+    def _transfer_token_metadata(self, contract_address: str, catalog: Dict[str, Dict[str, Any]],
+                                 cache: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Nome, símbolo e decimais do token (catálogo de ativos ou cache de metadados), com cache."""
+        if contract_address not in cache:
+            asset = catalog.get(contract_address)
+            if not asset or asset.get('decimals') is None:
+                asset = self._get_token_info(contract_address) or asset or {}
+            cache[contract_address] = {
+                "token_name": asset.get("name") or "",
+                "token_symbol": asset.get("symbol") or "",
+                "token_decimal": int(asset.get("decimals") or 18)
+            }
+        return cache[contract_address]
+    
+    def _fetch_polygonscan_transfers(self, address: str, start_block: int) -> List[Dict[str, Any]]:
+        """
+        Transferências ERC-20 do endereço a partir de start_block, em ordem crescente de bloco.
+        Pagina de POLYGONSCAN_PAGE_SIZE em POLYGONSCAN_PAGE_SIZE; ao atingir a janela máxima da API,
+        recomeça do último bloco recebido (duplicatas do bloco de corte são descartadas).
+        """
+        transfers = []
+        seen = set()
+        page = 1
+        
+        while True:
+            params = {
+                "module": "account",
+                "action": "tokentx",
+                "address": address,
+                "startblock": start_block,
+                "endblock": 99999999,
+                "page": page,
+                "offset": POLYGONSCAN_PAGE_SIZE,
+                "sort": "asc",
+                "apikey": POLYGONSCAN_API_KEY
+            }
+            response = requests.get(POLYGONSCAN_API_URL, params=params, timeout=30)
+            if response.status_code != 200:
+                raise Exception(f"Erro na API PolygonScan: {response.status_code}")
+            
+            data = response.json()
+            results = data.get("result") or []
+            if data.get("status") != "1":
+                # status 0 sem resultados = nenhuma transferência nova
+                if data.get("message", "").startswith("No transactions found"):
+                    break
+                raise Exception(f"PolygonScan retornou erro: {data.get('message', 'Unknown error')}")
+            
+            for tx in results:
+                key = (tx.get("hash"), tx.get("logIndex"), tx.get("contractAddress", "").lower())
+                if key in seen:
+                    continue
+                seen.add(key)
+                transfers.append(self._normalize_polygonscan_transfer(tx))
+            
+            if len(results) < POLYGONSCAN_PAGE_SIZE:
+                break
+            if page * POLYGONSCAN_PAGE_SIZE >= POLYGONSCAN_RESULT_WINDOW:
+                start_block = int(results[-1]["blockNumber"])
+                page = 1
+            else:
+                page += 1
+        
+        return transfers
+    
+    @staticmethod
+    def _normalize_polygonscan_transfer(tx: Dict[str, Any]) -> Dict[str, Any]:
+        """Converte uma transferência do tokentx para o formato usado na gravação dos movimentos."""
+        timestamp = tx.get("timeStamp", "0")
+        return {
+            "tx_hash": tx.get("hash"),
+            # Nem todas as versões da API retornam logIndex; sem ele a transação é a chave do movimento
+            "log_index": int(tx["logIndex"]) if str(tx.get("logIndex", "")).isdigit() else None,
+            "from_address": tx.get("from", "").lower(),
+            "to_address": tx.get("to", "").lower(),
+            "contract_address": tx.get("contractAddress", "").lower(),
+            "value": int(tx.get("value", "0") or 0),
+            "block_number": int(tx.get("blockNumber") or 0),
+            "timestamp": int(timestamp) if timestamp and timestamp != "0" else None,
+            "gas_fee": float(tx["gasPrice"]) if tx.get("gasPrice", "0") != "0" else None,  # Aproximação da taxa de gás
+            "token_name": tx.get("tokenName", ""),
+            "token_symbol": tx.get("tokenSymbol", ""),
+            "token_decimal": int(tx.get("tokenDecimal") or 18)
+        }
+    
+    def _get_sync_cursor(self, cursor, account_id: int, source: str) -> Optional[int]:
+        """Último bloco processado da conta para a origem informada (None = nunca reconciliada)."""
+        cursor.execute("""
+            SELECT last_block FROM wallet_sync_cursors WHERE account_id = %s AND source = %s
+        """, (account_id, source))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return row['last_block'] if isinstance(row, dict) else row[0]
+    
+    def _set_sync_cursor(self, cursor, account_id: int, source: str, last_block: int) -> None:
+        cursor.execute("""
+            INSERT INTO wallet_sync_cursors (account_id, source, last_block)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE last_block = VALUES(last_block)
+        """, (account_id, source, last_block))
+    
+    def _reset_account_history(self, cursor, account_id: int) -> None:
+        """
+        Remove os movimentos da conta e os cursores de todas as origens (polygonscan e logs):
+        um cursor antigo de outra origem pularia o histórico apagado. Não faz commit.
+        """
+        cursor.execute("DELETE FROM asset_movements WHERE account_id = %s", (account_id,))
+        logger.info(f"[RECONCILE] {cursor.rowcount} movimentos antigos removidos da conta {account_id}")
+        cursor.execute("DELETE FROM wallet_sync_cursors WHERE account_id = %s", (account_id,))
+    
+    def _load_asset_ids_by_contract(self, cursor) -> Dict[str, int]:
+        """Mapa contrato (lowercase) -> asset_id, carregado uma vez por reconciliação."""
+        cursor.execute("SELECT id, contract_address FROM assets WHERE contract_address IS NOT NULL")
+        rows = cursor.fetchall()
+        if rows and not isinstance(rows[0], dict):
+            return {row[1].lower(): row[0] for row in rows}
+        return {row['contract_address'].lower(): row['id'] for row in rows}
+    
+    def _insert_transfer_movements(self, cursor, user_id: int, account_id: int, public_address: str,
+                                   transfers: List[Dict[str, Any]],
+                                   asset_ids: Optional[Dict[str, int]] = None) -> Tuple[int, int]:
+        """
+        Grava as transferências (formato normalizado) como movimentos da conta, em lotes.
+        Ativos são resolvidos por um mapa em memória (asset_ids, atualizado com os ativos criados);
+        contratos desconhecidos viram novos ativos, criados todos em um único INSERT.
+        Transferências já registradas (tx_hash, log_index) são ignoradas. Não faz commit.
+        
+        Returns:
+            (movimentos gravados, ativos criados)
+        """
+        current_address = public_address.lower()
+        if asset_ids is None:
+            asset_ids = self._load_asset_ids_by_contract(cursor)
+        processed_count = 0
+        rows = []
+        
+        # Auto-discovery: contratos ainda sem asset (primeira transferência de cada um traz os metadados)
+        new_assets = {}
+        for transfer in transfers:
+            contract_address = transfer["contract_address"]
+            if contract_address not in asset_ids and current_address in (transfer["to_address"], transfer["from_address"]):
+                new_assets.setdefault(contract_address, transfer)
+        created_assets = self._create_transfer_assets(cursor, new_assets, asset_ids) if new_assets else 0
+        
+        for transfer in transfers:
+            # Determinar tipo de movimento
+            if transfer["to_address"] == current_address:
+                movement_type = "TRANSFERENCIA_ENTRADA"
+            elif transfer["from_address"] == current_address:
+                movement_type = "TRANSFERENCIA_SAIDA"
+            else:
+                continue
+            
+            asset_id = asset_ids.get(transfer["contract_address"])
+            if asset_id is None:
+                continue
+            
+            quantity = Decimal(transfer["value"]) / (Decimal(10) ** transfer["token_decimal"])
+            tx_date = datetime.fromtimestamp(transfer["timestamp"]) if transfer["timestamp"] else datetime.now()
+            tx_hash = transfer["tx_hash"]
+            
+            rows.append((
+                user_id, account_id, asset_id, movement_type, tx_date, float(quantity),
+                tx_hash, transfer.get("log_index"), transfer["from_address"], transfer["to_address"],
+                transfer["block_number"] or None, transfer["gas_fee"], f"Reconciliação on-chain: {transfer['token_symbol']} via {tx_hash[:10]}..."
+            ))
+            
+            if len(rows) >= RECONCILE_INSERT_BATCH_SIZE:
+                processed_count += self._insert_movement_rows(cursor, rows)
+                rows = []
+        
+        if rows:
+            processed_count += self._insert_movement_rows(cursor, rows)
+        
+        return processed_count, created_assets
+    
+    def _create_transfer_assets(self, cursor, transfers_by_contract: Dict[str, Dict[str, Any]],
+                                asset_ids: Dict[str, int]) -> int:
+        """
+        Cria os assets dos contratos novos em um INSERT multi-linha e registra os IDs em asset_ids.
+        
+        Returns:
+            Quantidade de assets criados
+        """
+        rows = []
+        for contract_address, transfer in transfers_by_contract.items():
+            token_symbol = transfer["token_symbol"]
+            rows.append((transfer["token_name"] or f"Token {token_symbol}", token_symbol, contract_address,
+                         transfer["token_decimal"], token_symbol.lower() or None))
+        
+        placeholders = ", ".join(["(%s, %s, 'CRIPTO', %s, %s, %s)"] * len(rows))
+        cursor.execute(f"""
+            INSERT INTO assets (name, symbol, asset_class, contract_address, decimals, price_api_identifier)
+            VALUES {placeholders}
+        """, [value for row in rows for value in row])
+        
+        contracts = list(transfers_by_contract)
+        cursor.execute(f"""
+            SELECT id, contract_address FROM assets
+            WHERE contract_address IN ({", ".join(["%s"] * len(contracts))})
+        """, contracts)
+        for row in cursor.fetchall():
+            asset_id, contract_address = (row['id'], row['contract_address']) if isinstance(row, dict) else row
+            asset_ids[contract_address.lower()] = asset_id
+        
+        logger.info(f"[RECONCILE] {len(rows)} novos assets criados: {', '.join(contracts[:10])}")
+        return len(rows)
+    
+    def _insert_movement_rows(self, cursor, rows: List[tuple]) -> int:
+        """
+        INSERT multi-linha de movimentos on-chain; movimento já existente é mantido como está.
+        A chave é (tx_hash, log_index): cada evento Transfer de uma transação (swap, transferência
+        de vários tokens) vira um movimento; sem log_index, um movimento por transação.
+        """
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(rows))
+        cursor.execute(f"""
+            INSERT INTO asset_movements 
+            (user_id, account_id, asset_id, movement_type, movement_date, quantity, 
+             tx_hash, log_index, from_address, to_address, block_number, gas_fee, notes)
+            VALUES {placeholders}
+            ON DUPLICATE KEY UPDATE id = id
+        """, [value for row in rows for value in row])
+        return len(rows)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Worker de Sincronização de Carteiras
+Script projetado para ser executado periodicamente (ex: via cron job, uma vez por noite)
+Sincroniza os saldos on-chain de todas as contas CARTEIRA_CRIPTO em uma única passada
+
+Uso:
+    python wallet_sync_worker.py
+    python wallet_sync_worker.py --user-id 3 --rpc-concurrency 8
+"""
+
+import sys
+import os
+import asyncio
+import logging
+import argparse
+
+# Adicionar o diretório backend ao Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.database_service import DatabaseService
+from services.wallet_sync_service import WalletSyncService, WALLET_SYNC_RPC_CONCURRENCY
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('/tmp/wallet_sync_worker.log'),
+        logging.StreamHandler()
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """
+    Função principal do worker
+    """
+    parser = argparse.ArgumentParser(description="Sincronização em massa das carteiras cripto")
+    parser.add_argument('--user-id', type=int, help="Sincroniza apenas as carteiras deste usuário")
+    parser.add_argument('--rpc-concurrency', type=int, default=WALLET_SYNC_RPC_CONCURRENCY)
+    args = parser.parse_args()
+
+    try:
+        service = WalletSyncService(DatabaseService())
+        result = asyncio.run(service.sync_all_wallets(args.user_id, args.rpc_concurrency))
+
+        for error in result['errors']:
+            logger.error(error)
+        logger.info(f"{result['wallets_synced']} carteiras e {result['tokens_synced']} tokens sincronizados")
+        return 0 if result['success'] else 1
+    except Exception as e:
+        logger.error(f"Erro crítico na sincronização: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    exit_code = main()
+    sys.exit(exit_code)
@@ -1,60 +1,131 @@
 import time
+from concurrent.futures import ThreadPoolExecutor
 from web3 import Web3
 import os
 from services.database_service import DatabaseService
 from services.blockchain_service import BlockchainService
 from services.transaction_executor import TransactionExecutor
+from services.block_scheduler import BlockWatcher, RegistryCache
+from services.multicall_service import MulticallService
+
+# Intervalo mínimo entre swaps da mesma carteira (o ciclo agora roda a cada bloco)
+WORKER_TRADE_INTERVAL_SECONDS = int(os.getenv("WORKER_TRADE_INTERVAL_SECONDS", 15))
+# Swaps executados ao mesmo tempo (carteiras diferentes)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 8))
 
 def main():
     print("Iniciando o Worker do Bot de Trade... MODO DE EXECUÇÃO ATIVO.")
     db_service = DatabaseService()
     blockchain_service = BlockchainService()
+    # Saldos de MATIC de todas as carteiras em uma leitura agrupada
+    multicall = MulticallService(blockchain_service.w3)
+    pool = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix='worker')
 
     # Endereços para Polygon Mainnet
     WMATIC_ADDRESS = "0x0d500B1d8E8eF31E21C99d1Db9A6444d3ADf1270"  # WMATIC na Mainnet
     USDC_ADDRESS = "0x2791Bca1f2de4661ED88A30C99A7a9449Aa84174"   # USDC.e na Mainnet
 
+    # carteira -> saldo (wei) da última avaliação que decidiu AGUARDAR; saldo igual não é reavaliado
+    idle_balances = {}
+    last_trade_at = {}
+    # carteira -> TransactionExecutor (None = somente leitura); a chave é descriptografada uma vez
+    executors = {}
+    # carteira -> swap em andamento no pool
+    in_flight = {}
+
+    def on_wallets_changed(previous, current):
+        current_wallets = {wallet['id']: wallet for wallet in current}
+        for wallet in previous:
+            # Carteira removida ou com endereço alterado: descarta o estado acumulado
+            if current_wallets.get(wallet['id']) != wallet:
+                idle_balances.pop(wallet['id'], None)
+                last_trade_at.pop(wallet['id'], None)
+        # A chave privada não vem no registro (só no fingerprint): executores são recriados a cada mudança
+        executors.clear()
+        if not current:
+            print("Nenhuma carteira encontrada para gerenciar. Adicione uma via API POST /wallets.")
+        else:
+            print(f"Registro de carteiras atualizado: {len(current)} carteiras")
+
+    def get_executor(wallet):
+        # Acesso ao banco apenas na thread principal (a conexão não é compartilhável entre threads)
+        if wallet['id'] not in executors:
+            private_key = db_service.get_decrypted_private_key(wallet['id'])
+            executors[wallet['id']] = TransactionExecutor(
+                w3=blockchain_service.w3,
+                public_address=wallet['public_address'],
+                private_key=private_key
+            ) if private_key else None
+        return executors[wallet['id']]
+
+    def run_swap(wallet_id, executor):
+        amount_to_swap_wei = Web3.to_wei(0.05, 'ether')
+        result = executor.execute_swap(WMATIC_ADDRESS, USDC_ADDRESS, amount_to_swap_wei)
+        print(f"  [Carteira {wallet_id}] Resultado da execução: {result}")
+        return result
+
+    # Ciclos disparados por bloco novo; carteiras em cache, recarregadas só quando a tabela muda
+    block_watcher = BlockWatcher(blockchain_service.w3)
+    wallet_registry = RegistryCache(
+        db_service.get_all_wallets,
+        lambda: db_service.get_table_fingerprint('wallets', ('public_address', 'private_key_encrypted')),
+        on_change=on_wallets_changed
+    )
+
     while True:
         try:
-            print("\n--- Novo ciclo de verificação ---")
-            wallets = db_service.get_all_wallets()
+            block_number = block_watcher.wait_for_new_block()
+            wallets = wallet_registry.get()
+
+            # Swaps concluídos liberam a carteira para nova avaliação
+            for wallet_id, future in list(in_flight.items()):
+                if future.done():
+                    del in_flight[wallet_id]
+                    if future.exception():
+                        print(f"  [Carteira {wallet_id}] ERRO no swap: {future.exception()}")
 
-            if not wallets:
-                print("Nenhuma carteira encontrada para gerenciar. Adicione uma via API POST /wallets.")
+            # Carteiras com swap em andamento ficam fora da leitura
+            pending_wallets = [wallet for wallet in wallets if wallet['id'] not in in_flight]
+            balances = multicall.native_balances(
+                [wallet['public_address'] for wallet in pending_wallets], block_number
+            )
 
-            for wallet in wallets:
-                print(f"Analisando carteira: {wallet['name']} (ID: {wallet['id']})")
+            for wallet in pending_wallets:
+                wallet_name = wallet.get('name') or wallet['public_address']
 
-                balance_data = blockchain_service.get_matic_balance(wallet['public_address'])
-                current_balance = float(balance_data.get('balance_matic', 0))
+                balance_wei = balances.get(wallet['public_address'])
+                # Leitura falhou, ou nada mudou desde a última decisão de aguardar
+                if balance_wei is None or idle_balances.get(wallet['id']) == balance_wei:
+                    continue
+
+                current_balance = float(Web3.from_wei(balance_wei, 'ether'))
+                print(f"\n--- Bloco {block_number}: analisando carteira {wallet_name} (ID: {wallet['id']}) ---")
                 print(f"  Saldo atual: {current_balance:.4f} MATIC")
 
                 if current_balance > 0.1:
-                    print(f"  --> Decisão: VENDER 0.05 MATIC por USDC")
-
-                    private_key = db_service.get_decrypted_private_key(wallet['id'])
-                    if not private_key:
-                        print(f"  --> Carteira '{wallet['name']}' é somente leitura. Ignorando trade.")
+                    if time.time() - last_trade_at.get(wallet['id'], 0) < WORKER_TRADE_INTERVAL_SECONDS:
                         continue
 
-                    executor = TransactionExecutor(
-                        w3=blockchain_service.w3,
-                        public_address=wallet['public_address'],
-                        private_key=private_key
-                    )
+                    print(f"  --> Decisão: VENDER 0.05 MATIC por USDC")
+                    idle_balances.pop(wallet['id'], None)
 
-                    amount_to_swap_wei = Web3.to_wei(0.05, 'ether')
+                    executor = get_executor(wallet)
+                    if not executor:
+                        print(f"  --> Carteira '{wallet_name}' é somente leitura. Ignorando trade.")
+                        idle_balances[wallet['id']] = balance_wei
+                        continue
 
-                    result = executor.execute_swap(WMATIC_ADDRESS, USDC_ADDRESS, amount_to_swap_wei)
-                    print(f"  Resultado da execução: {result}")
+                    # O swap (envio e confirmação) roda no pool; o loop segue para as demais carteiras
+                    last_trade_at[wallet['id']] = time.time()
+                    in_flight[wallet['id']] = pool.submit(run_swap, wallet['id'], executor)
                 else:
                     print("  --> Decisão: AGUARDAR (saldo de MATIC baixo).")
+                    idle_balances[wallet['id']] = balance_wei
 
         except Exception as e:
             print(f"Ocorreu um erro CRÍTICO no ciclo do worker: {e}")
-
-        print("Aguardando 15 segundos para o próximo ciclo...")
-        time.sleep(15)
+            print("Aguardando 15 segundos para o próximo ciclo...")
+            time.sleep(15)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
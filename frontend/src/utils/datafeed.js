@@ -1,6 +1,47 @@
 // src/utils/datafeed.js
 
 const API_URL = 'http://localhost:8000/datafeed';
+const STREAM_URL = API_URL.replace(/^http/, 'ws') + '/stream';
+const RECONNECT_DELAY_MS = 5000;
+
+// Um único WebSocket compartilhado por todas as assinaturas de barras em tempo real
+let socket = null;
+const subscriptions = new Map(); // subscriberUID -> { symbol, resolution, onRealtimeCallback }
+
+const sendSubscription = (action, { symbol, resolution }) => {
+  if (socket && socket.readyState === WebSocket.OPEN) {
+    socket.send(JSON.stringify({ action, symbol, resolution }));
+  }
+};
+
+const ensureSocket = () => {
+  if (socket) return;
+  socket = new WebSocket(STREAM_URL);
+
+  socket.onopen = () => {
+    // (Re)envia todas as assinaturas ativas, inclusive após reconexão
+    subscriptions.forEach((subscription) => sendSubscription('subscribe', subscription));
+  };
+
+  socket.onmessage = (event) => {
+    const message = JSON.parse(event.data);
+    if (message.error) {
+      console.error('[Datafeed] Erro no streaming:', message.error);
+      return;
+    }
+    const bar = { ...message.bar, time: message.bar.time * 1000 };
+    subscriptions.forEach((subscription) => {
+      if (subscription.symbol === message.symbol && subscription.resolution === message.resolution) {
+        subscription.onRealtimeCallback(bar);
+      }
+    });
+  };
+
+  socket.onclose = () => {
+    socket = null;
+    if (subscriptions.size > 0) setTimeout(ensureSocket, RECONNECT_DELAY_MS);
+  };
+};
 
 // Mapeia a resolução do TradingView para a do nosso backend
 const mapResolution = (resolution) => {
@@ -49,7 +90,7 @@ export const Datafeed = {
   },
 
   getBars: (symbolInfo, resolution, periodParams, onHistoryCallback, onErrorCallback) => {
-    const { from, to, firstDataRequest } = periodParams;
+    const { from, to, countBack, firstDataRequest } = periodParams;
     const mappedResolution = mapResolution(resolution);
     
     console.log(`[Datafeed] getBars: ${symbolInfo.name}, ${mappedResolution}, de ${from} para ${to}`);
@@ -59,6 +100,7 @@ export const Datafeed = {
     url.searchParams.append('resolution', mappedResolution);
     url.searchParams.append('from', from);
     url.searchParams.append('to', to);
+    if (countBack) url.searchParams.append('countback', countBack);
 
     fetch(url.toString())
       .then((res) => res.json())
@@ -94,12 +136,28 @@ export const Datafeed = {
   },
 
   subscribeBars: (symbolInfo, resolution, onRealtimeCallback, subscriberUID, onResetCacheNeededCallback) => {
-    // O backend de exemplo não suporta tempo real (streaming), então não fazemos nada aqui.
-    console.log('[Datafeed] subscribeBars: Inscrição não suportada pelo backend de exemplo.');
+    const subscription = {
+      symbol: symbolInfo.ticker || symbolInfo.name,
+      resolution: mapResolution(resolution),
+      onRealtimeCallback,
+    };
+    console.log('[Datafeed] subscribeBars:', subscriberUID, subscription.symbol, subscription.resolution);
+    subscriptions.set(subscriberUID, subscription);
+    ensureSocket();
+    sendSubscription('subscribe', subscription);
   },
 
   unsubscribeBars: (subscriberUID) => {
-    // O backend de exemplo não suporta tempo real (streaming), então não fazemos nada aqui.
-    console.log('[Datafeed] unsubscribeBars');
+    const subscription = subscriptions.get(subscriberUID);
+    if (!subscription) return;
+    console.log('[Datafeed] unsubscribeBars:', subscriberUID);
+    subscriptions.delete(subscriberUID);
+
+    // Só cancela no servidor quando nenhum outro gráfico usa o mesmo símbolo/resolução
+    const stillUsed = [...subscriptions.values()].some(
+      (other) => other.symbol === subscription.symbol && other.resolution === subscription.resolution
+    );
+    if (!stillUsed) sendSubscription('unsubscribe', subscription);
+    if (subscriptions.size === 0 && socket) socket.close();
   },
 };
\ No newline at end of file